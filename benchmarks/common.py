@@ -0,0 +1,49 @@
+# Shared helpers for the benchmark scripts
+import random
+import time
+
+
+def friend_prefs(rng, n_players=10):
+    # same shape as FriendMatcher.read_response: one normalised row of
+    # preferences per player, with a zero for the player themselves
+    prefs = []
+    for player in range(n_players):
+        row = [rng.randint(0, 10) if i != player else 0
+               for i in range(n_players)]
+        prefs.append([x / max(1e-5, sum(row)) for x in row])
+    return prefs
+
+
+def role_prefs(rng):
+    # same shape as RoleMatcher.read_response: skill 0-9 for each role
+    return [[rng.randint(0, 9) for _ in range(5)] for _ in range(10)]
+
+
+def rolev2_prefs(rng):
+    # same shape as RoleMatcherV2.read_response: role skills followed by
+    # worse/unsure/better (0/1/2) ratings of the 9 other players
+    return [[rng.randint(0, 9) for _ in range(5)] +
+            [rng.randint(0, 2) for _ in range(9)] for _ in range(10)]
+
+
+def seeded(seed):
+    return random.Random(seed)
+
+
+def timeit(fn, *args, repeat=1):
+    # returns the seconds taken by each call and the last result
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
@@ -0,0 +1,49 @@
+# Compares the python and numpy engines of FriendMatcher
+#
+#   python -m benchmarks.friendmatcher [n_lobbies]
+import sys
+from math import log
+
+from mmserver.apps.mmv1.teammaker import FriendMatcher
+
+from .common import friend_prefs, percentile, seeded, timeit
+
+
+def objective(matcher, prefs, teams):
+    # noise-free value of the strategy for a split
+    happiness = [sum(prefs[p][q] for p in team for q in team)
+                 for team in teams]
+    if matcher.strategy == 'fair':
+        return sum(log(max(h, matcher.epsilon)) for h in happiness)
+    return sum(happiness)
+
+
+def main(n_lobbies=200):
+    rng = seeded(0)
+    lobbies = [friend_prefs(rng) for _ in range(n_lobbies)]
+    for strategy in ('fair', 'utilitarian'):
+        results = {}
+        for engine in ('python', 'numpy'):
+            matcher = FriendMatcher(strategy=strategy, engine=engine)
+            times = []
+            scores = []
+            for prefs in lobbies:
+                (t,), (teams, _) = timeit(matcher.generate_teams, prefs)
+                times.append(t)
+                scores.append(objective(matcher, prefs, teams))
+            results[engine] = times, scores
+        # both engines add up to 0.01 of random noise to break ties, so
+        # numpy may only lose to the loop by that much
+        worse = sum(b < a - 0.01
+                    for a, b in zip(results['python'][1],
+                                    results['numpy'][1]))
+        py_p50 = percentile(results['python'][0], 50)
+        np_p50 = percentile(results['numpy'][0], 50)
+        print(f'{strategy:12} python p50 {py_p50 * 1e3:8.3f} ms  '
+              f'numpy p50 {np_p50 * 1e3:8.3f} ms  '
+              f'speedup {py_p50 / np_p50:6.1f}x  '
+              f'numpy worse {worse}/{n_lobbies}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+# Checks the branch and bound engine of FriendMatcher against exhaustive
+# search where that is still feasible, and times it on bigger lobbies
+#
+#   python -m benchmarks.friendmatcher_bnb [n_lobbies]
+import sys
+
+import numpy as np
+
+from mmserver.apps.mmv1.teammaker import FriendMatcher
+from mmserver.apps.mmv1.teammaker.friendmatcher import team_splits
+
+from .common import friend_prefs, percentile, seeded, timeit
+from .friendmatcher import objective
+
+EXHAUSTIVE_SIZES = (10, 12, 14, 16)
+SIZES = EXHAUSTIVE_SIZES + (18, 20, 22, 24)
+
+
+def exhaustive_optimum(matcher, prefs):
+    # noise-free optimum over every split
+    prefs = np.asarray(prefs, dtype=float)
+    m1 = team_splits(len(prefs)).astype(float)
+    m2 = 1 - m1
+    happiness_1 = ((m1 @ prefs) * m1).sum(axis=1)
+    happiness_2 = ((m2 @ prefs) * m2).sum(axis=1)
+    if matcher.strategy == 'fair':
+        return float(np.max(np.log(np.maximum(happiness_1, matcher.epsilon)) +
+                            np.log(np.maximum(happiness_2, matcher.epsilon))))
+    return float(np.max(happiness_1 + happiness_2))
+
+
+def main(n_lobbies=10):
+    rng = seeded(0)
+    for strategy in ('fair', 'utilitarian'):
+        matcher = FriendMatcher(strategy=strategy, engine='bnb')
+        for n_players in SIZES:
+            times = []
+            nodes = []
+            mismatches = 0
+            for _ in range(n_lobbies):
+                prefs = friend_prefs(rng, n_players)
+                (t,), (teams, _) = timeit(matcher.generate_teams, prefs)
+                times.append(t)
+                nodes.append(matcher.nodes_explored)
+                if n_players in EXHAUSTIVE_SIZES:
+                    optimum = exhaustive_optimum(matcher, prefs)
+                    mismatches += abs(objective(matcher, prefs, teams) -
+                                      optimum) > 1e-9
+            checked = (f'mismatches {mismatches}/{n_lobbies}'
+                       if n_players in EXHAUSTIVE_SIZES else '')
+            print(f'{strategy:12} {n_players:3} players  '
+                  f'p50 {percentile(times, 50) * 1e3:8.2f} ms  '
+                  f'max {max(times) * 1e3:8.2f} ms  '
+                  f'nodes p50 {percentile(nodes, 50):7}  {checked}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,49 @@
+# Compares the scores reached by the greedy and annealing searches of the
+# role matchers against the exhaustive optimum: a single greedy descent,
+# greedy descents restarted until the CPU budget is used, and annealing
+# with the same budget
+#
+#   python -m benchmarks.rolematcher_anneal [n_lobbies] [budget_ms]
+import random
+import sys
+import time
+
+from mmserver.apps.mmv1.teammaker import RoleMatcher, RoleMatcherV2
+from mmserver.apps.mmv1.teammaker.rolematcher import run_restarts
+
+from .common import percentile, role_prefs, rolev2_prefs, seeded
+
+
+def main(n_lobbies=20, budget_ms=50):
+    rng = seeded(0)
+    budget = budget_ms / 1000
+    for matcher_cls, make_prefs in ((RoleMatcher, role_prefs),
+                                    (RoleMatcherV2, rolev2_prefs)):
+        greedy = matcher_cls(search='greedy')
+        anneal = matcher_cls(search='anneal', iterations=10 ** 9,
+                             deadline=budget)
+        exact = matcher_cls(search='exact')
+        gaps = {'greedy': [], 'restarts': [], 'anneal': []}
+        for _ in range(n_lobbies):
+            prefs = exact.prepare_prefs(make_prefs(rng))
+            _, optimum = exact.exhaustive_search(prefs)
+            _, greedy_score = greedy.greedy_search(prefs)
+            # greedy descents from new random starts until the budget
+            # is used up
+            _, restarts_score, _ = run_restarts(greedy, prefs, 10 ** 9,
+                                                time.time() + budget,
+                                                random.getrandbits(64))
+            _, anneal_score = anneal.anneal_search(prefs)
+            gaps['greedy'].append(optimum - greedy_score)
+            gaps['restarts'].append(optimum - restarts_score)
+            gaps['anneal'].append(optimum - anneal_score)
+        for search, values in gaps.items():
+            print(f'{matcher_cls.NAME:8} {search:8} {budget_ms} ms  gap to '
+                  f'optimum mean {sum(values) / len(values):6.3f}  '
+                  f'p50 {percentile(values, 50):6.3f}  '
+                  f'p90 {percentile(values, 90):6.3f}  '
+                  f'optimal {sum(g < 1e-9 for g in values)}/{n_lobbies}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
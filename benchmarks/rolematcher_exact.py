@@ -0,0 +1,35 @@
+# Times the exhaustive search of the role matchers and measures how far
+# the greedy search falls short of it
+#
+#   python -m benchmarks.rolematcher_exact [n_lobbies]
+import sys
+
+from mmserver.apps.mmv1.teammaker import RoleMatcher, RoleMatcherV2
+
+from .common import percentile, role_prefs, rolev2_prefs, seeded, timeit
+
+
+def main(n_lobbies=10):
+    rng = seeded(0)
+    for matcher_cls, make_prefs in ((RoleMatcher, role_prefs),
+                                    (RoleMatcherV2, rolev2_prefs)):
+        exact = matcher_cls(search='exact')
+        greedy = matcher_cls(search='greedy')
+        times = []
+        gaps = []
+        for _ in range(n_lobbies):
+            prefs = exact.prepare_prefs(make_prefs(rng))
+            (t,), (_, best_score) = timeit(exact.exhaustive_search, prefs)
+            _, greedy_score = greedy.greedy_search(prefs)
+            times.append(t)
+            gaps.append(best_score - greedy_score)
+        print(f'{matcher_cls.NAME:8} '
+              f'exact p50 {percentile(times, 50):6.2f} s  '
+              f'max {max(times):6.2f} s  '
+              f'greedy gap p50 {percentile(gaps, 50):6.3f}  '
+              f'max {max(gaps):6.3f}  '
+              f'optimal {sum(g < 1e-9 for g in gaps)}/{n_lobbies}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
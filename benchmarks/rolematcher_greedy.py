@@ -0,0 +1,41 @@
+# Times the greedy search of the role matchers for growing search budgets
+#
+#   python -m benchmarks.rolematcher_greedy [n_lobbies]
+import random
+import sys
+
+from mmserver.apps.mmv1.teammaker import RoleMatcher, RoleMatcherV2
+
+from .common import percentile, role_prefs, rolev2_prefs, seeded, timeit
+
+BUDGETS = (10, 50, 500, 5000)
+
+
+def main(n_lobbies=20):
+    rng = seeded(0)
+    for matcher_cls, make_prefs in ((RoleMatcher, role_prefs),
+                                    (RoleMatcherV2, rolev2_prefs)):
+        lobbies = [make_prefs(rng) for _ in range(n_lobbies)]
+        for max_search in BUDGETS:
+            matcher = matcher_cls(max_search=max_search)
+            times = []
+            scores = []
+            hits = misses = 0
+            for seed, prefs in enumerate(lobbies):
+                # same random starts for every budget
+                random.seed(seed)
+                prefs = matcher.prepare_prefs(prefs)
+                (t,), (_, score) = timeit(matcher.greedy_search, prefs)
+                times.append(t)
+                scores.append(score)
+                hits += matcher.transpositions.hits
+                misses += matcher.transpositions.misses
+            print(f'{matcher_cls.NAME:8} max_search {max_search:5}  '
+                  f'p50 {percentile(times, 50) * 1e3:8.2f} ms  '
+                  f'p99 {percentile(times, 99) * 1e3:8.2f} ms  '
+                  f'mean score {sum(scores) / len(scores):7.3f}  '
+                  f'repeats {hits / max(1, hits + misses):6.1%}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
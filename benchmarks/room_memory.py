@@ -0,0 +1,75 @@
+# Memory taken by rooms kept as the dicts of the json dumps against the
+# Room and MMRoom objects the in-memory databases keep
+#
+#   python -m benchmarks.room_memory [n_rooms]
+import base64
+import json
+import sys
+import tracemalloc
+
+from mmserver.apps.draftv1.models import Room
+from mmserver.apps.mmv1.models import MMRoom
+
+from .common import rolev2_prefs, seeded
+
+# distinct rooms to make, the rest repeat them
+SAMPLES = 1000
+
+
+def draft_room(rng):
+    # a room halfway through drafting
+    order = [f'guest{rng.randrange(10 ** 6)}' for _ in range(10)]
+    guests = {name: {'owner': i == 0, 'coins': rng.randint(0, 100),
+                     'captain': i + 1 if i < 2 else 0,
+                     'secret': base64.b64encode(
+                         rng.getrandbits(256).to_bytes(32, 'big')).decode()}
+              for i, name in enumerate(order)}
+    intents = [[[rng.randint(0, 30), rng.randint(0, 1)] for _ in range(2)]
+               for _ in range(4)]
+    intents += [[[None, None], [None, None]] for _ in range(4)]
+    return {'order': order, 'guests': guests, 'captains': order[:2],
+            'stage': 5, 'teams': [order[:1] + order[2:4],
+                                  order[1:2] + order[4:6]],
+            'intents': intents, 'updated': 1.6e9 + rng.random(),
+            'draft_order': order[2:]}
+
+
+def mm_room(rng):
+    players = [f'player{rng.randrange(10 ** 6)}' for _ in range(10)]
+    response_ids = [''.join(rng.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=7))
+                    for _ in players]
+    return {'mode': 'rolev2', 'players': players,
+            'player_info': dict(zip(players, rolev2_prefs(rng))),
+            'response_ids': dict(zip(response_ids, players)),
+            'updated': 1.6e9 + rng.random()}
+
+
+def measure(dumps, load, n_rooms):
+    # bytes held by n_rooms rooms read from the dumps with load
+    tracemalloc.start()
+    rooms = [load(json.loads(dumps[i % len(dumps)]))
+             for i in range(n_rooms)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rooms
+    return size
+
+
+def main(n_rooms=100000):
+    rng = seeded(0)
+    for name, make, model in (('draftv1', draft_room, Room),
+                              ('mmv1', mm_room, MMRoom)):
+        dumps = [json.dumps(make(rng)) for _ in range(SAMPLES)]
+        # both kinds of room must give back the same dumps
+        assert all(model.from_dict(json.loads(d)).to_dict() == json.loads(d)
+                   for d in dumps)
+        as_dicts = measure(dumps, lambda room: room, n_rooms)
+        as_models = measure(dumps, model.from_dict, n_rooms)
+        print(f'{name:8} {n_rooms} rooms  '
+              f'dicts {as_dicts / 2 ** 20:8.1f} MiB  '
+              f'{model.__name__} {as_models / 2 ** 20:8.1f} MiB  '
+              f'saved {1 - as_models / as_dicts:6.1%}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,163 @@
+# Latency and quality benchmark of every matcher, strategy and search
+#
+#   python -m benchmarks.suite run [-n N_LOBBIES] [-o results.json]
+#   python -m benchmarks.suite compare old.json new.json
+#
+# every configuration generates teams for the same seeded synthetic
+# lobbies and reports p50/p99 latency of generate_teams, and the gap
+# between the score of its teams and the exhaustive optimum
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from mmserver.apps.mmv1.teammaker import (FriendMatcher, RoleMatcher,
+                                          RoleMatcherV2)
+
+from .common import (friend_prefs, percentile, role_prefs, rolev2_prefs,
+                     seeded, timeit)
+from .friendmatcher import objective
+from .friendmatcher_bnb import exhaustive_optimum
+
+FRIEND_CONFIGS = [{'strategy': strategy, 'engine': engine}
+                  for strategy in ('fair', 'utilitarian')
+                  for engine in ('python', 'numpy', 'bnb')]
+# exact goes first as its scores are the optimum the others are held to
+ROLE_CONFIGS = [{'strategy': 'fair', 'search': search}
+                for search in ('exact', 'greedy', 'multistart', 'anneal')]
+# a gap this much bigger, or latency this many times slower, than the
+# baseline run counts as a regression
+GAP_TOLERANCE = 0.05
+LATENCY_TOLERANCE = 1.5
+
+
+def summarise(matcher_cls, config, times, gaps):
+    return {
+        'matcher': matcher_cls.NAME,
+        'config': config,
+        'p50_ms': percentile(times, 50) * 1e3,
+        'p99_ms': percentile(times, 99) * 1e3,
+        'mean_gap': sum(gaps) / len(gaps),
+        'max_gap': max(gaps),
+        'optimal_rate': sum(g < 1e-9 for g in gaps) / len(gaps)
+    }
+
+
+def bench_friend(n_lobbies, seed):
+    rng = seeded(seed)
+    lobbies = [friend_prefs(rng) for _ in range(n_lobbies)]
+    results = []
+    for config in FRIEND_CONFIGS:
+        matcher = FriendMatcher(**config)
+        times = []
+        gaps = []
+        for prefs in lobbies:
+            (t,), (teams, _) = timeit(matcher.generate_teams, prefs)
+            times.append(t)
+            gaps.append(exhaustive_optimum(matcher, prefs) -
+                        objective(matcher, prefs, teams))
+        results.append(summarise(FriendMatcher, config, times, gaps))
+    return results
+
+
+def bench_role(matcher_cls, make_prefs, n_lobbies, seed):
+    rng = seeded(seed)
+    lobbies = [make_prefs(rng) for _ in range(n_lobbies)]
+    optima = []
+    results = []
+    for config in ROLE_CONFIGS:
+        matcher = matcher_cls(**config)
+        strategy_fn = {
+            'fair': matcher.fair_logsum_strategy
+        }[matcher.strategy]
+        times = []
+        gaps = []
+        for i, prefs in enumerate(lobbies):
+            (t,), (teams, _) = timeit(matcher.generate_teams, prefs)
+            score = matcher.score_teams(teams[0], teams[1],
+                                        matcher.prepare_prefs(prefs),
+                                        strategy_fn)
+            if config['search'] == 'exact':
+                optima.append(score)
+            times.append(t)
+            gaps.append(optima[i] - score)
+        results.append(summarise(matcher_cls, config, times, gaps))
+    return results
+
+
+def run(n_lobbies=20, seed=0):
+    # the greedy searches start from random splits
+    random.seed(seed)
+    np.random.seed(seed)
+    results = bench_friend(n_lobbies, seed)
+    results += bench_role(RoleMatcher, role_prefs, n_lobbies, seed)
+    results += bench_role(RoleMatcherV2, rolev2_prefs, n_lobbies, seed)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'n_lobbies': n_lobbies,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def compare(baseline, current):
+    # returns a line for every configuration that got slower or worse
+    old = {(r['matcher'], json.dumps(r['config'], sort_keys=True)): r
+           for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['matcher'], json.dumps(result['config'],
+                                             sort_keys=True))
+        if key not in old:
+            continue
+        before = old[key]
+        name = f'{key[0]} {key[1]}'
+        if result['mean_gap'] > before['mean_gap'] + GAP_TOLERANCE:
+            regressions.append(f'{name}: mean gap {before["mean_gap"]:.3f} '
+                               f'-> {result["mean_gap"]:.3f}')
+        if result['p50_ms'] > before['p50_ms'] * LATENCY_TOLERANCE:
+            regressions.append(f'{name}: p50 {before["p50_ms"]:.2f} ms '
+                               f'-> {result["p50_ms"]:.2f} ms')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('-n', '--n-lobbies', type=int, default=20)
+    run_parser.add_argument('-s', '--seed', type=int, default=0)
+    run_parser.add_argument('-o', '--output', default='-')
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        report = run(args.n_lobbies, args.seed)
+        for r in report['results']:
+            print(f'{r["matcher"]:8} {json.dumps(r["config"]):50} '
+                  f'p50 {r["p50_ms"]:9.2f} ms  p99 {r["p99_ms"]:9.2f} ms  '
+                  f'mean gap {r["mean_gap"]:6.3f}  '
+                  f'optimal {r["optimal_rate"]:6.1%}', file=sys.stderr)
+        out = sys.stdout if args.output == '-' else open(args.output, 'w')
+        with out:
+            json.dump(report, out, indent=4)
+        return 0
+    regressions = compare(json.load(open(args.baseline)),
+                          json.load(open(args.current)))
+    for line in regressions:
+        print(line)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# rooms that are finished, or that nobody touched for a while, are taken
+# out of the database and appended to a gzipped file of json lines, which
+# can be searched with
+#
+#   python -m mmserver.apps.archive archive.jsonl.gz --room ROOM_ID
+import argparse
+import gzip
+import json
+import time
+import zlib
+
+from . import socketio
+
+
+class Archive:
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def append(self, rooms, now=None):
+        # every write is a gzip member of its own, which gzip reads back
+        # as one stream
+        if not rooms:
+            return
+        now = time.time() if now is None else now
+        with gzip.open(self.fname, 'at') as f:
+            for room_id, room in rooms.items():
+                f.write(json.dumps({'room_id': room_id, 'archived': now,
+                                    'room': room}) + '\n')
+
+    def query(self, room_id=None, since=None, until=None):
+        # yields the records of the rooms archived between since and until,
+        # oldest first
+        try:
+            with gzip.open(self.fname, 'rt') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if room_id is not None and record['room_id'] != room_id:
+                        continue
+                    if since is not None and record['archived'] < since:
+                        continue
+                    if until is not None and record['archived'] >= until:
+                        continue
+                    yield record
+        except FileNotFoundError:
+            return
+        except (EOFError, zlib.error, ValueError):
+            # the last write was cut off by a crash
+            return
+
+
+class Sweeper:
+    # every interval seconds moves the rooms that have been idle for
+    # idle_ttl seconds, or finished for finished_ttl, from db to archive
+    # a ttl of 0 keeps those rooms
+
+    def __init__(self, db, archive, idle_ttl, finished_ttl, interval=600):
+        self.db = db
+        self.archive = archive
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.interval = interval
+        self.started = False
+
+    def sweep(self, now=None):
+        # returns how many rooms were archived
+        now = time.time() if now is None else now
+        expired = self.db.expired_rooms(self.idle_ttl, self.finished_ttl,
+                                        now)
+        rooms = self.db.evict_rooms(expired)
+        self.archive.append(rooms, now=now)
+        return len(rooms)
+
+    def run(self):
+        while True:
+            socketio.sleep(self.interval)
+            self.sweep()
+
+    def start(self):
+        if not self.started and (self.idle_ttl or self.finished_ttl):
+            self.started = True
+            socketio.start_background_task(self.run)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mmserver.apps.archive',
+        description='Print archived rooms as json lines.')
+    parser.add_argument('archive', help='archive to search')
+    parser.add_argument('--room', help='only the room with this id')
+    parser.add_argument('--since', type=float,
+                        help='only rooms archived at this unix time or later')
+    parser.add_argument('--until', type=float,
+                        help='only rooms archived before this unix time')
+    args = parser.parse_args(argv)
+    for record in Archive(args.archive).query(args.room, args.since,
+                                              args.until):
+        print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,20 @@ import json
 import json.decoder
 import os
 import random
+import sqlite3
 import string
+import time
 from base64 import b64encode
-from copy import deepcopy
+from contextlib import contextmanager
+
+from ..frozen import FrozenDict, freeze
+from ..writer import GroupWriter
+from .models import Guest, Room
+
+try:
+    import redis
+except ImportError:
+    redis = None
 
 CHARSET = string.ascii_uppercase + string.digits
 
@@ -53,27 +64,118 @@ class DraftDB:
     def make_captain(self, secret):
         pass
 
+    def stats(self):
+        # counters about the storage, for the admin pages
+        return {}
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        # ids of the rooms unchanged for idle_ttl seconds, or for
+        # finished_ttl once drafting is over, a ttl of 0 never expires
+        return []
+
+    def evict_rooms(self, room_ids):
+        # removes the rooms and their secrets, returns {room_id: room} of
+        # the rooms removed
+        return {}
+
+    def flush(self):
+        # returns once every change made so far is stored
+        pass
+
+
+def secrets_index(rooms):
+    # secret -> [room_id, name] of the rooms as kept in the dumps
+    return {guest_info['secret']: [room_id, name]
+            for room_id, room in rooms.items()
+            for name, guest_info in room['guests'].items()}
+
 
 class SimpleFsDB(DraftDB):
+    # rooms are kept as Room objects, and readers share a frozen copy of each
+    # room as a dict, made on the first read after the room changed
+    # the dump is written in the background, once for the changes made
+    # within window seconds, or before every call that changed a room
+    # returns with durability 'sync'
+
+    # whether other processes write the dump too
+    shared = False
 
-    def __init__(self, fname='dump_draftv1.json'):
+    def __init__(self, fname='dump_draftv1.json', window=None,
+                 durability=None):
         super().__init__()
         self.fname = fname
         self.rooms = {}
         self.secrets = {}
+        self.snapshots = {}
+        # rooms changed since they were last handed to the writer
+        self.dirty = set()
         try:
-            self.rooms, self.secrets = json.load(open(fname))
+            rooms, self.secrets = json.load(open(fname))
+            self.rooms = self.load_rooms(rooms)
         except (json.decoder.JSONDecodeError, FileNotFoundError):
             pass
+        if window is None:
+            window = float(os.environ.get('draftv1_write_window', 0.2))
+        if durability is None:
+            durability = ('sync' if self.shared else
+                          os.environ.get('draftv1_durability', 'batch'))
+        if self.shared and durability != 'sync':
+            # the other workers would bid on rooms as they were up to a
+            # window ago, and their writes would undo the changes made here
+            raise ValueError('a shared dump is written with every change')
+        self.writer = GroupWriter(
+            fname, self.dump_rooms, secrets_index, window=window,
+            durability=durability, on_write=self.written,
+            room=self.room_dict if self.shared else None)
+
+    @staticmethod
+    def load_rooms(rooms):
+        # rooms as kept in the dumps to Room objects
+        return {room_id: Room.from_dict(room)
+                for room_id, room in rooms.items()}
+
+    def dump_rooms(self):
+        return {room_id: room.to_dict()
+                for room_id, room in self.rooms.items()}
+
+    def room_dict(self, room_id):
+        room = self.rooms.get(room_id)
+        return None if room is None else room.to_dict()
 
     def write_info(self):
-        json.dump([self.rooms, self.secrets], open(self.fname, 'w'), indent=4)
+        if self.dirty:
+            self.writer.put(self.dirty)
+            self.dirty = set()
+
+    def written(self, stat):
+        # called with the stat of each dump written
+        pass
+
+    def flush(self):
+        self.writer.flush()
+
+    def snapshot(self, room_id):
+        snapshot = self.snapshots.get(room_id)
+        if snapshot is None and room_id in self.rooms:
+            snapshot = self.snapshots[room_id] = freeze(
+                self.rooms[room_id].to_dict())
+        return snapshot
+
+    def changed(self, room_id):
+        # to be called on every change to a room
+        self.snapshots.pop(room_id, None)
+        self.dirty.add(room_id)
+        if room_id in self.rooms:
+            self.rooms[room_id].updated = time.time()
 
     def all_rooms(self):
-        return deepcopy(self.rooms)
+        return FrozenDict((room_id, self.snapshot(room_id))
+                          for room_id in self.rooms)
 
     def reset(self):
+        self.dirty.update(self.rooms)
         self.rooms = {}
+        self.snapshots.clear()
         self.write_info()
 
     def create_room(self):
@@ -81,14 +183,8 @@ class SimpleFsDB(DraftDB):
         # avoid collisions
         while room_id is None or room_id in self.rooms:
             room_id = ''.join(random.choices(CHARSET, k=6))
-        self.rooms[room_id] = {
-            'order': [],
-            'guests': {},
-            'captains': [],
-            'stage': 0,
-            'teams': [[], []],
-            'intents': [[[None, None], [None, None]] for _ in range(8)]
-        }
+        self.rooms[room_id] = Room(updated=time.time())
+        self.changed(room_id)
         self.write_info()
         return room_id
 
@@ -97,13 +193,42 @@ class SimpleFsDB(DraftDB):
         if deleted is None:
             self.write_info()
             return False
-        for _, guest_info in deleted['guests'].items():
-            self.secrets.pop(guest_info['secret'], None)
+        self.changed(room_id)
+        for guest_info in deleted.guests.values():
+            self.secrets.pop(guest_info.secret, None)
         self.write_info()
         return True
 
     def get_room_info(self, room_id):
-        return deepcopy(self.rooms.get(room_id))
+        return self.snapshot(room_id)
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        expired = []
+        for room_id, room in self.rooms.items():
+            if room.updated is None:
+                # rooms made before rooms were timed start from now
+                room.updated = now
+                self.snapshots.pop(room_id, None)
+            idle = now - room.updated
+            if ((idle_ttl and idle >= idle_ttl) or
+                    (finished_ttl and idle >= finished_ttl and
+                     room.stage >= 9)):
+                expired.append(room_id)
+        return expired
+
+    def evict_rooms(self, room_ids):
+        rooms = {}
+        for room_id in room_ids:
+            room = self.rooms.pop(room_id, None)
+            if room is None:
+                continue
+            self.changed(room_id)
+            for guest_info in room.guests.values():
+                self.secrets.pop(guest_info.secret, None)
+            rooms[room_id] = room.to_dict()
+        if rooms:
+            self.write_info()
+        return rooms
 
     def room_exists(self, room_id):
         return room_id in self.rooms
@@ -112,25 +237,24 @@ class SimpleFsDB(DraftDB):
         room = self.rooms.get(room_id)
         if room is None:
             return False, 'Room does not exist'
-        if room['stage']:
+        if room.stage:
             return False, 'Drafting has already started'
         if len(name) < 3:
             return False, 'Name must be at least 3 characters'
-        guests = room['guests']
+        guests = room.guests
         if any(name.lower() == n.lower() for n in guests):
             return False, 'Name taken'
         if len(guests) == 10:
             return False, 'Room is full'
-        guests[name] = {'owner': False, 'coins': 100, 'captain': 0}
-        if len(guests) == 1:
-            guests[name]['owner'] = True
         # generate the secret for the guest
         secret = None
         while secret is None or secret in self.secrets:
             secret = b64encode(os.urandom(32)).decode()
         self.secrets[secret] = [room_id, name]
-        guests[name]['secret'] = secret
-        room['order'].append(name)
+        # the first guest owns the room
+        guests[name] = Guest(secret, owner=not guests)
+        room.order.append(name)
+        self.changed(room_id)
         self.write_info()
         return True, secret
 
@@ -138,46 +262,49 @@ class SimpleFsDB(DraftDB):
         room = self.rooms.get(room_id)
         if room is None:
             return
-        room['stage'] = 1
-        room['draft_order'] = room['order'].copy()
-        room['draft_order'].remove(room['captains'][0])
-        room['draft_order'].remove(room['captains'][1])
-        random.shuffle(room['draft_order'])
-        room['teams'][0].append(room['captains'][0])
-        room['teams'][1].append(room['captains'][1])
+        room.stage = 1
+        room.draft_order = room.order.copy()
+        room.draft_order.remove(room.captains[0])
+        room.draft_order.remove(room.captains[1])
+        random.shuffle(room.draft_order)
+        room.teams[0].append(room.captains[0])
+        room.teams[1].append(room.captains[1])
+        self.changed(room_id)
         self.write_info()
 
     def set_payment(self, room_id, payment, accept, team):
         room = self.rooms.get(room_id)
         if room is None:
             return
-        player = room['stage'] - 1
-        intents = room['intents'][player]
-        intents[team] = [payment, accept]
+        player = room.stage - 1
+        intents = room.intents[player]
+        intents[team].payment = payment
+        intents[team].accept = accept
         # check if both players have made an offer
         full = None
-        if intents[1 - team][0] is not None:
+        if intents[1 - team].payment is not None:
             # decide player
-            winner = (0 if intents[0][0] > intents[1][0]
-                      else 1 if intents[0][0] < intents[1][0]
+            winner = (0 if intents[0].payment > intents[1].payment
+                      else 1 if intents[0].payment < intents[1].payment
                       else random.randint(0, 1))
             #       winner  0   1
             # action
             # 0             1   0   <-- resultant team
             # 1             0   1
-            to_team = intents[winner][1] == winner
-            room['teams'][to_team].append(room['draft_order'][player])
-            room['stage'] += 1
-            room['guests'][room['captains'][winner]]['coins'] -= intents[winner
-                                                                         ][0]
+            to_team = intents[winner].accept == winner
+            room.teams[to_team].append(room.draft_order[player])
+            room.stage += 1
+            captain = room.guests[room.captains[winner]]
+            captain.coins -= intents[winner].payment
             # check if a team is full
-            full = (0 if len(room['teams'][0]) == 5
-                    else 1 if len(room['teams'][1]) == 5
+            full = (0 if len(room.teams[0]) == 5
+                    else 1 if len(room.teams[1]) == 5
                     else None)
             if full is not None:
                 for p in range(player + 1, 8):
-                    room['teams'][1 - full].append(room['draft_order'][p])
-                    room['stage'] += 1
+                    room.teams[1 - full].append(room.draft_order[p])
+                    room.stage += 1
+        self.changed(room_id)
         self.write_info()
         # return whether we are done with the drafting process
         return full is not None
@@ -197,24 +324,25 @@ class SimpleFsDB(DraftDB):
         if info is None:
             return
         room_id, name = info
-        if self.rooms[room_id]['stage']:
+        room = self.rooms[room_id]
+        if room.stage:
             return
-        self.rooms[room_id]['order'].remove(name)
-        del self.rooms[room_id]['guests'][name]
+        room.order.remove(name)
+        del room.guests[name]
         del self.secrets[secret]
         # might be a captain
         try:
-            self.rooms[room_id]['captains'].remove(name)
-            for guest in self.rooms[room_id]['guests']:
-                self.rooms[room_id]['guests'][guest]['captain'] = 0
-            for i, capt in enumerate(self.rooms[room_id]['captains'], 1):
-                self.rooms[room_id]['guests'][capt]['captain'] = i
+            room.captains.remove(name)
+            for guest in room.guests.values():
+                guest.captain = 0
+            for i, capt in enumerate(room.captains, 1):
+                room.guests[capt].captain = i
         except ValueError:
             pass
-        if self.rooms[room_id]['order']:
+        if room.order:
             # make sure the oldest member is owner
-            self.rooms[room_id]['guests'][self.rooms[room_id]['order'][0]
-                                          ]['owner'] = True
+            room.guests[room.order[0]].owner = True
+        self.changed(room_id)
         self.write_info()
 
     def set_captain(self, secret):
@@ -222,35 +350,94 @@ class SimpleFsDB(DraftDB):
         if info is None:
             return
         room_id, name = info
-        current = self.rooms[room_id]['captains']
+        room = self.rooms[room_id]
+        current = room.captains
         if name not in current or (len(current) == 2 and name != current[-1]):
             current.append(name)
             if len(current) > 2:
                 current.pop(0)
-            for guest in self.rooms[room_id]['guests']:
-                self.rooms[room_id]['guests'][guest]['captain'] = 0
+            for guest in room.guests.values():
+                guest.captain = 0
             for i, capt in enumerate(current, 1):
-                self.rooms[room_id]['guests'][capt]['captain'] = i
+                room.guests[capt].captain = i
+            self.changed(room_id)
             self.write_info()
 
 
 class HotSwapDB(SimpleFsDB):
+    # shares the dump with other workers, so every call first picks up
+    # changes they made
+    # the dump is only parsed again when its stat changed, and it is
+    # always replaced whole so the inode changes with every write and a
+    # reader never sees half of one
+    # every change is written before the call that made it returns, and
+    # writers read the dump back and replace it while holding a lock on
+    # fname + '.lock', so the rooms another worker changed are kept, but a
+    # room two workers change before either has written it keeps the
+    # changes of the last to write
 
-    def __init__(self, fname='dump_draftv1.json'):
-        super().__init__()
-        self.fname = fname
+    shared = True
+
+    def __init__(self, fname='dump_draftv1.json', window=None,
+                 durability=None):
+        super().__init__(fname, window, durability)
         self.rooms = {}
         self.secrets = {}
+        # (inode, size, mtime) of the dump last read or written
+        self.stamp = None
+        self.loads = 0
+        self.reloads = 0
+        self.parse_seconds = 0
+        self.load_info()
+
+    def file_stamp(self):
         try:
-            self.rooms, self.secrets = json.load(open(fname))
-        except (json.decoder.JSONDecodeError, FileNotFoundError):
-            pass
+            return self.stat_stamp(os.stat(self.fname))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def stat_stamp(st):
+        return st.st_ino, st.st_size, st.st_mtime_ns
 
     def load_info(self):
+        self.loads += 1
+        stamp = self.file_stamp()
+        if stamp is None or stamp == self.stamp:
+            return
+        start = time.perf_counter()
         try:
-            self.rooms, self.secrets = json.load(open(self.fname))
-        except (json.decoder.JSONDecodeError, FileNotFoundError):
-            pass
+            rooms, _ = json.load(open(self.fname))
+        except json.decoder.JSONDecodeError:
+            return
+        # rooms changed here that are not written yet are kept over what
+        # the other workers wrote
+        kept = {room_id: self.rooms.get(room_id)
+                for room_id in self.writer.changed()}
+        self.rooms = self.load_rooms(rooms)
+        for room_id, room in kept.items():
+            if room is None:
+                self.rooms.pop(room_id, None)
+            else:
+                self.rooms[room_id] = room
+        self.secrets = {guest_info.secret: [room_id, name]
+                        for room_id, room in self.rooms.items()
+                        for name, guest_info in room.guests.items()}
+        self.parse_seconds += time.perf_counter() - start
+        self.reloads += 1
+        # any room may have changed
+        self.snapshots.clear()
+        self.stamp = stamp
+
+    def written(self, stat):
+        # taken from the file written rather than the path, which another
+        # worker could have replaced again already
+        self.stamp = self.stat_stamp(stat)
+
+    def stats(self):
+        return {'loads': self.loads, 'reloads': self.reloads,
+                'skipped': self.loads - self.reloads,
+                'parse_seconds': self.parse_seconds}
 
     def all_rooms(self):
         self.load_info()
@@ -299,3 +486,764 @@ class HotSwapDB(SimpleFsDB):
     def make_captain(self, secret):
         self.load_info()
         return super().make_captain(secret)
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        self.load_info()
+        return super().expired_rooms(idle_ttl, finished_ttl, now)
+
+    def evict_rooms(self, room_ids):
+        self.load_info()
+        return super().evict_rooms(room_ids)
+
+
+class ShardedFsDB(SimpleFsDB):
+    # every room in a json file of its own in dirname, so a change rewrites
+    # only the room it touched
+    # the secrets are indexed in memory from the rooms' guests when loading
+    # rather than kept in a file of their own that could disagree with them
+
+    def __init__(self, dirname='rooms_draftv1'):
+        # the single dump SimpleFsDB loads is not used
+        DraftDB.__init__(self)
+        self.dirname = dirname
+        self.rooms = {}
+        self.secrets = {}
+        self.snapshots = {}
+        # rooms changed since they were last written
+        self.dirty = set()
+        os.makedirs(dirname, exist_ok=True)
+        for fname in os.listdir(dirname):
+            if not fname.endswith('.json'):
+                continue
+            room_id = fname[:-len('.json')]
+            room = self.read_room(room_id)
+            if room is None:
+                continue
+            self.rooms[room_id] = room
+            for name, guest_info in room.guests.items():
+                self.secrets[guest_info.secret] = [room_id, name]
+
+    def room_fname(self, room_id):
+        return os.path.join(self.dirname, room_id + '.json')
+
+    def read_room(self, room_id):
+        try:
+            return Room.from_dict(json.load(open(self.room_fname(room_id))))
+        except (json.decoder.JSONDecodeError, FileNotFoundError):
+            return None
+
+    def write_info(self):
+        for room_id in self.dirty:
+            fname = self.room_fname(room_id)
+            if room_id not in self.rooms:
+                try:
+                    os.remove(fname)
+                except FileNotFoundError:
+                    pass
+                continue
+            # written to the side and moved over so that a crash leaves
+            # either the old room or the new one
+            with open(fname + '.tmp', 'w') as f:
+                json.dump(self.rooms[room_id].to_dict(), f)
+            os.replace(fname + '.tmp', fname)
+        self.dirty.clear()
+
+    def flush(self):
+        # rooms are written as they change
+        pass
+
+    def reset(self):
+        self.secrets = {}
+        super().reset()
+
+    def import_dump(self, fname='dump_draftv1.json'):
+        # copies the rooms of a SimpleFsDB dump in, returns how many
+        rooms, _ = json.load(open(fname))
+        for room_id, room in rooms.items():
+            if room_id in self.rooms:
+                self.evict_rooms([room_id])
+            self.rooms[room_id] = Room.from_dict(room)
+            for name, guest_info in room['guests'].items():
+                self.secrets[guest_info['secret']] = [room_id, name]
+            # written out with the time of its last change in the dump
+            self.snapshots.pop(room_id, None)
+            self.dirty.add(room_id)
+        self.write_info()
+        return len(rooms)
+
+
+class SqliteDB(DraftDB):
+    # rooms and guests in sqlite tables, secrets are looked up through an
+    # index on the guests instead of a dict of every secret
+    # the lists that are only ever read and written whole with their room
+    # (teams, intents and the draft order) are kept as json
+
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS rooms (
+        room_id TEXT PRIMARY KEY,
+        stage INTEGER NOT NULL,
+        teams TEXT NOT NULL,
+        intents TEXT NOT NULL,
+        draft_order TEXT,
+        updated REAL
+    );
+    CREATE TABLE IF NOT EXISTS guests (
+        room_id TEXT NOT NULL REFERENCES rooms (room_id),
+        name TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        secret TEXT NOT NULL UNIQUE,
+        owner INTEGER NOT NULL,
+        coins INTEGER NOT NULL,
+        captain INTEGER NOT NULL,
+        PRIMARY KEY (room_id, name)
+    );
+    CREATE INDEX IF NOT EXISTS guests_room ON guests (room_id, position);
+    '''
+
+    def __init__(self, fname='dump_draftv1.sqlite3'):
+        super().__init__()
+        self.fname = fname
+        # transactions are begun by hand, see transaction()
+        self.conn = sqlite3.connect(fname, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        columns = [column for _, column, *_ in
+                   self.conn.execute('PRAGMA table_info(rooms)')]
+        if 'updated' not in columns:
+            # made before rooms were timed
+            self.conn.execute('ALTER TABLE rooms ADD COLUMN updated REAL')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS rooms_updated '
+                          'ON rooms (updated)')
+
+    @contextmanager
+    def transaction(self):
+        # takes the write lock up front so that reads made in the
+        # transaction can not go stale before the writes
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def changed(self, room_id):
+        # to be called in the transaction of every change to a room
+        self.conn.execute('UPDATE rooms SET updated = ? WHERE room_id = ?',
+                          (time.time(), room_id))
+
+    def all_rooms(self):
+        room_ids = self.conn.execute('SELECT room_id FROM rooms').fetchall()
+        return {room_id: self.get_room_info(room_id)
+                for room_id, in room_ids}
+
+    def reset(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM guests')
+            conn.execute('DELETE FROM rooms')
+
+    def create_room(self):
+        with self.transaction() as conn:
+            room_id = None
+            # avoid collisions
+            while room_id is None or self.room_exists(room_id):
+                room_id = ''.join(random.choices(CHARSET, k=6))
+            conn.execute('INSERT INTO rooms (room_id, stage, teams, '
+                         'intents, updated) VALUES (?, 0, ?, ?, ?)',
+                         (room_id, json.dumps([[], []]),
+                          json.dumps([[[None, None], [None, None]]
+                                      for _ in range(8)]), time.time()))
+        return room_id
+
+    def delete_room(self, room_id):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM guests WHERE room_id = ?', (room_id,))
+            deleted = conn.execute('DELETE FROM rooms WHERE room_id = ?',
+                                   (room_id,)).rowcount
+        return deleted > 0
+
+    def get_room_info(self, room_id):
+        row = self.conn.execute('SELECT stage, teams, intents, draft_order '
+                                'FROM rooms WHERE room_id = ?',
+                                (room_id,)).fetchone()
+        if row is None:
+            return None
+        stage, teams, intents, draft_order = row
+        guests = self.conn.execute(
+            'SELECT name, owner, coins, captain, secret FROM guests '
+            'WHERE room_id = ? ORDER BY position', (room_id,)).fetchall()
+        room = {
+            'order': [name for name, *_ in guests],
+            'guests': {name: {'owner': bool(owner), 'coins': coins,
+                              'captain': captain, 'secret': secret}
+                       for name, owner, coins, captain, secret in guests},
+            'captains': [name for name, _, _, captain, _ in
+                         sorted(guests, key=lambda g: g[3]) if captain],
+            'stage': stage,
+            'teams': json.loads(teams),
+            'intents': json.loads(intents)
+        }
+        if draft_order is not None:
+            room['draft_order'] = json.loads(draft_order)
+        return room
+
+    def room_exists(self, room_id):
+        return self.conn.execute('SELECT 1 FROM rooms WHERE room_id = ?',
+                                 (room_id,)).fetchone() is not None
+
+    def add_guest(self, room_id, name):
+        with self.transaction() as conn:
+            row = conn.execute('SELECT stage FROM rooms WHERE room_id = ?',
+                               (room_id,)).fetchone()
+            if row is None:
+                return False, 'Room does not exist'
+            if row[0]:
+                return False, 'Drafting has already started'
+            if len(name) < 3:
+                return False, 'Name must be at least 3 characters'
+            names = [n for n, in conn.execute(
+                'SELECT name FROM guests WHERE room_id = ?', (room_id,))]
+            if any(name.lower() == n.lower() for n in names):
+                return False, 'Name taken'
+            if len(names) == 10:
+                return False, 'Room is full'
+            # generate the secret for the guest
+            secret = None
+            while secret is None or self.secret_to_room_id(secret):
+                secret = b64encode(os.urandom(32)).decode()
+            position = conn.execute('SELECT COALESCE(MAX(position) + 1, 0) '
+                                    'FROM guests WHERE room_id = ?',
+                                    (room_id,)).fetchone()[0]
+            conn.execute('INSERT INTO guests VALUES (?, ?, ?, ?, ?, 100, 0)',
+                         (room_id, name, position, secret, not names))
+            self.changed(room_id)
+        return True, secret
+
+    def advance_stage(self, room_id):
+        with self.transaction() as conn:
+            room = self.get_room_info(room_id)
+            if room is None:
+                return
+            draft_order = room['order'].copy()
+            draft_order.remove(room['captains'][0])
+            draft_order.remove(room['captains'][1])
+            random.shuffle(draft_order)
+            teams = [[room['captains'][0]], [room['captains'][1]]]
+            conn.execute('UPDATE rooms SET stage = 1, teams = ?, '
+                         'draft_order = ? WHERE room_id = ?',
+                         (json.dumps(teams), json.dumps(draft_order),
+                          room_id))
+            self.changed(room_id)
+
+    def set_payment(self, room_id, payment, accept, team):
+        # the room and the winning captain's coins change together
+        with self.transaction() as conn:
+            room = self.get_room_info(room_id)
+            if room is None:
+                return
+            player = room['stage'] - 1
+            intents = room['intents'][player]
+            intents[team] = [payment, accept]
+            # check if both players have made an offer
+            full = None
+            if intents[1 - team][0] is not None:
+                # decide player
+                winner = (0 if intents[0][0] > intents[1][0]
+                          else 1 if intents[0][0] < intents[1][0]
+                          else random.randint(0, 1))
+                to_team = intents[winner][1] == winner
+                room['teams'][to_team].append(room['draft_order'][player])
+                room['stage'] += 1
+                conn.execute('UPDATE guests SET coins = coins - ? '
+                             'WHERE room_id = ? AND name = ?',
+                             (intents[winner][0], room_id,
+                              room['captains'][winner]))
+                # check if a team is full
+                full = (0 if len(room['teams'][0]) == 5
+                        else 1 if len(room['teams'][1]) == 5
+                        else None)
+                if full is not None:
+                    for p in range(player + 1, 8):
+                        room['teams'][1 - full].append(
+                            room['draft_order'][p])
+                        room['stage'] += 1
+            conn.execute('UPDATE rooms SET stage = ?, teams = ?, '
+                         'intents = ? WHERE room_id = ?',
+                         (room['stage'], json.dumps(room['teams']),
+                          json.dumps(room['intents']), room_id))
+            self.changed(room_id)
+        # return whether we are done with the drafting process
+        return full is not None
+
+    def secret_to_guest(self, secret):
+        return self.conn.execute('SELECT room_id, name FROM guests '
+                                 'WHERE secret = ?', (secret,)).fetchone()
+
+    def secret_to_room_id(self, secret):
+        guest = self.secret_to_guest(secret)
+        return guest and guest[0]
+
+    def secret_to_name(self, secret):
+        guest = self.secret_to_guest(secret)
+        return guest and guest[1]
+
+    def kick_user(self, secret):
+        # the guest goes, and the captains and owner are worked out again,
+        # all at once
+        with self.transaction() as conn:
+            guest = self.secret_to_guest(secret)
+            if guest is None:
+                return
+            room_id, name = guest
+            room = self.get_room_info(room_id)
+            if room['stage']:
+                return
+            conn.execute('DELETE FROM guests WHERE secret = ?', (secret,))
+            if name in room['captains']:
+                room['captains'].remove(name)
+                conn.execute('UPDATE guests SET captain = 0 '
+                             'WHERE room_id = ?', (room_id,))
+                self.number_captains(room_id, room['captains'])
+            room['order'].remove(name)
+            if room['order']:
+                # make sure the oldest member is owner
+                conn.execute('UPDATE guests SET owner = 1 '
+                             'WHERE room_id = ? AND name = ?',
+                             (room_id, room['order'][0]))
+            self.changed(room_id)
+
+    def set_captain(self, secret):
+        with self.transaction() as conn:
+            guest = self.secret_to_guest(secret)
+            if guest is None:
+                return
+            room_id, name = guest
+            current = self.get_room_info(room_id)['captains']
+            if name not in current or (len(current) == 2 and
+                                       name != current[-1]):
+                if name in current:
+                    current.remove(name)
+                current.append(name)
+                if len(current) > 2:
+                    current.pop(0)
+                conn.execute('UPDATE guests SET captain = 0 '
+                             'WHERE room_id = ?', (room_id,))
+                self.number_captains(room_id, current)
+                self.changed(room_id)
+
+    def number_captains(self, room_id, captains):
+        for i, captain in enumerate(captains, 1):
+            self.conn.execute('UPDATE guests SET captain = ? '
+                              'WHERE room_id = ? AND name = ?',
+                              (i, room_id, captain))
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        # rooms made before rooms were timed start from now
+        self.conn.execute('UPDATE rooms SET updated = ? '
+                          'WHERE updated IS NULL', (now,))
+        expired = set()
+        if idle_ttl:
+            expired.update(room_id for room_id, in self.conn.execute(
+                'SELECT room_id FROM rooms WHERE updated <= ?',
+                (now - idle_ttl,)))
+        if finished_ttl:
+            expired.update(room_id for room_id, in self.conn.execute(
+                'SELECT room_id FROM rooms WHERE updated <= ? AND '
+                'stage >= 9', (now - finished_ttl,)))
+        return list(expired)
+
+    def evict_rooms(self, room_ids):
+        rooms = {}
+        with self.transaction() as conn:
+            for room_id in room_ids:
+                room = self.get_room_info(room_id)
+                if room is None:
+                    continue
+                room['updated'] = conn.execute(
+                    'SELECT updated FROM rooms WHERE room_id = ?',
+                    (room_id,)).fetchone()[0]
+                conn.execute('DELETE FROM guests WHERE room_id = ?',
+                             (room_id,))
+                conn.execute('DELETE FROM rooms WHERE room_id = ?',
+                             (room_id,))
+                rooms[room_id] = room
+        return rooms
+
+    def import_dump(self, fname='dump_draftv1.json'):
+        # copies the rooms of a SimpleFsDB dump in, returns how many
+        rooms, _ = json.load(open(fname))
+        with self.transaction() as conn:
+            for room_id, room in rooms.items():
+                conn.execute('INSERT OR REPLACE INTO rooms (room_id, stage, '
+                             'teams, intents, draft_order, updated) '
+                             'VALUES (?, ?, ?, ?, ?, ?)',
+                             (room_id, room['stage'],
+                              json.dumps(room['teams']),
+                              json.dumps(room['intents']),
+                              json.dumps(room['draft_order'])
+                              if 'draft_order' in room else None,
+                              room.get('updated')))
+                for position, name in enumerate(room['order']):
+                    guest = room['guests'][name]
+                    conn.execute('INSERT OR REPLACE INTO guests '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 (room_id, name, position, guest['secret'],
+                                  guest['owner'], guest['coins'],
+                                  guest['captain']))
+        return len(rooms)
+
+
+class RedisDB(DraftDB):
+    # rooms in a redis server, shared by every worker and host using it
+    # a room is a hash of its fields, kept as json, next to a hash of its
+    # guests and a hash mapping every secret to its guest
+    # bids are resolved by a script run inside redis, the other changes
+    # are rare enough to be transactions that start over whenever another
+    # worker changed the room in the meantime
+    # the client must be made with decode_responses=True
+
+    # KEYS: the room, its guests, the times rooms changed
+    # ARGV: the payment, accept as json, the team, the winner of a tie,
+    # the time and the room id
+    SET_PAYMENT = """
+    local room = redis.call('HMGET', KEYS[1], 'stage', 'intents', 'teams',
+                            'draft_order', 'captains')
+    if not room[1] then
+        return nil
+    end
+    local player = tonumber(room[1])
+    local stage = player
+    local intents = cjson.decode(room[2])
+    local teams = cjson.decode(room[3])
+    local team = tonumber(ARGV[3])
+    local intent = intents[player]
+    intent[team + 1] = {tonumber(ARGV[1]), cjson.decode(ARGV[2])}
+    -- check if both players have made an offer
+    local full = nil
+    if intent[2 - team][1] ~= cjson.null then
+        local winner = tonumber(ARGV[4])
+        if intent[1][1] > intent[2][1] then
+            winner = 0
+        elseif intent[1][1] < intent[2][1] then
+            winner = 1
+        end
+        -- compared the way python compares a boolean to 0 or 1
+        local accept = intent[winner + 1][2]
+        if accept == true then
+            accept = 1
+        elseif accept == false then
+            accept = 0
+        end
+        local to_team = accept == winner and 2 or 1
+        local draft_order = cjson.decode(room[4])
+        table.insert(teams[to_team], draft_order[player])
+        stage = stage + 1
+        local captain = cjson.decode(room[5])[winner + 1]
+        local guest = cjson.decode(redis.call('HGET', KEYS[2], captain))
+        guest['coins'] = guest['coins'] - intent[winner + 1][1]
+        redis.call('HSET', KEYS[2], captain, cjson.encode(guest))
+        -- check if a team is full
+        if #teams[1] == 5 then
+            full = 1
+        elseif #teams[2] == 5 then
+            full = 2
+        end
+        if full then
+            for p = player + 1, 8 do
+                table.insert(teams[3 - full], draft_order[p])
+                stage = stage + 1
+            end
+        end
+    end
+    redis.call('HSET', KEYS[1], 'stage', stage,
+               'intents', cjson.encode(intents), 'teams', cjson.encode(teams))
+    redis.call('ZADD', KEYS[3], ARGV[5], ARGV[6])
+    return full and 1 or 0
+    """
+
+    def __init__(self, url=None, client=None, prefix='draftv1:'):
+        super().__init__()
+        if client is None:
+            if redis is None:
+                raise ImportError('RedisDB needs the redis package')
+            client = redis.Redis.from_url(
+                url or os.environ.get('redis_url', 'redis://localhost:6379'),
+                decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.rooms_key = prefix + 'rooms'
+        # secret -> json [room_id, name]
+        self.secrets_key = prefix + 'secrets'
+        # room id -> when the room last changed
+        self.updated_key = prefix + 'updated'
+        # whether rooms made before rooms were timed have been timed
+        self.timed = False
+        self.set_payment_script = client.register_script(self.SET_PAYMENT)
+
+    def room_key(self, room_id):
+        return f'{self.prefix}room:{room_id}'
+
+    def guests_key(self, room_id):
+        return f'{self.prefix}guests:{room_id}'
+
+    @staticmethod
+    def load_room(fields, guests):
+        # the room as SimpleFsDB keeps it from its two hashes, or None
+        if not fields:
+            return None
+        room = {field: json.loads(value) for field, value in fields.items()}
+        room['guests'] = {name: json.loads(guests[name])
+                          for name in room['order']}
+        return room
+
+    def write_fields(self, pipe, room_id, room, *fields):
+        pipe.hset(self.room_key(room_id), mapping={
+            field: json.dumps(room[field]) for field in fields})
+
+    def write_guests(self, pipe, room_id, room, *names):
+        pipe.hset(self.guests_key(room_id), mapping={
+            name: json.dumps(room['guests'][name]) for name in names})
+
+    def changed(self, pipe, room_id):
+        # to be queued with every change to a room
+        pipe.zadd(self.updated_key, {room_id: time.time()})
+
+    def update_room(self, room_id, update):
+        # update(pipe, room) is called with the room as read with its keys
+        # watched, and queues its writes after calling pipe.multi()
+        # the room is None if it does not exist
+        def _update(pipe):
+            room = self.load_room(pipe.hgetall(self.room_key(room_id)),
+                                  pipe.hgetall(self.guests_key(room_id)))
+            return update(pipe, room)
+        return self.client.transaction(_update, self.room_key(room_id),
+                                       self.guests_key(room_id),
+                                       value_from_callable=True)
+
+    def all_rooms(self):
+        rooms = {room_id: self.get_room_info(room_id)
+                 for room_id in self.client.smembers(self.rooms_key)}
+        return {room_id: room for room_id, room in rooms.items()
+                if room is not None}
+
+    def reset(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def create_room(self):
+        def create(pipe):
+            # avoid collisions, a room made by another worker in the
+            # meantime makes the transaction start over
+            while True:
+                room_id = ''.join(random.choices(CHARSET, k=6))
+                pipe.watch(self.room_key(room_id))
+                if not pipe.exists(self.room_key(room_id)):
+                    break
+            room = {
+                'order': [],
+                'captains': [],
+                'stage': 0,
+                'teams': [[], []],
+                'intents': [[[None, None], [None, None]] for _ in range(8)]
+            }
+            pipe.multi()
+            self.write_fields(pipe, room_id, room, 'order', 'captains',
+                              'stage', 'teams', 'intents')
+            pipe.sadd(self.rooms_key, room_id)
+            self.changed(pipe, room_id)
+            return room_id
+        return self.client.transaction(create, value_from_callable=True)
+
+    def remove_room(self, pipe, room_id, room):
+        # queues the removal of the room and its secrets
+        pipe.delete(self.room_key(room_id), self.guests_key(room_id))
+        secrets = [guest['secret'] for guest in room['guests'].values()]
+        if secrets:
+            pipe.hdel(self.secrets_key, *secrets)
+        pipe.srem(self.rooms_key, room_id)
+        pipe.zrem(self.updated_key, room_id)
+
+    def delete_room(self, room_id):
+        def delete(pipe, room):
+            if room is None:
+                return False
+            pipe.multi()
+            self.remove_room(pipe, room_id, room)
+            return True
+        return self.update_room(room_id, delete)
+
+    def get_room_info(self, room_id):
+        # both hashes are read in one transaction
+        with self.client.pipeline() as pipe:
+            pipe.hgetall(self.room_key(room_id))
+            pipe.hgetall(self.guests_key(room_id))
+            return self.load_room(*pipe.execute())
+
+    def room_exists(self, room_id):
+        return bool(self.client.exists(self.room_key(room_id)))
+
+    def add_guest(self, room_id, name):
+        def add(pipe, room):
+            if room is None:
+                return False, 'Room does not exist'
+            if room['stage']:
+                return False, 'Drafting has already started'
+            if len(name) < 3:
+                return False, 'Name must be at least 3 characters'
+            guests = room['guests']
+            if any(name.lower() == n.lower() for n in guests):
+                return False, 'Name taken'
+            if len(guests) == 10:
+                return False, 'Room is full'
+            # generate the secret for the guest
+            secret = None
+            while secret is None or pipe.hexists(self.secrets_key, secret):
+                secret = b64encode(os.urandom(32)).decode()
+            guests[name] = {'owner': not guests, 'coins': 100,
+                            'captain': 0, 'secret': secret}
+            room['order'].append(name)
+            pipe.multi()
+            self.write_guests(pipe, room_id, room, name)
+            self.write_fields(pipe, room_id, room, 'order')
+            pipe.hset(self.secrets_key, secret, json.dumps([room_id, name]))
+            self.changed(pipe, room_id)
+            return True, secret
+        return self.update_room(room_id, add)
+
+    def advance_stage(self, room_id):
+        def advance(pipe, room):
+            if room is None:
+                return
+            room['stage'] = 1
+            room['draft_order'] = room['order'].copy()
+            room['draft_order'].remove(room['captains'][0])
+            room['draft_order'].remove(room['captains'][1])
+            random.shuffle(room['draft_order'])
+            room['teams'][0].append(room['captains'][0])
+            room['teams'][1].append(room['captains'][1])
+            pipe.multi()
+            self.write_fields(pipe, room_id, room, 'stage', 'draft_order',
+                              'teams')
+            self.changed(pipe, room_id)
+        return self.update_room(room_id, advance)
+
+    def set_payment(self, room_id, payment, accept, team):
+        full = self.set_payment_script(
+            keys=[self.room_key(room_id), self.guests_key(room_id),
+                  self.updated_key],
+            args=[payment, json.dumps(accept), team, random.randint(0, 1),
+                  time.time(), room_id])
+        # return whether we are done with the drafting process
+        return None if full is None else bool(full)
+
+    def secret_to_guest(self, secret):
+        guest = self.client.hget(self.secrets_key, secret)
+        return guest and json.loads(guest)
+
+    def secret_to_room_id(self, secret):
+        guest = self.secret_to_guest(secret)
+        return guest and guest[0]
+
+    def secret_to_name(self, secret):
+        guest = self.secret_to_guest(secret)
+        return guest and guest[1]
+
+    def kick_user(self, secret):
+        guest = self.secret_to_guest(secret)
+        if guest is None:
+            return
+        room_id, name = guest
+
+        def kick(pipe, room):
+            if room is None or name not in room['guests'] or room['stage']:
+                return
+            room['order'].remove(name)
+            del room['guests'][name]
+            # might be a captain
+            if name in room['captains']:
+                room['captains'].remove(name)
+                self.number_captains(room)
+            if room['order']:
+                # make sure the oldest member is owner
+                room['guests'][room['order'][0]]['owner'] = True
+            pipe.multi()
+            pipe.hdel(self.guests_key(room_id), name)
+            pipe.hdel(self.secrets_key, secret)
+            self.write_fields(pipe, room_id, room, 'order', 'captains')
+            if room['order']:
+                self.write_guests(pipe, room_id, room, *room['order'])
+            self.changed(pipe, room_id)
+        return self.update_room(room_id, kick)
+
+    def set_captain(self, secret):
+        guest = self.secret_to_guest(secret)
+        if guest is None:
+            return
+        room_id, name = guest
+
+        def captain(pipe, room):
+            if room is None or name not in room['guests']:
+                return
+            current = room['captains']
+            if name not in current or (len(current) == 2 and
+                                       name != current[-1]):
+                if name in current:
+                    current.remove(name)
+                current.append(name)
+                if len(current) > 2:
+                    current.pop(0)
+                self.number_captains(room)
+                pipe.multi()
+                self.write_fields(pipe, room_id, room, 'captains')
+                self.write_guests(pipe, room_id, room, *room['order'])
+                self.changed(pipe, room_id)
+        return self.update_room(room_id, captain)
+
+    @staticmethod
+    def number_captains(room):
+        for guest in room['guests'].values():
+            guest['captain'] = 0
+        for i, captain in enumerate(room['captains'], 1):
+            room['guests'][captain]['captain'] = i
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        if not self.timed:
+            # rooms made before rooms were timed start from now
+            room_ids = self.client.smembers(self.rooms_key)
+            if room_ids:
+                self.client.zadd(self.updated_key,
+                                 {room_id: now for room_id in room_ids},
+                                 nx=True)
+            self.timed = True
+        expired = set()
+        if idle_ttl:
+            expired.update(self.client.zrangebyscore(
+                self.updated_key, '-inf', now - idle_ttl))
+        if finished_ttl:
+            for room_id in self.client.zrangebyscore(
+                    self.updated_key, '-inf', now - finished_ttl):
+                stage = self.client.hget(self.room_key(room_id), 'stage')
+                if stage is not None and json.loads(stage) >= 9:
+                    expired.add(room_id)
+        return list(expired)
+
+    def evict_rooms(self, room_ids):
+        rooms = {}
+        for room_id in room_ids:
+            def evict(pipe, room):
+                updated = pipe.zscore(self.updated_key, room_id)
+                pipe.multi()
+                if room is None:
+                    pipe.zrem(self.updated_key, room_id)
+                    return None
+                self.remove_room(pipe, room_id, room)
+                if updated is not None:
+                    room['updated'] = updated
+                return room
+            room = self.update_room(room_id, evict)
+            if room is not None:
+                rooms[room_id] = room
+        return rooms
@@ -11,11 +11,35 @@ from flask import request, url_for
 from flask_socketio import emit
 
 from .. import socketio
-from .db import HotSwapDB as LocalDB
+from ..archive import Archive, Sweeper
+from .db import HotSwapDB, RedisDB, ShardedFsDB, SimpleFsDB, SqliteDB
 
 app = Blueprint('draftv1', __name__, template_folder='templates',
                 static_folder='static')
-DB = LocalDB()
+DATABASES = {
+    'hotswap': HotSwapDB,
+    'simple': SimpleFsDB,
+    'sharded': ShardedFsDB,
+    'sqlite': SqliteDB,
+    'redis': RedisDB
+}
+DB = DATABASES[os.environ.get('draftv1_db', 'hotswap')]()
+# rooms unchanged for draftv1_room_ttl seconds, or for draftv1_finished_ttl
+# once drafting is over, are moved to the archive
+SWEEPER = Sweeper(DB, Archive(os.environ.get('draftv1_archive',
+                                             'archive_draftv1.jsonl.gz')),
+                  idle_ttl=float(os.environ.get('draftv1_room_ttl',
+                                                7 * 24 * 3600)),
+                  finished_ttl=float(os.environ.get('draftv1_finished_ttl',
+                                                    24 * 3600)),
+                  interval=float(os.environ.get('draftv1_sweep_interval',
+                                                600)))
+
+
+@app.before_app_request
+def start_sweeper():
+    # the background task can only start once the server is running
+    SWEEPER.start()
 
 
 def render_template(*args, **kwargs):
@@ -203,6 +227,12 @@ def admin_view():
     return redirect(url_for('draftv1.admin_login'))
 
 
+@app.route('/admin/stats', methods=['GET', 'POST'])
+@assert_valid_key()
+def admin_stats():
+    return Response(json.dumps(DB.stats()), mimetype='text/plain')
+
+
 @app.route('/admin/delete', methods=['POST'])
 @assert_valid_key()
 def admin_delete():
@@ -0,0 +1,92 @@
+# draft rooms as objects with a fixed set of fields instead of nested
+# dicts, which takes a fraction of the memory for every room kept
+# from_dict and to_dict convert from and to the rooms in the json dumps
+
+
+class Guest:
+
+    __slots__ = ('owner', 'coins', 'captain', 'secret')
+
+    def __init__(self, secret, owner=False, coins=100, captain=0):
+        self.secret = secret
+        self.owner = owner
+        self.coins = coins
+        # 0, or 1 or 2 for the first or second captain
+        self.captain = captain
+
+    @classmethod
+    def from_dict(cls, guest):
+        return cls(guest['secret'], guest['owner'], guest['coins'],
+                   guest['captain'])
+
+    def to_dict(self):
+        return {'owner': self.owner, 'coins': self.coins,
+                'captain': self.captain, 'secret': self.secret}
+
+
+class Intent:
+    # a captain's offer for a player, both None until it is made
+    # accept is whether the captain wants the player on their team
+
+    __slots__ = ('payment', 'accept')
+
+    def __init__(self, payment=None, accept=None):
+        self.payment = payment
+        self.accept = accept
+
+    def to_list(self):
+        return [self.payment, self.accept]
+
+
+class Room:
+
+    __slots__ = ('order', 'guests', 'captains', 'stage', 'teams', 'intents',
+                 'draft_order', 'updated')
+
+    def __init__(self, order=None, guests=None, captains=None, stage=0,
+                 teams=None, intents=None, draft_order=None, updated=None):
+        # guest names in the order they joined
+        self.order = [] if order is None else order
+        self.guests = {} if guests is None else guests
+        self.captains = [] if captains is None else captains
+        # 0 before drafting, then 1 + the number of players drafted
+        self.stage = stage
+        self.teams = ([], []) if teams is None else teams
+        # for each player drafted, the offer of each captain
+        self.intents = ([(Intent(), Intent()) for _ in range(8)]
+                        if intents is None else intents)
+        # players in the order they are drafted, set when drafting starts
+        self.draft_order = draft_order
+        # when the room last changed, None for rooms from older dumps
+        self.updated = updated
+
+    @classmethod
+    def from_dict(cls, room):
+        return cls(
+            order=room['order'],
+            guests={name: Guest.from_dict(guest)
+                    for name, guest in room['guests'].items()},
+            captains=room['captains'],
+            stage=room['stage'],
+            teams=tuple(room['teams']),
+            intents=[tuple(Intent(*intent) for intent in intents)
+                     for intents in room['intents']],
+            draft_order=room.get('draft_order'),
+            updated=room.get('updated'))
+
+    def to_dict(self):
+        room = {
+            'order': list(self.order),
+            'guests': {name: guest.to_dict()
+                       for name, guest in self.guests.items()},
+            'captains': list(self.captains),
+            'stage': self.stage,
+            'teams': [list(team) for team in self.teams],
+            'intents': [[intent.to_list() for intent in intents]
+                        for intents in self.intents]
+        }
+        if self.updated is not None:
+            room['updated'] = self.updated
+        if self.draft_order is not None:
+            room['draft_order'] = list(self.draft_order)
+        return room
@@ -0,0 +1,38 @@
+# read-only versions of the dicts and lists rooms are made of, so that one
+# copy of a room can be handed to every reader until the room changes
+# they are still dicts and lists, so they go to json, templates and other
+# processes like the originals
+
+
+def read_only(self, *args, **kwargs):
+    raise TypeError(f'{type(self).__name__} can not be changed')
+
+
+class FrozenDict(dict):
+    # copy() gives a plain dict
+
+    __setitem__ = __delitem__ = __ior__ = read_only
+    clear = pop = popitem = setdefault = update = read_only
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    # slices and copy() give plain lists
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = read_only
+    append = extend = insert = pop = remove = clear = read_only
+    sort = reverse = read_only
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(value):
+    # a read-only copy of a tree of dicts and lists
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(v) for v in value)
+    return value
@@ -0,0 +1,42 @@
+# Copy the rooms of the json dumps into the sqlite databases
+#
+#   python -m mmserver.apps.migrate
+#
+# then start the server with mmv1_db=sqlite and draftv1_db=sqlite
+# rooms already in the databases are kept, and ones with the same id as a
+# room in a dump are replaced by it
+import argparse
+import os
+
+from .draftv1.db import SqliteDB as DraftSqliteDB
+from .mmv1.db import SqliteDB as MMSqliteDB
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mmserver.apps.migrate',
+        description='Import the json dumps into the sqlite databases.')
+    parser.add_argument('--mmv1', default='dump.json',
+                        help='mmv1 dump to import (default: dump.json)')
+    parser.add_argument('--mmv1-db', default='dump.sqlite3',
+                        help='mmv1 database (default: dump.sqlite3)')
+    parser.add_argument('--draftv1', default='dump_draftv1.json',
+                        help='draftv1 dump to import '
+                             '(default: dump_draftv1.json)')
+    parser.add_argument('--draftv1-db', default='dump_draftv1.sqlite3',
+                        help='draftv1 database '
+                             '(default: dump_draftv1.sqlite3)')
+    args = parser.parse_args(argv)
+    for name, dump, db_cls, db_fname in (
+            ('mmv1', args.mmv1, MMSqliteDB, args.mmv1_db),
+            ('draftv1', args.draftv1, DraftSqliteDB, args.draftv1_db)):
+        if not os.path.isfile(dump):
+            print(f'{name}: no dump at {dump}, skipped')
+            continue
+        imported = db_cls(db_fname).import_dump(dump)
+        print(f'{name}: imported {imported} rooms from {dump} '
+              f'into {db_fname}')
+
+
+if __name__ == '__main__':
+    main()
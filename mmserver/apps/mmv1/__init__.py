@@ -1 +0,0 @@
-from .endpoints import app
\ No newline at end of file
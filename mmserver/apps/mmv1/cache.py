@@ -0,0 +1,40 @@
+import json
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+
+
+def suggestion_key(room_info, k=1, explain=False):
+    # suggestions only depend on the mode, the players and their answers,
+    # on how many alternatives were asked for and on whether the report
+    # was asked for
+    # the players are named in the suggestions, so rooms with the same
+    # answers from other players do not share them
+    players = room_info['players']
+    answers = [room_info['player_info'][p] for p in players]
+    digest = sha1(json.dumps([players, answers]).encode()).hexdigest()
+    return room_info['mode'], digest, k, explain
+
+
+class SuggestionCache:
+
+    def __init__(self, size=256):
+        self.size = size
+        # a room's entries are left to age out once its answers change,
+        # as its key changes with them
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
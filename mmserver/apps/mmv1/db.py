@@ -1,8 +1,19 @@
 import json
 import os
 import random
+import sqlite3
 import string
-from copy import deepcopy
+import time
+from contextlib import contextmanager
+
+from ..frozen import freeze
+from ..writer import GroupWriter
+from .models import MMRoom
+
+try:
+    import redis
+except ImportError:
+    redis = None
 
 CHARSET = string.ascii_uppercase + string.digits
 
@@ -40,41 +51,77 @@ class MMDB:
     def response_id_to_player(self, response_id):
         pass
 
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        # ids of the rooms unchanged for idle_ttl seconds, or for
+        # finished_ttl once every response is in, a ttl of 0 never expires
+        return []
+
+    def evict_rooms(self, room_ids):
+        # removes the rooms and their response ids, returns {room_id: room}
+        # of the rooms removed
+        return {}
+
+    def flush(self):
+        # returns once every change made so far is stored
+        pass
+
+
+def response_index(rooms):
+    # response id -> room id of the rooms as kept in the dumps
+    return {response_id: room_id for room_id, room in rooms.items()
+            for response_id in room['response_ids']}
+
 
 class SimpleDB(MMDB):
+    # rooms are kept as MMRoom objects, and readers share a frozen copy of
+    # each room as a dict, made on the first read after the room changed
 
     def __init__(self):
         super().__init__()
         self.rooms = {}
         self.reverse_mapping = {}
+        self.snapshots = {}
 
     def reset(self):
         self.rooms.clear()
         self.reverse_mapping.clear()
+        self.snapshots.clear()
+
+    @staticmethod
+    def load_rooms(rooms):
+        # rooms as kept in the dumps to MMRoom objects
+        return {room_id: MMRoom.from_dict(room)
+                for room_id, room in rooms.items()}
+
+    def dump_rooms(self):
+        return {room_id: room.to_dict()
+                for room_id, room in self.rooms.items()}
 
     def create_room(self, players, mode='friend'):
         room_id = None
         # avoid collisions
         while room_id is None or room_id in self.rooms:
             room_id = ''.join(random.choices(CHARSET, k=6))
-        self.rooms[room_id] = {
-            'mode': mode,
-            'players': [p for p in players],
-            'player_info': {p: None for p in players},
-            'response_ids': {}
-        }
         # create some response ids
+        response_ids = []
         for player in players:
             response_id = None
             # avoid collisions
             while response_id is None or response_id in self.reverse_mapping:
                 response_id = ''.join(random.choices(CHARSET, k=7))
-            self.rooms[room_id]['response_ids'][response_id] = player
+            response_ids.append(response_id)
             self.reverse_mapping[response_id] = room_id
+        self.rooms[room_id] = MMRoom(mode, list(players),
+                                     [None] * len(players), response_ids,
+                                     updated=time.time())
         return room_id
 
     def get_room_info(self, room_id):
-        return deepcopy(self.rooms.get(room_id))
+        snapshot = self.snapshots.get(room_id)
+        if snapshot is None and room_id in self.rooms:
+            snapshot = self.snapshots[room_id] = freeze(
+                self.rooms[room_id].to_dict())
+        return snapshot
 
     def room_exists(self, room_id):
         return self.rooms.get(room_id) is not None
@@ -83,8 +130,9 @@ class SimpleDB(MMDB):
         room_id = self.reverse_mapping.get(response_id)
         if room_id is None:
             return
-        player = self.rooms[room_id]['response_ids'][response_id]
-        self.rooms[room_id]['player_info'][player] = prefs
+        self.rooms[room_id].set_response(response_id, prefs)
+        self.rooms[room_id].updated = time.time()
+        self.snapshots.pop(room_id, None)
 
     def response_exists(self, response_id):
         return self.reverse_mapping.get(response_id) is not None
@@ -95,32 +143,513 @@ class SimpleDB(MMDB):
     def response_id_to_player(self, response_id):
         if self.response_exists(response_id):
             return self.rooms[self.reverse_mapping[response_id]
-                              ]['response_ids'][response_id]
+                              ].player(response_id)
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        expired = []
+        for room_id, room in self.rooms.items():
+            if room.updated is None:
+                # rooms made before rooms were timed start from now
+                room.updated = now
+                self.snapshots.pop(room_id, None)
+            idle = now - room.updated
+            if ((idle_ttl and idle >= idle_ttl) or
+                    (finished_ttl and idle >= finished_ttl and
+                     all(room.responses))):
+                expired.append(room_id)
+        return expired
+
+    def evict_rooms(self, room_ids):
+        rooms = {}
+        for room_id in room_ids:
+            room = self.rooms.pop(room_id, None)
+            if room is None:
+                continue
+            self.snapshots.pop(room_id, None)
+            for response_id in room.response_ids:
+                self.reverse_mapping.pop(response_id, None)
+            rooms[room_id] = room.to_dict()
+        return rooms
 
 
 class SimpleFsDB(SimpleDB):
+    # the dump is written in the background, once for the changes made
+    # within window seconds, or before every call that changed a room
+    # returns with durability 'sync'
 
-    def __init__(self, fname='dump.json'):
+    def __init__(self, fname='dump.json', window=None, durability=None):
         super().__init__()
         self.fname = fname
         if os.path.isfile(fname):
             # load
-            self.rooms, self.reverse_mapping = json.load(open(fname))
+            rooms, self.reverse_mapping = json.load(open(fname))
+            self.rooms = self.load_rooms(rooms)
+        if window is None:
+            window = float(os.environ.get('mmv1_write_window', 0.2))
+        if durability is None:
+            durability = os.environ.get('mmv1_durability', 'batch')
+        self.writer = GroupWriter(fname, self.dump_rooms, response_index,
+                                  window=window, durability=durability)
+
+    def write_info(self, room_ids):
+        # hands the ids of the rooms changed to the writer
+        if room_ids:
+            self.writer.put(room_ids)
 
-    def write_info(self):
-        json.dump([self.rooms, self.reverse_mapping], open(self.fname, 'w'),
-                  indent=4)
+    def flush(self):
+        self.writer.flush()
 
     def reset(self):
+        room_ids = list(self.rooms)
         super().reset()
-        self.write_info()
+        self.write_info(room_ids)
 
     def create_room(self, players, mode='friend'):
         ret = super().create_room(players, mode=mode)
-        self.write_info()
+        self.write_info([ret])
         return ret
 
     def set_response(self, response_id, prefs):
+        room_id = self.reverse_mapping.get(response_id)
         ret = super().set_response(response_id, prefs)
-        self.write_info()
+        if room_id is not None:
+            self.write_info([room_id])
         return ret
+
+    def evict_rooms(self, room_ids):
+        rooms = super().evict_rooms(room_ids)
+        self.write_info(rooms)
+        return rooms
+
+
+class LogFsDB(SimpleDB):
+    # appends every change to a log instead of rewriting every room each
+    # time, and every snapshot_every changes the log is folded into a
+    # snapshot in the same format as SimpleFsDB's dump
+    # replaying a record twice gives the same state, so a crash between
+    # writing a snapshot and emptying the log loses nothing
+
+    def __init__(self, fname='dump.json', log_fname=None,
+                 snapshot_every=1000):
+        super().__init__()
+        self.fname = fname
+        self.log_fname = log_fname or fname + '.log'
+        self.snapshot_every = snapshot_every
+        if os.path.isfile(fname):
+            rooms, self.reverse_mapping = json.load(open(fname))
+            self.rooms = self.load_rooms(rooms)
+        self.logged = 0
+        if os.path.isfile(self.log_fname):
+            self.replay_log()
+        self.log = open(self.log_fname, 'a')
+
+    def replay_log(self):
+        end = 0
+        with open(self.log_fname, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self.replay(record)
+                self.logged += 1
+                end += len(line)
+        # the last record may have been cut off by a crash, it is dropped
+        # so that new records start on a line of their own
+        if end != os.path.getsize(self.log_fname):
+            with open(self.log_fname, 'r+b') as f:
+                f.truncate(end)
+
+    def replay(self, record):
+        if record['op'] == 'create_room':
+            self.rooms[record['room_id']] = MMRoom.from_dict(record['room'])
+            self.snapshots.pop(record['room_id'], None)
+            for response_id in record['room']['response_ids']:
+                self.reverse_mapping[response_id] = record['room_id']
+        elif record['op'] == 'set_response':
+            super().set_response(record['response_id'], record['prefs'])
+            room_id = self.reverse_mapping.get(record['response_id'])
+            if room_id is not None and 'updated' in record:
+                # the time of the change rather than of the replay
+                self.rooms[room_id].updated = record['updated']
+        elif record['op'] == 'evict_room':
+            super().evict_rooms([record['room_id']])
+
+    def append(self, record):
+        self.log.write(json.dumps(record) + '\n')
+        self.log.flush()
+        self.logged += 1
+        if self.logged >= self.snapshot_every:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        # written to the side and moved over so that a crash leaves either
+        # the old snapshot or the new one
+        tmp_fname = self.fname + '.tmp'
+        with open(tmp_fname, 'w') as f:
+            json.dump([self.dump_rooms(), self.reverse_mapping], f,
+                      indent=4)
+        os.replace(tmp_fname, self.fname)
+        self.log.close()
+        self.log = open(self.log_fname, 'w')
+        self.logged = 0
+
+    def reset(self):
+        super().reset()
+        self.write_snapshot()
+
+    def create_room(self, players, mode='friend'):
+        room_id = super().create_room(players, mode=mode)
+        self.append({'op': 'create_room', 'room_id': room_id,
+                     'room': self.rooms[room_id].to_dict()})
+        return room_id
+
+    def set_response(self, response_id, prefs):
+        ret = super().set_response(response_id, prefs)
+        if self.response_exists(response_id):
+            room = self.rooms[self.reverse_mapping[response_id]]
+            self.append({'op': 'set_response', 'response_id': response_id,
+                         'prefs': prefs, 'updated': room.updated})
+        return ret
+
+    def evict_rooms(self, room_ids):
+        rooms = super().evict_rooms(room_ids)
+        for room_id in rooms:
+            self.append({'op': 'evict_room', 'room_id': room_id})
+        return rooms
+
+
+class SqliteDB(MMDB):
+    # rooms and responses in sqlite tables, so a lookup reads only the rows
+    # it needs instead of keeping every room in memory
+
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS rooms (
+        room_id TEXT PRIMARY KEY,
+        mode TEXT NOT NULL,
+        players TEXT NOT NULL,
+        updated REAL
+    );
+    CREATE TABLE IF NOT EXISTS responses (
+        response_id TEXT PRIMARY KEY,
+        room_id TEXT NOT NULL REFERENCES rooms (room_id),
+        position INTEGER NOT NULL,
+        player TEXT NOT NULL,
+        prefs TEXT
+    );
+    CREATE INDEX IF NOT EXISTS responses_room ON responses (room_id);
+    '''
+
+    def __init__(self, fname='dump.sqlite3'):
+        super().__init__()
+        self.fname = fname
+        # transactions are begun by hand, see transaction()
+        self.conn = sqlite3.connect(fname, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        columns = [column for _, column, *_ in
+                   self.conn.execute('PRAGMA table_info(rooms)')]
+        if 'updated' not in columns:
+            # made before rooms were timed
+            self.conn.execute('ALTER TABLE rooms ADD COLUMN updated REAL')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS rooms_updated '
+                          'ON rooms (updated)')
+
+    @contextmanager
+    def transaction(self):
+        # takes the write lock up front so that reads made in the
+        # transaction can not go stale before the writes
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def reset(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM responses')
+            conn.execute('DELETE FROM rooms')
+
+    def create_room(self, players, mode='friend'):
+        with self.transaction() as conn:
+            room_id = None
+            # avoid collisions
+            while room_id is None or self.room_exists(room_id):
+                room_id = ''.join(random.choices(CHARSET, k=6))
+            conn.execute('INSERT INTO rooms (room_id, mode, players, '
+                         'updated) VALUES (?, ?, ?, ?)',
+                         (room_id, mode, json.dumps(players), time.time()))
+            for position, player in enumerate(players):
+                response_id = None
+                while (response_id is None or
+                       self.response_exists(response_id)):
+                    response_id = ''.join(random.choices(CHARSET, k=7))
+                conn.execute('INSERT INTO responses VALUES '
+                             '(?, ?, ?, ?, NULL)',
+                             (response_id, room_id, position, player))
+        return room_id
+
+    def get_room_info(self, room_id):
+        row = self.conn.execute('SELECT mode, players FROM rooms '
+                                'WHERE room_id = ?', (room_id,)).fetchone()
+        if row is None:
+            return None
+        mode, players = row
+        responses = self.conn.execute(
+            'SELECT response_id, player, prefs FROM responses '
+            'WHERE room_id = ? ORDER BY position', (room_id,)).fetchall()
+        return {
+            'mode': mode,
+            'players': json.loads(players),
+            'player_info': {player: json.loads(prefs) if prefs else None
+                            for _, player, prefs in responses},
+            'response_ids': {response_id: player
+                             for response_id, player, _ in responses}
+        }
+
+    def room_exists(self, room_id):
+        return self.conn.execute('SELECT 1 FROM rooms WHERE room_id = ?',
+                                 (room_id,)).fetchone() is not None
+
+    def set_response(self, response_id, prefs):
+        room_id = self.response_id_to_room(response_id)
+        if room_id is None:
+            return
+        with self.transaction() as conn:
+            conn.execute('UPDATE responses SET prefs = ? '
+                         'WHERE response_id = ?',
+                         (json.dumps(prefs), response_id))
+            conn.execute('UPDATE rooms SET updated = ? WHERE room_id = ?',
+                         (time.time(), room_id))
+
+    def response_exists(self, response_id):
+        return self.response_id_to_room(response_id) is not None
+
+    def response_id_to_room(self, response_id):
+        row = self.conn.execute('SELECT room_id FROM responses '
+                                'WHERE response_id = ?',
+                                (response_id,)).fetchone()
+        return row and row[0]
+
+    def response_id_to_player(self, response_id):
+        row = self.conn.execute('SELECT player FROM responses '
+                                'WHERE response_id = ?',
+                                (response_id,)).fetchone()
+        return row and row[0]
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        # rooms made before rooms were timed start from now
+        self.conn.execute('UPDATE rooms SET updated = ? '
+                          'WHERE updated IS NULL', (now,))
+        expired = set()
+        if idle_ttl:
+            expired.update(room_id for room_id, in self.conn.execute(
+                'SELECT room_id FROM rooms WHERE updated <= ?',
+                (now - idle_ttl,)))
+        if finished_ttl:
+            # every response is in
+            expired.update(room_id for room_id, in self.conn.execute(
+                'SELECT room_id FROM rooms WHERE updated <= ? AND '
+                'NOT EXISTS (SELECT 1 FROM responses '
+                'WHERE responses.room_id = rooms.room_id AND '
+                "(prefs IS NULL OR prefs = 'null'))",
+                (now - finished_ttl,)))
+        return list(expired)
+
+    def evict_rooms(self, room_ids):
+        rooms = {}
+        with self.transaction() as conn:
+            for room_id in room_ids:
+                room = self.get_room_info(room_id)
+                if room is None:
+                    continue
+                room['updated'] = conn.execute(
+                    'SELECT updated FROM rooms WHERE room_id = ?',
+                    (room_id,)).fetchone()[0]
+                conn.execute('DELETE FROM responses WHERE room_id = ?',
+                             (room_id,))
+                conn.execute('DELETE FROM rooms WHERE room_id = ?',
+                             (room_id,))
+                rooms[room_id] = room
+        return rooms
+
+    def import_dump(self, fname='dump.json'):
+        # copies the rooms of a SimpleFsDB dump in, returns how many
+        rooms, _ = json.load(open(fname))
+        with self.transaction() as conn:
+            for room_id, room in rooms.items():
+                conn.execute('INSERT OR REPLACE INTO rooms (room_id, mode, '
+                             'players, updated) VALUES (?, ?, ?, ?)',
+                             (room_id, room['mode'],
+                              json.dumps(room['players']),
+                              room.get('updated')))
+                positions = {p: i for i, p in enumerate(room['players'])}
+                for response_id, player in room['response_ids'].items():
+                    prefs = room['player_info'].get(player)
+                    conn.execute('INSERT OR REPLACE INTO responses '
+                                 'VALUES (?, ?, ?, ?, ?)',
+                                 (response_id, room_id, positions[player],
+                                  player,
+                                  json.dumps(prefs) if prefs else None))
+        return len(rooms)
+
+
+class RedisDB(MMDB):
+    # rooms in a redis server, shared by every worker and host using it
+    # each room is a hash, with the responses in a hash of their own so
+    # that players answering at the same time do not overwrite each other
+    # the client must be made with decode_responses=True
+
+    def __init__(self, url=None, client=None, prefix='mmv1:'):
+        super().__init__()
+        if client is None:
+            if redis is None:
+                raise ImportError('RedisDB needs the redis package')
+            client = redis.Redis.from_url(
+                url or os.environ.get('redis_url', 'redis://localhost:6379'),
+                decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        # response id -> json [room_id, player]
+        self.responses_key = prefix + 'responses'
+        # room id -> when the room last changed
+        self.updated_key = prefix + 'updated'
+        # whether rooms made before rooms were timed have been timed
+        self.timed = False
+
+    def room_key(self, room_id):
+        return f'{self.prefix}room:{room_id}'
+
+    def prefs_key(self, room_id):
+        return f'{self.prefix}prefs:{room_id}'
+
+    def reset(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def create_room(self, players, mode='friend'):
+        def create(pipe):
+            # avoid collisions, a room made by another worker in the
+            # meantime makes the transaction start over
+            while True:
+                room_id = ''.join(random.choices(CHARSET, k=6))
+                pipe.watch(self.room_key(room_id))
+                if not pipe.exists(self.room_key(room_id)):
+                    break
+            response_ids = {}
+            for player in players:
+                response_id = None
+                while (response_id is None or response_id in response_ids or
+                       pipe.hexists(self.responses_key, response_id)):
+                    response_id = ''.join(random.choices(CHARSET, k=7))
+                response_ids[response_id] = player
+            pipe.multi()
+            pipe.hset(self.room_key(room_id), mapping={
+                'mode': mode,
+                'players': json.dumps(players),
+                'response_ids': json.dumps(response_ids)
+            })
+            pipe.hset(self.responses_key, mapping={
+                response_id: json.dumps([room_id, player])
+                for response_id, player in response_ids.items()
+            })
+            pipe.zadd(self.updated_key, {room_id: time.time()})
+            return room_id
+        return self.client.transaction(create, self.responses_key,
+                                       value_from_callable=True)
+
+    def get_room_info(self, room_id):
+        with self.client.pipeline() as pipe:
+            pipe.hgetall(self.room_key(room_id))
+            pipe.hgetall(self.prefs_key(room_id))
+            room, prefs = pipe.execute()
+        if not room:
+            return None
+        players = json.loads(room['players'])
+        return {
+            'mode': room['mode'],
+            'players': players,
+            'player_info': {p: json.loads(prefs[p]) if p in prefs else None
+                            for p in players},
+            'response_ids': json.loads(room['response_ids'])
+        }
+
+    def room_exists(self, room_id):
+        return bool(self.client.exists(self.room_key(room_id)))
+
+    def set_response(self, response_id, prefs):
+        response = self.response(response_id)
+        if response is None:
+            return
+        room_id, player = response
+        with self.client.pipeline() as pipe:
+            pipe.hset(self.prefs_key(room_id), player, json.dumps(prefs))
+            pipe.zadd(self.updated_key, {room_id: time.time()})
+            pipe.execute()
+
+    def response(self, response_id):
+        response = self.client.hget(self.responses_key, response_id)
+        return response and json.loads(response)
+
+    def response_exists(self, response_id):
+        return bool(self.client.hexists(self.responses_key, response_id))
+
+    def response_id_to_room(self, response_id):
+        response = self.response(response_id)
+        return response and response[0]
+
+    def response_id_to_player(self, response_id):
+        response = self.response(response_id)
+        return response and response[1]
+
+    def expired_rooms(self, idle_ttl, finished_ttl, now):
+        if not self.timed:
+            # rooms made before rooms were timed start from now
+            prefix = self.room_key('')
+            room_ids = [key[len(prefix):]
+                        for key in self.client.scan_iter(prefix + '*')]
+            if room_ids:
+                self.client.zadd(self.updated_key,
+                                 {room_id: now for room_id in room_ids},
+                                 nx=True)
+            self.timed = True
+        expired = set()
+        if idle_ttl:
+            expired.update(self.client.zrangebyscore(
+                self.updated_key, '-inf', now - idle_ttl))
+        if finished_ttl:
+            for room_id in self.client.zrangebyscore(
+                    self.updated_key, '-inf', now - finished_ttl):
+                room = self.get_room_info(room_id)
+                if room is not None and all(room['player_info'].values()):
+                    expired.add(room_id)
+        return list(expired)
+
+    def evict_rooms(self, room_ids):
+        rooms = {}
+        for room_id in room_ids:
+            def evict(pipe):
+                room = self.get_room_info(room_id)
+                updated = pipe.zscore(self.updated_key, room_id)
+                pipe.multi()
+                pipe.zrem(self.updated_key, room_id)
+                if room is None:
+                    return None
+                pipe.delete(self.room_key(room_id), self.prefs_key(room_id))
+                pipe.hdel(self.responses_key, *room['response_ids'])
+                if updated is not None:
+                    room['updated'] = updated
+                return room
+            room = self.client.transaction(
+                evict, self.room_key(room_id), self.prefs_key(room_id),
+                value_from_callable=True)
+            if room is not None:
+                rooms[room_id] = room
+        return rooms
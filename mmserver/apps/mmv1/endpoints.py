@@ -1,16 +1,61 @@
 import json
+import os
 
 from flask import (Blueprint, Flask, Response, redirect,
                    request, url_for)
 from flask import render_template as _render_template
+from flask_socketio import emit
 
-from .db import SimpleFsDB
-from .teammaker import FriendMatcher, str2matcher
+from .. import socketio
+from ..archive import Archive, Sweeper
+from .cache import SuggestionCache, suggestion_key
+from .db import LogFsDB, RedisDB, SimpleFsDB, SqliteDB
+from .jobs import JobQueue
+from .teammaker import MAPPING, FriendMatcher, str2matcher, suggest
 
-DB = SimpleFsDB()
+# 'log' appends each change to a log instead of rewriting the whole dump
+DATABASES = {
+    'simple': SimpleFsDB,
+    'log': LogFsDB,
+    'sqlite': SqliteDB,
+    'redis': RedisDB
+}
+DB = DATABASES[os.environ.get('mmv1_db', 'simple')]()
+SUGGESTIONS = SuggestionCache(int(os.environ.get('mmv1_suggestion_cache',
+                                                 256)))
+# team generation runs on its own processes so the worker's event loop
+# (and every draft room on it) keeps going while teams are worked out
+JOBS = JobQueue(workers=int(os.environ.get('mmv1_match_workers', 2)),
+                limit=int(os.environ.get('mmv1_match_queue', 32)))
+# how long a request waits for its teams by default before getting back a
+# job to ask about later, and the longest it can ask to wait
+SUGGESTION_WAIT = 10
+MAX_SUGGESTION_WAIT = 30
+# alternatives worked out ahead of time for the room page, and the most
+# that can be asked for
+ROOM_ALTERNATIVES = 5
+MAX_ALTERNATIVES = 10
+# rooms unchanged for mmv1_room_ttl seconds, or for mmv1_finished_ttl once
+# every response is in, are moved to the archive
+SWEEPER = Sweeper(DB, Archive(os.environ.get('mmv1_archive',
+                                             'archive.jsonl.gz')),
+                  idle_ttl=float(os.environ.get('mmv1_room_ttl',
+                                                7 * 24 * 3600)),
+                  finished_ttl=float(os.environ.get('mmv1_finished_ttl',
+                                                    24 * 3600)),
+                  interval=float(os.environ.get('mmv1_sweep_interval', 600)))
+# rooms with a search streaming to a client, one at a time per room as the
+# streamed searches share the event loop with everything else
+STREAMING = set()
 app = Blueprint('mmv1', __name__, template_folder='templates')
 
 
+@app.before_app_request
+def start_sweeper():
+    # the background task can only start once the server is running
+    SWEEPER.start()
+
+
 def render_template(*args, **kwargs):
     # is this a hack or is it legit?
     # no idea!
@@ -31,10 +76,15 @@ def create_prompt():
 
 @app.route('/create', methods=['POST'])
 def create_go():
-    players = [request.form.get(f'p{i + 1}').strip() for i in range(10)]
-    if not all(players) or len(set(players)) != 10:
+    players = []
+    while request.form.get(f'p{len(players) + 1}') is not None:
+        players.append(request.form.get(f'p{len(players) + 1}').strip())
+    mode = request.form.get('mm_mode')
+    if (mode not in MAPPING or not all(players) or
+            len(set(players)) != len(players) or
+            not str2matcher(mode).valid_players(len(players))):
         return redirect(url_for('.index'))
-    room_id = DB.create_room(players, request.form.get('mm_mode'))
+    room_id = DB.create_room(players, mode)
     return redirect(url_for('.room_view', room_id=room_id))
 
 
@@ -48,7 +98,7 @@ def room_view(room_id):
                       for r, p in info['response_ids'].items())
     return render_template('view_room.html', info=info, room_id=room_id,
                            all_ready=all(info['player_info'].values()),
-                           copy_info=fecpy)
+                           copy_info=fecpy, alternatives=ROOM_ALTERNATIVES)
 
 
 @app.route('/room/<room_id>/quickrespond')
@@ -70,18 +120,143 @@ def api_room_suggest(room_id):
         return Response(json.dumps({'success': False,
                                     'reason': 'Not all players responded'}),
                         mimetype='text/plain')
-    # do matching
-    # prepare info for the matcher
-    prefs = []
-    for player in info['players']:
-        prefs.append(info['player_info'][player])
+    try:
+        k = min(max(int(request.args.get('k', 1)), 1), MAX_ALTERNATIVES)
+    except ValueError:
+        k = 1
+    # the report is only formatted for clients that show it
+    explain = request.args.get('explain', '0') not in ('', '0', 'false')
+    try:
+        wait = min(max(float(request.args.get('wait', SUGGESTION_WAIT)), 0),
+                   MAX_SUGGESTION_WAIT)
+    except ValueError:
+        wait = SUGGESTION_WAIT
+    key = suggestion_key(info, k, explain)
+    result = SUGGESTIONS.get(key)
+    if result is not None:
+        return Response(json.dumps(result), mimetype='text/plain')
+    job_id = JOBS.submit(key, suggest, info, k, explain, meta=room_id)
+    if job_id is None:
+        # shed the request rather than queue up more than the pool can do
+        return Response(json.dumps({'success': False,
+                                    'reason': 'Too busy, try again soon'}),
+                        status=503, headers={'Retry-After': '1'},
+                        mimetype='text/plain')
+    JOBS.wait(job_id, wait, sleep=socketio.sleep)
+    return job_response(job_id)
+
+
+@app.route('/api/job/<job_id>')
+def api_job(job_id):
+    return job_response(job_id)
+
+
+def job_response(job_id):
+    status, result = JOBS.status(job_id)
+    if status == 'done':
+        job = JOBS.get(job_id)
+        SUGGESTIONS.put(job['key'], result)
+        return Response(json.dumps(result), mimetype='text/plain')
+    if status == 'pending':
+        return Response(json.dumps({'success': False, 'pending': True,
+                                    'job': job_id,
+                                    'status_url': url_for('.api_job',
+                                                          job_id=job_id)}),
+                        status=202, mimetype='text/plain')
+    reason = ('Job does not exist' if status == 'unknown'
+              else 'Could not make teams')
+    return Response(json.dumps({'success': False, 'reason': reason}),
+                    status=404 if status == 'unknown' else 500,
+                    mimetype='text/plain')
+
+
+@socketio.on('mmv1_suggest')
+def socket_suggest(data):
+    if not isinstance(data, dict):
+        return
+    room_id = data.get('room_id')
+    info = DB.get_room_info(room_id)
+    if info is None or not all(info['player_info'].values()):
+        emit('mmv1_suggestion', {'success': False, 'done': True,
+                                 'reason': 'Not all players responded'})
+        return
+    if room_id in STREAMING:
+        emit('mmv1_suggestion', {'success': False, 'done': True,
+                                 'reason': 'Already searching'})
+        return
+    STREAMING.add(room_id)
+    socketio.start_background_task(stream_suggestions, request.sid,
+                                   room_id, info)
+
+
+def stream_suggestions(sid, room_id, info):
+    # sends each better split to the client as the search finds it, then
+    # the best one again with done set
+    # only matchers that search a node at a time stream, as the search runs
+    # here on the event loop, the rest are worked out on the job processes
+    # and sent once done
     matcher = str2matcher(info['mode'])()
-    (t1, t2), bonus_info = matcher.generate_teams(prefs)
-    team1 = [info['players'][x] for x in t1]
-    team2 = [info['players'][x] for x in t2]
-    return Response(json.dumps({'success': True, 'team1': team1,
-                                'team2': team2, 'facts': bonus_info}),
-                               mimetype='text/plain')
+
+    def names(team):
+        return [info['players'][x] for x in team]
+
+    try:
+        if not matcher.STREAMS:
+            result = room_suggestion(room_id, info)
+            if result is None:
+                raise RuntimeError(f'no teams for room {room_id}')
+            message = {key: result[key] for key in ('team1', 'team2', 'games')
+                       if key in result}
+            message['score'] = (result['alternatives'][0]['score']
+                                if result['alternatives'] else None)
+            socketio.emit('mmv1_suggestion',
+                          dict(message, success=True, done=True), room=sid)
+            return
+        prefs = [info['player_info'][player] for player in info['players']]
+        message = None
+        for teams, score in matcher.stream_teams(
+                prefs, pause=lambda: socketio.sleep(0)):
+            message = {'success': True, 'score': score,
+                       'team1': names(teams[0]), 'team2': names(teams[1])}
+            socketio.emit('mmv1_suggestion', dict(message, done=False),
+                          room=sid)
+        socketio.emit('mmv1_suggestion', dict(message, done=True), room=sid)
+    except Exception:
+        # the client stops waiting, and the error is still reported
+        socketio.emit('mmv1_suggestion',
+                      {'success': False, 'done': True,
+                       'reason': 'Could not make teams'}, room=sid)
+        raise
+    finally:
+        STREAMING.discard(room_id)
+
+
+def room_suggestion(room_id, info):
+    # the suggestions the room page asks for, from the cache or worked out
+    # on the job processes, or None if the pool is busy or the job failed
+    key = suggestion_key(info, ROOM_ALTERNATIVES, True)
+    result = SUGGESTIONS.get(key)
+    if result is not None:
+        return result
+    job_id = JOBS.submit(key, suggest, info, ROOM_ALTERNATIVES, True,
+                         meta=room_id)
+    if job_id is None:
+        return None
+    status, result = JOBS.wait(job_id, float('inf'), sleep=socketio.sleep)
+    if status != 'done':
+        return None
+    SUGGESTIONS.put(key, result)
+    return result
+
+
+def precompute_suggestion(room_id):
+    # run in the background once the last response is in, so the first
+    # request for teams from the room page is answered from the cache
+    # nothing is precomputed while the pool is busy with requests
+    info = DB.get_room_info(room_id)
+    if info is None or not all(info['player_info'].values()):
+        return
+    room_suggestion(room_id, info)
 
 
 @app.route('/respond')
@@ -108,6 +283,10 @@ def respond_submit(response_id):
     if not DB.response_exists(response_id):
         return redirect(url_for('.respond_prompt', error='Bad response ID'))
     room_info = DB.get_room_info(DB.response_id_to_room(response_id))
-    prefs = str2matcher(room_info['mode']).read_response(request.form)
+    prefs = str2matcher(room_info['mode']).read_response(
+        request.form, n_players=len(room_info['players']))
     DB.set_response(response_id, prefs)
+    room_id = DB.response_id_to_room(response_id)
+    if all(DB.get_room_info(room_id)['player_info'].values()):
+        socketio.start_background_task(precompute_suggestion, room_id)
     return redirect(url_for('.respond_prompt', error='Done!'))
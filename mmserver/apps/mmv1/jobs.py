@@ -0,0 +1,105 @@
+import atexit
+import multiprocessing
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+
+class JobQueue:
+    # runs jobs on a process pool so the event loop is never held up by
+    # them, jobs submitted with the same key while one is still around
+    # share it
+
+    def __init__(self, workers=2, limit=32, keep=256, context='spawn'):
+        self.workers = workers
+        # how the processes are started, 'spawn' starts them afresh instead
+        # of forking the server along with the threads it has by then
+        self.context = context
+        # most jobs waiting or running at once, more are turned away
+        self.limit = limit
+        # finished jobs kept around for their results
+        self.keep = keep
+        self.pool = None
+        # set once shut down, nothing is submitted after
+        self.closed = False
+        # job id -> {'key', 'future', 'submitted', 'meta'}
+        self.jobs = OrderedDict()
+        self.keys = {}
+        self.lock = Lock()
+
+    def unfinished(self):
+        return sum(not job['future'].done() for job in self.jobs.values())
+
+    def submit(self, key, fn, *args, meta=None):
+        # returns the id of the job, or None if the queue is full or shut
+        # down
+        with self.lock:
+            if self.closed:
+                return None
+            job_id = self.keys.get(key)
+            if job_id is not None:
+                future = self.jobs[job_id]['future']
+                if not future.done() or future.exception() is None:
+                    return job_id
+            if self.unfinished() >= self.limit:
+                return None
+            if self.pool is None:
+                # started on first use, after the server has forked
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.context))
+                atexit.register(self.shutdown)
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'key': key,
+                                 'future': self.pool.submit(fn, *args),
+                                 'submitted': time.time(),
+                                 'meta': meta}
+            self.keys[key] = job_id
+            self.forget_finished()
+            return job_id
+
+    def shutdown(self):
+        # jobs not started yet are dropped and the processes are not waited
+        # for, so that the server can exit while a job is running
+        with self.lock:
+            self.closed = True
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def forget_finished(self):
+        # drop the oldest finished jobs past the number that are kept
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job['future'].done()]
+        for job_id in finished[:max(0, len(finished) - self.keep)]:
+            job = self.jobs.pop(job_id)
+            if self.keys.get(job['key']) == job_id:
+                del self.keys[job['key']]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        # 'unknown', 'pending', 'failed' or 'done', and the result if done
+        job = self.get(job_id)
+        if job is None:
+            return 'unknown', None
+        future = job['future']
+        if not future.done():
+            return 'pending', None
+        if future.exception() is not None:
+            return 'failed', None
+        return 'done', future.result()
+
+    def wait(self, job_id, timeout, sleep=time.sleep, interval=0.05):
+        # polls rather than blocking on the future, so that an eventlet
+        # sleep can be passed in to let other greenlets run meanwhile
+        waited = 0
+        while True:
+            status, result = self.status(job_id)
+            if status != 'pending' or waited >= timeout:
+                return status, result
+            sleep(interval)
+            waited += interval
@@ -1,10 +1,16 @@
 from .friendmatcher import FriendMatcher
-from .rolematcher import RoleMatcher, RoleMatcherV2
+from .multimatcher import FriendMultiMatcher, RoleMultiMatcher
+from .rolematcher import (RoleMatcher, RoleMatcherAnneal, RoleMatcherV2,
+                          RoleMatcherV2Anneal)
 
 MATCHERS = [
     FriendMatcher,
     RoleMatcher,
-    RoleMatcherV2
+    RoleMatcherV2,
+    RoleMatcherAnneal,
+    RoleMatcherV2Anneal,
+    FriendMultiMatcher,
+    RoleMultiMatcher
 ]
 
 MAPPING = {
@@ -14,3 +20,28 @@ MAPPING = {
 
 def str2matcher(matcher_id):
     return MAPPING[matcher_id]
+
+
+def suggest(info, k=1, explain=False):
+    # teams for a room as /api/suggest gives them, run on the job processes
+    # so it is kept here, away from the server's modules
+    prefs = []
+    for player in info['players']:
+        prefs.append(info['player_info'][player])
+    matcher = str2matcher(info['mode'])(top_k=k)
+    teams, bonus_info = matcher.generate_teams(prefs, explain=explain)
+
+    def names(team):
+        return [info['players'][x] for x in team]
+
+    alternatives = [{'team1': names(a1), 'team2': names(a2), 'score': score}
+                    for (a1, a2), score in matcher.suggestions.results()]
+    if matcher.MULTI_GAME:
+        result = {'success': True, 'alternatives': alternatives,
+                  'games': [{'team1': names(t1), 'team2': names(t2)}
+                            for t1, t2 in teams]}
+    else:
+        result = {'success': True, 'team1': names(teams[0]),
+                  'team2': names(teams[1]), 'alternatives': alternatives}
+    result['facts' if explain else 'components'] = bonus_info
+    return result
@@ -0,0 +1,107 @@
+# Batch team generation over JSONL lobbies
+#
+#   python -m mmserver.apps.mmv1.teammaker lobbies.jsonl -o teams.jsonl
+#
+# every input line is {"mode": ..., "prefs": [...]} with prefs in the shape
+# the mode's read_response produces, and every output line holds the
+# teams (as player indices) and score components for the lobby on the same
+# input line, or with --explain the report of how the teams were scored
+# modes taking more than 10 players give a list of games instead
+# a line that can not be matched, blank ones included, gives an error
+# record, so output line n is always the result of input line n
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from . import str2matcher
+
+
+def match_line(line, explain=False):
+    if not line.strip():
+        return json.dumps({'error': 'Empty line'})
+    try:
+        record = json.loads(line)
+        matcher = str2matcher(record['mode'])()
+        teams, bonus_info = matcher.generate_teams(record['prefs'],
+                                                   explain=explain)
+        if matcher.MULTI_GAME:
+            result = {'games': [{'team1': t1, 'team2': t2}
+                                for t1, t2 in teams]}
+        else:
+            result = {'team1': teams[0], 'team2': teams[1]}
+        result['facts' if explain else 'components'] = bonus_info
+    except Exception as e:
+        result = {'error': f'{type(e).__name__}: {e}'}
+    return json.dumps(result)
+
+
+def match_lines(lines, explain=False):
+    return [match_line(line, explain) for line in lines]
+
+
+def chunked(lines, size):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(infile, outfile, workers=None, chunk_size=64, window=None,
+        explain=False):
+    # at most `window` chunks are in flight at once, and results are
+    # written as soon as the oldest chunk is done, so memory stays constant
+    # however many lobbies are streamed through
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 4
+    pending = deque()
+
+    def write_oldest():
+        outfile.writelines(f'{result}\n'
+                           for result in pending.popleft().result())
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunked(infile, chunk_size):
+            pending.append(pool.submit(match_lines, chunk, explain))
+            if len(pending) >= window:
+                write_oldest()
+        while pending:
+            write_oldest()
+    outfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mmserver.apps.mmv1.teammaker',
+        description='Generate teams for every lobby in a JSONL stream.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='JSONL file of {"mode", "prefs"} records '
+                             '(default: stdin)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='file to write the JSONL results to '
+                             '(default: stdout)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=64,
+                        help='lobbies sent to a worker at a time')
+    parser.add_argument('--window', type=int, default=None,
+                        help='chunks in flight at once '
+                             '(default: 4 per worker)')
+    parser.add_argument('--explain', action='store_true',
+                        help='write the report of how the teams were '
+                             'scored instead of the score components')
+    args = parser.parse_args(argv)
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    with infile, outfile:
+        run(infile, outfile, workers=args.workers, chunk_size=args.chunk_size,
+            window=args.window, explain=args.explain)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,88 @@
 # Base class for all matching algorithms
+from bisect import insort
 
 
 class Matcher:
 
     NAME = ''
+    # generate_teams gives a list of games instead of a single one
+    MULTI_GAME = False
+    # stream_teams(prefs, pause) yields (teams, score) every time the search
+    # finds better teams, the last being the best it found, calling pause
+    # between the steps of the search
+    STREAMS = False
 
     @staticmethod
     def get_query(room_info, response_id):
         pass
 
     @staticmethod
-    def read_response(response):
+    def read_response(response, n_players=10):
         pass
 
-    def __init__(self):
-        pass
+    @staticmethod
+    def valid_players(n_players):
+        # whether a room can be made with this many players
+        return n_players == 10
+
+    def __init__(self, top_k=1, min_diff=2):
+        # generate_teams collects up to top_k suggestions into
+        # self.suggestions, each differing from the others by at least
+        # min_diff players
+        self.top_k = top_k
+        self.min_diff = min_diff
+        self.suggestions = self.new_suggestions()
 
-    def generate_teams(self, prefs):
+    def generate_teams(self, prefs, explain=False):
+        # returns the teams and, with explain, a report of how they were
+        # scored, otherwise a dict of the numbers behind the score
         pass
+
+    def distance(self, teams_a, teams_b):
+        # number of players on a different team in the two suggestions
+        t1_a = set(teams_a[0])
+        return min(len(t1_a - set(teams_b[0])), len(t1_a - set(teams_b[1])))
+
+    def new_suggestions(self):
+        return TopSuggestions(self.top_k, self.min_diff, self.distance)
+
+
+class TopSuggestions:
+    # the k best suggestions offered during a search, keeping only the best
+    # of any that are fewer than min_diff apart
+
+    def __init__(self, k, min_diff, distance):
+        self.k = k
+        self.min_diff = min_diff
+        self.distance = distance
+        # (-score, n, teams), n breaks ties in the order they were offered
+        self.items = []
+        self.offered = 0
+
+    def threshold(self):
+        # score a suggestion has to beat to get in
+        if len(self.items) < self.k:
+            return float('-inf')
+        return -self.items[-1][0]
+
+    def offer(self, teams, score):
+        if score <= self.threshold():
+            return False
+        clashes = [item for item in self.items
+                   if self.distance(item[2], teams) < self.min_diff]
+        if any(-item[0] >= score for item in clashes):
+            return False
+        for item in clashes:
+            self.items.remove(item)
+        self.offered += 1
+        teams = (list(teams[0]), list(teams[1]))
+        insort(self.items, (-score, self.offered, teams))
+        del self.items[self.k:]
+        return True
+
+    def merge(self, other):
+        for teams, score in other.results():
+            self.offer(teams, score)
+
+    def results(self):
+        return [(teams, -score) for score, _, teams in self.items]
@@ -1,10 +1,27 @@
 import random
+from functools import lru_cache
 from itertools import combinations
 from math import log
 
+import numpy as np
+
 from .base import Matcher
 
 
+@lru_cache(maxsize=None)
+def team_splits(n_players):
+    # boolean mask of every split of the lobby into two equal teams
+    # player 0 is always put in the first team since the strategies are
+    # symmetric, which halves the number of splits to check
+    rest = range(1, n_players)
+    splits = [(0,) + c for c in combinations(rest, n_players // 2 - 1)]
+    mask = np.zeros((len(splits), n_players), dtype=bool)
+    for i, split in enumerate(splits):
+        mask[i, list(split)] = True
+    mask.setflags(write=False)
+    return mask
+
+
 class FriendMatcher(Matcher):
 
     NAME = 'friend'
@@ -25,10 +42,10 @@ class FriendMatcher(Matcher):
                  'respond_page_default.html', None)
 
     @staticmethod
-    def read_response(response):
+    def read_response(response, n_players=10):
         # we got a response to the query
-        res = [0] * 10
-        for i in range(10):
+        res = [0] * n_players
+        for i in range(n_players):
             try:
                 res[i] = max(0, int(response[str(i)]))
             except (KeyError, ValueError):
@@ -36,20 +53,56 @@ class FriendMatcher(Matcher):
         res = [x / max(1e-5, sum(res)) for x in res]
         return res
 
-    def __init__(self, epsilon=1e-5, strategy='fair'):
-        super().__init__()
+    # lobbies up to this size are small enough to score every split at once
+    MAX_VECTORIZED_PLAYERS = 16
+
+    def __init__(self, epsilon=1e-5, strategy='fair', engine='auto',
+                 top_k=1, min_diff=2):
+        super().__init__(top_k=top_k, min_diff=min_diff)
         self.epsilon = epsilon
         self.strategy = strategy
+        self.engine = engine
+        self.nodes_explored = 0
+
+    def generate_teams(self, prefs, explain=False):
+        engine = self.engine
+        if engine == 'auto':
+            engine = ('numpy' if len(prefs) <= self.MAX_VECTORIZED_PLAYERS
+                      else 'bnb')
+        search_fn = {
+            'python': self.brute_force_search,
+            'numpy': self.vectorized_search,
+            'bnb': self.branch_and_bound_search
+        }[engine]
+        self.suggestions = self.new_suggestions()
+        optimal_team, best_happiness = search_fn(prefs)
+        random.shuffle(optimal_team[0])
+        random.shuffle(optimal_team[1])
+        for teams, _ in self.suggestions.results():
+            random.shuffle(teams[0])
+            random.shuffle(teams[1])
+        if not explain:
+            components = {'happiness': [float(h) for h in best_happiness]}
+            if engine == 'bnb':
+                components['nodes_explored'] = self.nodes_explored
+            return optimal_team, components
+        if engine == 'bnb':
+            return optimal_team, (f'Best happiness: {best_happiness} '
+                                  f'({self.nodes_explored} nodes explored)')
+        return optimal_team, f'Best happiness: {best_happiness}'
 
-    def generate_teams(self, prefs):
+    def brute_force_search(self, prefs):
         strategy_fn = {
             'fair': self.fair_strategy,
             'utilitarian': self.utilitarian_strategy
         }[self.strategy]
+        n_players = len(prefs)
         best_happiness = (float('-inf'), float('-inf'))
         optimal_team = None
-        for players_t1 in combinations([i for i in range(10)], 5):
-            players_t2 = list({i for i in range(10)} - set(players_t1))
+        for players_t1 in combinations([i for i in range(n_players)],
+                                       n_players // 2):
+            players_t2 = list({i for i in range(n_players)} -
+                              set(players_t1))
             happiness_t1 = 0
             happiness_t2 = 0
             for player in players_t1:
@@ -58,13 +111,137 @@ class FriendMatcher(Matcher):
             for player in players_t2:
                 happiness_t2 += sum(prefs[player][teammate]
                                     for teammate in players_t2)
-            if (strategy_fn(happiness_t1, happiness_t2) >
-                    strategy_fn(*best_happiness)):
+            score = strategy_fn(happiness_t1, happiness_t2)
+            self.suggestions.offer((players_t1, players_t2), score)
+            if score > strategy_fn(*best_happiness):
                 best_happiness = (happiness_t1, happiness_t2)
                 optimal_team = (list(players_t1), players_t2)
-        random.shuffle(optimal_team[0])
-        random.shuffle(optimal_team[1])
-        return optimal_team, f'Best happiness: {best_happiness}'
+        return optimal_team, best_happiness
+
+    def vectorized_search(self, prefs):
+        strategy_fn = {
+            'fair': self.fair_strategy_batch,
+            'utilitarian': self.utilitarian_strategy_batch
+        }[self.strategy]
+        prefs = np.asarray(prefs, dtype=float)
+        mask_t1 = team_splits(len(prefs))
+        mask_t2 = ~mask_t1
+        # happiness of a team is the sum of prefs[i][j] over all i, j in it
+        # which is m @ prefs @ m.T for the team's mask m
+        m1 = mask_t1.astype(float)
+        m2 = mask_t2.astype(float)
+        happiness_t1 = ((m1 @ prefs) * m1).sum(axis=1)
+        happiness_t2 = ((m2 @ prefs) * m2).sum(axis=1)
+        scores = strategy_fn(happiness_t1, happiness_t2)
+        best = int(np.argmax(scores))
+        # going down the splits from best to worst, once there are top_k
+        # suggestions no later split can get in
+        for split in np.argsort(-scores, kind='stable'):
+            if len(self.suggestions.items) == self.top_k:
+                break
+            self.suggestions.offer((np.flatnonzero(mask_t1[split]).tolist(),
+                                    np.flatnonzero(mask_t2[split]).tolist()),
+                                   float(scores[split]))
+        optimal_team = (np.flatnonzero(mask_t1[best]).tolist(),
+                        np.flatnonzero(mask_t2[best]).tolist())
+        best_happiness = (float(happiness_t1[best]),
+                          float(happiness_t2[best]))
+        return optimal_team, best_happiness
+
+    def branch_and_bound_search(self, prefs):
+        # exact search for lobbies too big to enumerate
+        # players are assigned to a team one at a time and a branch is cut
+        # as soon as an upper bound on the happiness each team could still
+        # reach cannot beat the best split found so far
+        objective = {
+            'fair': lambda h1, h2: (log(max(h1, self.epsilon)) +
+                                    log(max(h2, self.epsilon))),
+            'utilitarian': lambda h1, h2: h1 + h2
+        }[self.strategy]
+        n_players = len(prefs)
+        # the second team gets the odd player out
+        team_sizes = (n_players // 2, n_players - n_players // 2)
+        # happiness only depends on which pairs share a team, so fold
+        # prefs[i][j] and prefs[j][i] together
+        pair = [[prefs[i][j] + prefs[j][i] if i != j else 0
+                 for j in range(n_players)] for i in range(n_players)]
+        self_pref = [prefs[i][i] for i in range(n_players)]
+        # players with the strongest ties are placed first so the bounds
+        # tighten quickly
+        order = sorted(range(n_players), key=lambda i: -sum(pair[i]))
+        # pair_bound[d][u][k] is the most player u could gain from k more
+        # teammates picked among the players not placed by depth d
+        # (halved, as each pair is counted from both ends)
+        pair_bound = []
+        for depth in range(n_players + 1):
+            rest = order[depth:]
+            bounds = {}
+            for u in rest:
+                gains = sorted((pair[u][v] / 2 for v in rest if v != u),
+                               reverse=True)
+                cumulative = [0]
+                for gain in gains:
+                    cumulative.append(cumulative[-1] + gain)
+                bounds[u] = cumulative
+            pair_bound.append(bounds)
+
+        teams = ([], [])
+        happiness = [0, 0]
+        # cross[t][u] is what player u would add to team t right now
+        cross = ([0] * n_players, [0] * n_players)
+        best = [float('-inf'), None, None]
+        nodes = [0]
+
+        def upper_bound(depth, team):
+            slots = team_sizes[team] - len(teams[team])
+            if not slots:
+                return happiness[team]
+            bounds = pair_bound[depth]
+            gains = sorted((cross[team][u] + self_pref[u] +
+                            bounds[u][min(slots - 1, len(bounds[u]) - 1)]
+                            for u in order[depth:]), reverse=True)
+            return happiness[team] + sum(gains[:slots])
+
+        def place(player, team, sign):
+            happiness[team] += sign * (cross[team][player] +
+                                       self_pref[player])
+            for u in range(n_players):
+                cross[team][u] += sign * pair[player][u]
+
+        def search(depth):
+            nodes[0] += 1
+            if depth == n_players:
+                score = objective(*happiness)
+                self.suggestions.offer(teams, score)
+                if score > best[0]:
+                    best[:] = [score, (teams[0].copy(), teams[1].copy()),
+                               tuple(happiness)]
+                return
+            # with top_k == 1 the threshold is the best score so far
+            threshold = self.suggestions.threshold()
+            if objective(upper_bound(depth, 0),
+                         upper_bound(depth, 1)) <= threshold:
+                return
+            player = order[depth]
+            # the strategies are symmetric so with teams of the same size
+            # the first player can be fixed to the first team
+            if depth == 0 and team_sizes[0] == team_sizes[1]:
+                choices = (0,)
+            else:
+                choices = sorted((0, 1), key=lambda t: -cross[t][player])
+            for team in choices:
+                if len(teams[team]) == team_sizes[team]:
+                    continue
+                teams[team].append(player)
+                place(player, team, 1)
+                search(depth + 1)
+                place(player, team, -1)
+                teams[team].pop()
+
+        search(0)
+        self.nodes_explored = nodes[0]
+        optimal_team = (sorted(best[1][0]), sorted(best[1][1]))
+        return optimal_team, best[2]
 
     def fair_strategy(self, happiness_1, happiness_2):
         return (log(max(happiness_1, self.epsilon)) +
@@ -73,3 +250,12 @@ class FriendMatcher(Matcher):
 
     def utilitarian_strategy(self, happiness_1, happiness_2):
         return happiness_1 + happiness_2 + random.random() / 100
+
+    def fair_strategy_batch(self, happiness_1, happiness_2):
+        return (np.log(np.maximum(happiness_1, self.epsilon)) +
+                np.log(np.maximum(happiness_2, self.epsilon)) +
+                np.random.random(happiness_1.shape) / 100)
+
+    def utilitarian_strategy_batch(self, happiness_1, happiness_2):
+        return (happiness_1 + happiness_2 +
+                np.random.random(happiness_1.shape) / 100)
@@ -0,0 +1,204 @@
+import random
+
+import numpy as np
+
+from .base import Matcher
+from .friendmatcher import FriendMatcher
+from .rolematcher import RoleMatcherV2, get_pool, pool_workers
+
+GAME_SIZE = 10
+
+
+def match_game(matcher, prefs, explain):
+    # runs in a worker process for lobbies with more than one game
+    return matcher.generate_teams(prefs, explain=explain)
+
+
+class MultiMatcher(Matcher):
+    # splits a lobby of any multiple of 10 players into games of 10, then
+    # runs GAME_MATCHER on every game
+    # the split is made in linear time: a quick first split, then a few
+    # passes that swap players between games when it scores them better
+
+    GAME_MATCHER = None
+    MULTI_GAME = True
+    # passes over the lobby when improving the split
+    REFINE_PASSES = 4
+
+    @classmethod
+    def get_query(cls, room_info, response_id):
+        return cls.GAME_MATCHER.get_query(room_info, response_id)
+
+    @classmethod
+    def read_response(cls, response, n_players=GAME_SIZE):
+        return cls.GAME_MATCHER.read_response(response, n_players=n_players)
+
+    @staticmethod
+    def valid_players(n_players):
+        return n_players >= GAME_SIZE and n_players % GAME_SIZE == 0
+
+    def __init__(self, workers=None, refine_passes=None, top_k=1,
+                 min_diff=2, **kwargs):
+        # kwargs go to the matcher of every game, alternatives are not
+        # collected across games so top_k is not passed on
+        super().__init__(top_k=top_k, min_diff=min_diff)
+        self.workers = workers
+        self.refine_passes = (self.REFINE_PASSES if refine_passes is None
+                              else refine_passes)
+        self.game_kwargs = kwargs
+
+    def generate_teams(self, prefs, explain=False):
+        if not self.valid_players(len(prefs)):
+            raise ValueError(f'{len(prefs)} players can not be split into '
+                             f'games of {GAME_SIZE}')
+        self.suggestions = self.new_suggestions()
+        games = self.partition(prefs, len(prefs) // GAME_SIZE)
+        matcher = self.GAME_MATCHER(**self.game_kwargs)
+        game_prefs = [self.game_prefs(prefs, game) for game in games]
+        workers = min(pool_workers(self.workers), len(games))
+        if workers == 1:
+            results = [match_game(matcher, p, explain) for p in game_prefs]
+        else:
+            results = list(get_pool(workers).map(
+                match_game, [matcher] * len(games), game_prefs,
+                [explain] * len(games)))
+        teams = [([game[p] for p in t1], [game[p] for p in t2])
+                 for game, ((t1, t2), _) in zip(games, results)]
+        if explain:
+            return teams, '\n'.join(f'Game {i + 1}\n======\n{facts}'
+                                    for i, (_, facts) in enumerate(results))
+        return teams, [facts for _, facts in results]
+
+    def partition(self, prefs, n_games):
+        # lists of player indices, one for each game
+        features = self.player_features(prefs)
+        games = self.initial_split(features, n_games)
+        if n_games > 1:
+            games = self.refine(features, games)
+        return [sorted(game) for game in games]
+
+    def refine(self, features, games):
+        # every player in turn tries swapping with each player of a random
+        # other game, and the best swap is kept if it scores the two games
+        # better than before
+        games = np.array(games)
+        n_games = len(games)
+        for _ in range(self.refine_passes):
+            swapped = False
+            for g, i in np.ndindex(games.shape):
+                h = (g + random.randrange(1, n_games)) % n_games
+                # every swap of player i of game g with a player of game h
+                new_g = np.repeat(games[g][None], GAME_SIZE, axis=0)
+                new_g[:, i] = games[h]
+                new_h = np.where(np.eye(GAME_SIZE, dtype=bool),
+                                 games[g][i], games[h][None])
+                before = self.score_games(features, games[[g, h]]).sum()
+                after = (self.score_games(features, new_g) +
+                         self.score_games(features, new_h))
+                best = int(np.argmax(after))
+                if after[best] > before + 1e-9:
+                    games[g], games[h] = new_g[best], new_h[best]
+                    swapped = True
+            if not swapped:
+                break
+        return games.tolist()
+
+    def player_features(self, prefs):
+        return np.asarray(prefs, dtype=float)
+
+    def initial_split(self, features, n_games):
+        players = list(range(len(features)))
+        random.shuffle(players)
+        return [players[g::n_games] for g in range(n_games)]
+
+    def score_games(self, features, games):
+        # how good a split into games is for each game in an integer array
+        # of games, the last axis holding the players of a game
+        pass
+
+    def game_prefs(self, prefs, game):
+        # prefs of the players in the game, in the form the game's matcher
+        # reads them
+        pass
+
+
+class FriendMultiMatcher(MultiMatcher):
+
+    NAME = 'friend-multi'
+    GAME_MATCHER = FriendMatcher
+
+    def player_features(self, prefs):
+        # how much each pair of players likes each other
+        prefs = np.asarray(prefs, dtype=float)
+        np.fill_diagonal(prefs, 0)
+        return prefs + prefs.T
+
+    def initial_split(self, features, n_games):
+        # the most liked players go first, each into the game that has
+        # the players they get along with best that still has room
+        games = [[] for _ in range(n_games)]
+        affinity = np.zeros((n_games, len(features)))
+        for player in np.argsort(-features.sum(axis=0), kind='stable'):
+            open_games = [g for g in range(n_games)
+                          if len(games[g]) < GAME_SIZE]
+            g = max(open_games,
+                    key=lambda g: (affinity[g, player], -len(games[g])))
+            games[g].append(int(player))
+            affinity[g] += features[player]
+        return games
+
+    def score_games(self, features, games):
+        return features[games[..., :, None],
+                        games[..., None, :]].sum(axis=(-1, -2))
+
+    def game_prefs(self, prefs, game):
+        # preferences for players outside the game are dropped and the
+        # rest normalised again
+        prefs = [[prefs[p][q] for q in game] for p in game]
+        return [[x / max(1e-5, sum(row)) for x in row] for row in prefs]
+
+
+class RoleMultiMatcher(MultiMatcher):
+
+    NAME = 'rolev2-multi'
+    GAME_MATCHER = RoleMatcherV2
+    # weight of how far a game's strength is from that of the lobby
+    STRENGTH_WEIGHT = 2
+
+    def player_features(self, prefs):
+        # skill at each role, then a rough strength from the skills and
+        # the average rating the player got from everyone else (0 to 2)
+        skills = np.array([p[:5] for p in prefs], dtype=float)
+        ratings = np.zeros(len(prefs))
+        for rater, response in enumerate(prefs):
+            others = [p for p in range(len(prefs)) if p != rater]
+            ratings[others] += response[5:]
+        ratings /= max(1, len(prefs) - 1)
+        strength = skills.mean(axis=1) + ratings * 3
+        return np.column_stack([skills, strength])
+
+    def initial_split(self, features, n_games):
+        # snake draft by strength so every game gets its share of the
+        # strongest and weakest players
+        order = np.argsort(-features[:, 5], kind='stable').tolist()
+        games = [[] for _ in range(n_games)]
+        for n, player in enumerate(order):
+            lap, g = divmod(n, n_games)
+            games[g if lap % 2 == 0 else n_games - 1 - g].append(player)
+        return games
+
+    def score_games(self, features, games):
+        # the second best skill at each role, so both teams can field
+        # someone there, less how far the game is from the average strength
+        skills = np.sort(features[games, :5], axis=-2)
+        coverage = skills[..., -2, :].sum(axis=-1)
+        strength = features[games, 5].mean(axis=-1)
+        spread = (strength - features[:, 5].mean()) ** 2
+        return coverage - spread * self.STRENGTH_WEIGHT
+
+    def game_prefs(self, prefs, game):
+        # only the ratings of players within the game are kept
+        def rating(p, q):
+            return prefs[p][5 + (q if q < p else q - 1)]
+        return [list(prefs[p][:5]) + [rating(p, q) for q in game if q != p]
+                for p in game]
@@ -1,9 +1,29 @@
+import atexit
+import multiprocessing
+import os
 import random
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache, partial
 from itertools import combinations, permutations
 from math import log, exp
 
+import numpy as np
+
 from .base import Matcher
 
+# role that each of the 10 slots (team 1 then team 2) plays
+SLOT_ROLES = np.array([0, 1, 2, 3, 4] * 2)
+# read_response gives role skills from 0 to 9, and RoleMatcherV2 adds peer
+# ratings summed over 9 players from 0 to 2
+SKILL_LEVELS = 10
+RATING_LEVELS = 19
+# every move of the greedy search swaps the players in two slots
+SWAP_MOVES = list(combinations(range(10), 2))
+SWAP_ORDERS = np.array([[b if i == a else a if i == b else i
+                         for i in range(10)] for a, b in SWAP_MOVES])
+
 
 # custom mathematical functions
 def sech2(x):
@@ -14,6 +34,151 @@ def sign(x):
     return -1 if x < 0 else 1
 
 
+# elementwise versions for numpy arrays
+def sech2_batch(x):
+    return 4 * np.exp(-2 * x) / (np.exp(-2 * x) + 1) ** 2
+
+
+def sign_batch(x):
+    return np.where(x < 0, -1, 1)
+
+
+# process pools shared by every matcher, keyed on their size
+POOLS = {}
+
+
+def pool_workers(workers):
+    # processes a search is spread over, a worker of a pool (a job, or one
+    # of the teammaker command) searches on its own instead of starting a
+    # pool inside the pool, which would ask for more cpus than there are
+    if multiprocessing.current_process().name != 'MainProcess':
+        return 1
+    return workers or os.cpu_count() or 1
+
+
+def get_pool(workers):
+    if workers not in POOLS:
+        # spawned rather than forked from whatever process asks, and shut
+        # down at exit without waiting for a search still running
+        pool = POOLS[workers] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+    return POOLS[workers]
+
+
+def run_restarts(matcher, prefs, restarts, deadline, seed):
+    # runs in a worker process: greedy descents from random starts until
+    # the restarts run out or the next one would not finish in time
+    if seed is not None:
+        random.seed(seed)
+    start = time.time()
+    best_teams, best_score = None, float('-inf')
+    for done in range(restarts):
+        if done and deadline is not None:
+            per_restart = (time.time() - start) / done
+            if time.time() + per_restart > deadline:
+                break
+        teams, score = matcher.greedy_search(prefs)
+        if score > best_score:
+            best_teams, best_score = teams, score
+    # the suggestions collected over all the restarts go back as well
+    return best_teams, best_score, matcher.suggestions.results()
+
+
+class TranspositionTable:
+    # bounded record of the team states a search has already expanded
+    # mirrored states (team 1 and team 2 swapped) share an entry as the
+    # strategies score them the same
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(t1, t2):
+        return min(tuple(t1) + tuple(t2), tuple(t2) + tuple(t1))
+
+    def get(self, t1, t2):
+        key = self.key(t1, t2)
+        score = self.entries.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return score
+
+    def put(self, t1, t2, score):
+        key = self.key(t1, t2)
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            # forget the least recently seen state
+            self.entries.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def logsum_tables(epsilon):
+    # every per-slot term of RoleMatcher.fair_logsum_strategy
+    skill = np.arange(SKILL_LEVELS, dtype=float)
+    log_happiness = np.log(skill + epsilon)
+    diff_softness = 2
+    soft = np.log(skill + diff_softness)
+    # [a, b] is the penalty for skills a and b in mirrored roles
+    diff_penalty = (soft[:, None] - soft[None, :]) ** 2 * 5
+    return log_happiness, diff_penalty
+
+
+@lru_cache(maxsize=None)
+def logsum_tables_v2(epsilon, ratings_weights):
+    # every per-slot term of RoleMatcherV2.fair_logsum_strategy
+    skill = np.arange(SKILL_LEVELS, dtype=float)
+    rating = np.arange(RATING_LEVELS, dtype=float)
+    skill_score = np.log((skill + epsilon) ** 2) + skill ** 0.75
+    # [slot, r] is rating r weighted for the slot
+    weighted = np.array(ratings_weights)[:, None] * rating[None, :]
+    # [a, b] is how much skill a could carry over skill b
+    carry = np.exp(skill / 4)
+    carry_potential = np.maximum(0, carry[:, None] - carry[None, :])
+    diff_softness = 2
+    soft = np.log(skill + diff_softness)
+    skill_diff = soft[:, None] - soft[None, :]
+    skill_penalty = skill_diff ** 2 * 5
+    skill_bias = skill_penalty * sign_batch(skill[:, None] - skill[None, :])
+    rating_diff = weighted[:, :, None] - weighted[:, None, :]
+    rating_penalty = 0.04 * np.abs(rating_diff) ** 1.5
+    rating_bias = rating_penalty * sign_batch(rating_diff)
+    # [slot, a, b, c, d] for skills a and b and ratings c and d in a
+    # mirrored slot
+    diffs = (skill_penalty[None, :, :, None, None] +
+             rating_penalty[:, None, None, :, :])
+    biases = (skill_bias[None, :, :, None, None] +
+              rating_bias[:, None, None, :, :])
+    for table in (skill_score, weighted, carry_potential, diffs, biases):
+        table.setflags(write=False)
+    return skill_score, weighted, carry_potential, diffs, biases
+
+
+@lru_cache(maxsize=None)
+def role_orders():
+    # every way of giving out the 5 roles within each split of the lobby
+    # player 0 always goes to team 1 as the strategies do not care which
+    # team is called which, so mirrored assignments are skipped
+    splits_t1 = [(0,) + c for c in combinations(range(1, 10), 4)]
+    splits_t2 = [tuple(i for i in range(10) if i not in t1)
+                 for t1 in splits_t1]
+    orders = np.array(list(permutations(range(5))))
+    # shape (splits, role orders, 5)
+    teams_1 = np.array(splits_t1)[:, orders]
+    teams_2 = np.array(splits_t2)[:, orders]
+    teams_1.setflags(write=False)
+    teams_2.setflags(write=False)
+    return teams_1, teams_2
+
+
 class RoleMatcher(Matcher):
 
     NAME = 'role'
@@ -37,7 +202,7 @@ class RoleMatcher(Matcher):
                 other_players)
 
     @staticmethod
-    def read_response(response):
+    def read_response(response, n_players=10):
         roles = ['top', 'jg', 'mid', 'adc', 'sup']
         values = []
         for role in roles:
@@ -47,74 +212,297 @@ class RoleMatcher(Matcher):
                 values.append(0)
         return values
 
-    def __init__(self, epsilon=1e-5, strategy='fair'):
-        super().__init__()
+    SEARCH = 'greedy'
+    MAX_SEARCH = 50
+    # stream_teams runs the greedy search deeper, so only the modes that
+    # search greedily stream
+    STREAMS = True
+    # nodes searched by stream_teams
+    STREAM_SEARCH = 2000
+    # values each column of the prefs can take for the table kernel
+    TABLE_LIMITS = [SKILL_LEVELS] * 5
+    # splits scored per numpy call by the exhaustive search
+    EXACT_CHUNK = 8
+    # starting and final temperature of the annealing search
+    ANNEAL_TEMPERATURE = (2.0, 0.01)
+
+    def __init__(self, epsilon=1e-5, strategy='fair', search=None,
+                 max_search=None, restarts=64, deadline=0.2, workers=None,
+                 table_size=4096, iterations=2000, chains=64, top_k=1,
+                 min_diff=2):
+        super().__init__(top_k=top_k, min_diff=min_diff)
         self.epsilon = epsilon
         self.strategy = strategy
+        self.search = search or self.SEARCH
+        self.max_search = max_search or self.MAX_SEARCH
+        # states expanded by the last greedy search, with hit/miss counts
+        self.table_size = table_size
+        self.transpositions = TranspositionTable(table_size)
+        # budget of the multistart and anneal searches, deadline is in
+        # seconds and can be None to only stop when the work runs out
+        self.restarts = restarts
+        self.deadline = deadline
+        self.workers = workers
+        self.iterations = iterations
+        self.chains = chains
+
+    def prepare_prefs(self, prefs):
+        return prefs
 
-    def generate_teams(self, prefs):
+    def generate_teams(self, prefs, explain=False):
         strategy_fn = {
             'fair': self.fair_logsum_strategy
         }[self.strategy]
+        search_fn = {
+            'greedy': self.greedy_search,
+            'multistart': self.multistart_search,
+            'anneal': self.anneal_search,
+            'exact': self.exhaustive_search
+        }[self.search]
+        prefs = self.prepare_prefs(prefs)
+        self.suggestions = self.new_suggestions()
+        best_teams, _ = search_fn(prefs)
+        if not explain:
+            # the numbers behind the score without formatting the report
+            components = {}
+            self.score_teams(best_teams[0], best_teams[1], prefs,
+                             strategy_fn, components=components)
+            return best_teams, components
+        bonus_info = []
+        self.score_teams(best_teams[0], best_teams[1], prefs, strategy_fn,
+                         print_fn=bonus_info.append, verbose=True)
+        return best_teams, '\n'.join(bonus_info)
+
+    def distance(self, teams_a, teams_b):
+        # number of slots (team and role) given to a different player
+        slots = teams_a[0] + teams_a[1]
+        return min(sum(a != b for a, b in zip(slots, t1 + t2))
+                   for t1, t2 in (teams_b, teams_b[::-1]))
+
+    def score_teams(self, t1, t2, prefs, strategy_fn, **kwargs):
+        return strategy_fn([prefs[p][i] for i, p in enumerate(t1)],
+                           [prefs[p][i] for i, p in enumerate(t2)],
+                           **kwargs)
+
+    def assignment_scorer(self, prefs):
+        # function scoring an integer array of assignments for the
+        # searches, the last axis holding the player in each of the 10 slots
+        prefs = np.asarray(prefs, dtype=float)
+        limits = np.array(self.TABLE_LIMITS)
+        if (self.strategy == 'fair' and np.all(prefs == np.round(prefs)) and
+                np.all((prefs >= 0) & (prefs < limits))):
+            # read_response only gives small integers, so every term can be
+            # looked up for each player in each slot instead of worked out
+            # for each assignment
+            tables = self.player_tables(prefs.astype(np.intp))
+            return partial(self.fair_logsum_table, tables)
+        strategy_fn = {
+            'fair': self.fair_logsum_batch
+        }[self.strategy]
+        return partial(self.score_assignments, prefs,
+                       strategy_fn=strategy_fn)
+
+    def score_assignments(self, prefs, assignments, strategy_fn):
+        # assignments is an integer array whose last axis holds the player
+        # in each of the 10 slots, prefs is a numpy array
+        happiness = prefs[assignments, SLOT_ROLES]
+        return strategy_fn(happiness[..., :5], happiness[..., 5:])
+
+    def stream_teams(self, prefs, pause=None):
+        # a deeper greedy search than generate_teams, yielding every better
+        # split as soon as it is found
+        prefs = self.prepare_prefs(prefs)
+        self.suggestions = self.new_suggestions()
+        yield from self.greedy_improvements(prefs, self.STREAM_SEARCH, pause)
+
+    def greedy_search(self, prefs):
+        for best_teams, best_score in self.greedy_improvements(
+                prefs, self.max_search):
+            pass
+        return best_teams, best_score
+
+    def greedy_improvements(self, prefs, max_search, pause=None):
+        # yields the starting split and then each split better than the
+        # last, pause is called after every node so that the caller can
+        # let other work run while the search goes on
+        score_fn = self.assignment_scorer(prefs)
         # we start with a random assortment of the two teams
         team1 = random.sample([i for i in range(10)], k=5)
         team2 = list({i for i in range(10)} - set(team1))
         random.shuffle(team2)
         # then we make changes to the teams and see
         # if some changes result in improvements to the teams
-        happiness_1 = [prefs[p][i] for i, p in enumerate(team1)]
-        happiness_2 = [prefs[p][i] for i, p in enumerate(team2)]
-        best_score = strategy_fn(happiness_1, happiness_2)
+        best_score = float(score_fn(np.array(team1 + team2)))
         best_teams = (team1, team2)
+        self.suggestions.offer(best_teams, best_score)
+        yield best_teams, best_score
+        self.transpositions = TranspositionTable(self.table_size)
         suggestions = self.dfs_greedy_search(team1, team2,
-            best_score, strategy_fn, prefs, max_search=50
+            best_score, score_fn, max_search=max_search,
+            table=self.transpositions
         )
         for suggest_t1, suggest_t2, score in suggestions:
+            self.suggestions.offer((suggest_t1, suggest_t2), score)
+            if pause is not None:
+                pause()
             if score <= best_score:
                 continue
             best_score = score
             best_teams = (suggest_t1, suggest_t2)
-        bonus_info = []
-        strategy_fn(
-            [prefs[p][i] for i, p in enumerate(best_teams[0])],
-            [prefs[p][i] for i, p in enumerate(best_teams[0])],
-            print_fn=bonus_info.append,
-            verbose=True
-        )
-        return best_teams, bonus_info[0]
+            yield best_teams, best_score
+
+    def multistart_search(self, prefs):
+        # spread greedy searches from many random starts over a process
+        # pool and keep the best one that came back before the deadline
+        workers = min(pool_workers(self.workers), self.restarts)
+        deadline = (time.time() + self.deadline
+                    if self.deadline is not None else None)
+        if workers == 1:
+            best_teams, best_score, _ = run_restarts(
+                self, prefs, self.restarts, deadline, None)
+            return best_teams, best_score
+        pool = get_pool(workers)
+        restarts = [self.restarts // workers +
+                    (i < self.restarts % workers) for i in range(workers)]
+        futures = [pool.submit(run_restarts, self, prefs, n, deadline,
+                               random.getrandbits(64))
+                   for n in restarts]
+        done, _ = wait(futures, timeout=self.deadline)
+        if not done:
+            # nothing finished in time, take whatever finishes first
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        results = [future.result() for future in done]
+        for _, _, suggestions in results:
+            for teams, score in suggestions:
+                self.suggestions.offer(teams, score)
+        best_teams, best_score, _ = max(results, key=lambda r: r[1])
+        return best_teams, best_score
+
+    def anneal_search(self, prefs):
+        # simulated annealing over the same swap moves as the greedy search
+        # worse moves are taken with a probability that shrinks as the
+        # temperature cools, which lets the search climb out of the local
+        # optima the greedy search stops at
+        # a population of independent chains is stepped together so each
+        # step is a single batched strategy call
+        score_fn = self.assignment_scorer(prefs)
+        rng = np.random.default_rng(random.getrandbits(64))
+        temperature_start, temperature_end = self.ANNEAL_TEMPERATURE
+        chains = np.arange(self.chains)[:, None]
+        assignments = np.argsort(rng.random((self.chains, 10)), axis=1)
+        scores = score_fn(assignments)
+        best = int(np.argmax(scores))
+        best_assignment = assignments[best].copy()
+        best_score = float(scores[best])
+        start = time.time()
+        for step in range(self.iterations):
+            progress = step / self.iterations
+            if self.deadline is not None:
+                elapsed = (time.time() - start) / self.deadline
+                if elapsed >= 1:
+                    break
+                progress = max(progress, elapsed)
+            temperature = (temperature_start *
+                           (temperature_end / temperature_start) ** progress)
+            moves = rng.integers(0, len(SWAP_ORDERS), self.chains)
+            candidates = assignments[chains, SWAP_ORDERS[moves]]
+            new_scores = score_fn(candidates)
+            accept = rng.random(self.chains) < np.exp(
+                np.minimum(new_scores - scores, 0) / temperature)
+            assignments[accept] = candidates[accept]
+            scores = np.where(accept, new_scores, scores)
+            for chain in np.flatnonzero(scores > self.suggestions.threshold()):
+                self.suggestions.offer((assignments[chain, :5].tolist(),
+                                        assignments[chain, 5:].tolist()),
+                                       float(scores[chain]))
+            best = int(np.argmax(scores))
+            if scores[best] > best_score:
+                best_assignment = assignments[best].copy()
+                best_score = float(scores[best])
+        return ((best_assignment[:5].tolist(), best_assignment[5:].tolist()),
+                best_score)
+
+    def exhaustive_search(self, prefs):
+        # score all 126 * 5! * 5! assignments, a few splits at a time
+        score_fn = self.assignment_scorer(prefs)
+        teams_1, teams_2 = role_orders()
+        n_orders = teams_1.shape[1]
+        best_score = float('-inf')
+        best_teams = None
+        for start in range(0, len(teams_1), self.EXACT_CHUNK):
+            chunk_1 = teams_1[start:start + self.EXACT_CHUNK]
+            chunk_2 = teams_2[start:start + self.EXACT_CHUNK]
+            # pair every role order of team 1 with every one of team 2
+            shape = (len(chunk_1), n_orders, n_orders, 5)
+            assignments = np.concatenate([
+                np.broadcast_to(chunk_1[:, :, None, :], shape),
+                np.broadcast_to(chunk_2[:, None, :, :], shape)
+            ], axis=-1).reshape(-1, 10)
+            scores = score_fn(assignments)
+            # only the best few of each chunk can make the suggestions
+            n_top = min(self.top_k * 32, len(scores))
+            top = np.argpartition(-scores, n_top - 1)[:n_top]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            for i in top[scores[top] > self.suggestions.threshold()]:
+                self.suggestions.offer((assignments[i, :5].tolist(),
+                                        assignments[i, 5:].tolist()),
+                                       float(scores[i]))
+            best = int(np.argmax(scores))
+            if scores[best] > best_score:
+                best_score = float(scores[best])
+                best_teams = (assignments[best, :5].tolist(),
+                              assignments[best, 5:].tolist())
+        return best_teams, best_score
 
     def team_transpose(self, t1, t2, move):
         t_new = t1 + t2
         t_new[move[0]], t_new[move[1]] = t_new[move[1]], t_new[move[0]]
         return t_new[:5], t_new[5:]
 
-    def dfs_greedy_search(self, t1, t2, current_score, strategy_fn, prefs,
-                          searched=None, max_search=5000, moves=None):
+    def dfs_greedy_search(self, t1, t2, current_score, score_fn,
+                          searched=None, max_search=5000, moves=None,
+                          table=None):
+        # score_fn comes from assignment_scorer so that all the swap moves
+        # out of a node are scored in a single call
+        # the search keeps its own stack as budgets in the thousands would
+        # go past the recursion limit
         searched = searched or [0]
-        searched[0] += 1
-        if searched[0] > max_search:
-            return
-        moves = moves or list(combinations([i for i in range(10)], 2))
-        move_scores = []
-        for move in moves:
-            t1_, t2_ = self.team_transpose(t1, t2, move)
-            h1 = [prefs[p][i] for i, p in enumerate(t1_)]
-            h2 = [prefs[p][i] for i, p in enumerate(t2_)]
-            move_scores.append((move, strategy_fn(h1, h2)))
-        move_scores.sort(key=lambda x: x[1], reverse=True)
-        for move, new_score in move_scores:
-            if new_score < current_score:
-                break
-            t1_new, t2_new = self.team_transpose(t1, t2, move)
-            yield from self.dfs_greedy_search(t1_new, t2_new, new_score,
-                                              strategy_fn, prefs,
-                                              searched=searched,
-                                              max_search=max_search,
-                                              moves=moves)
-        yield t1, t2, current_score
+        moves = SWAP_ORDERS if moves is None else moves
+        table = table if table is not None else TranspositionTable()
+
+        def expand(t1, t2, current_score):
+            # states reached again through another order of swaps are
+            # skipped and do not use up the budget
+            if table.get(t1, t2) is not None:
+                return None
+            table.put(t1, t2, current_score)
+            searched[0] += 1
+            if searched[0] > max_search:
+                return None
+            neighbours = np.array(t1 + t2)[moves]
+            move_scores = score_fn(neighbours)
+            # stable, so equal scores keep the order of the moves
+            order = np.argsort(-move_scores, kind='stable').tolist()
+            return [t1, t2, current_score, neighbours, move_scores, order]
+
+        node = expand(t1, t2, current_score)
+        stack = [node] if node is not None else []
+        while stack:
+            t1, t2, current_score, neighbours, move_scores, order = stack[-1]
+            if order:
+                move = order.pop(0)
+                new_score = float(move_scores[move])
+                if new_score >= current_score:
+                    neighbour = neighbours[move].tolist()
+                    node = expand(neighbour[:5], neighbour[5:], new_score)
+                    if node is not None:
+                        stack.append(node)
+                    continue
+            stack.pop()
+            yield t1, t2, current_score
 
     def fair_logsum_strategy(self, happiness_1, happiness_2, print_fn=None,
-                             verbose=False):
+                             verbose=False, components=None):
         print_fn = print_fn or (print if verbose else None)
         # adjust for team fairness
         t1_score = sum(log(h + self.epsilon) for h in happiness_1)
@@ -126,6 +514,13 @@ class RoleMatcher(Matcher):
         diff_penalty = sum((log(a + diff_softness) -
                             log(b + diff_softness)) ** 2 * 5
                            for a, b in zip(happiness_1, happiness_2))
+        if components is not None:
+            components.update({
+                'team_scores': [t1_score, t2_score],
+                'fairness_bonus': fairness_bonus,
+                'diff_penalty': diff_penalty,
+                'score': t1_score + t2_score + fairness_bonus - diff_penalty
+            })
         if print_fn is not None:
             diffs = [(log(a + diff_softness) -
                       log(b + diff_softness)) ** 2 * 5
@@ -145,6 +540,39 @@ class RoleMatcher(Matcher):
         # + random.random() / 100
         return (t1_score + t2_score + fairness_bonus - diff_penalty)
 
+    def fair_logsum_batch(self, happiness_1, happiness_2):
+        # fair_logsum_strategy over the last axis of numpy arrays
+        t1_score = np.log(happiness_1 + self.epsilon).sum(axis=-1)
+        t2_score = np.log(happiness_2 + self.epsilon).sum(axis=-1)
+        fairness_bonus = sech2_batch(t1_score - t2_score) * 5
+        diff_softness = 2
+        diff_penalty = ((np.log(happiness_1 + diff_softness) -
+                         np.log(happiness_2 + diff_softness)) ** 2 * 5
+                        ).sum(axis=-1)
+        return (t1_score + t2_score + fairness_bonus - diff_penalty)
+
+    def player_tables(self, prefs):
+        # per-slot terms of fair_logsum_strategy for every player, and
+        # every pair of players facing each other, in every slot
+        log_happiness, diff_penalty = logsum_tables(self.epsilon)
+        skills = prefs[:, :5].T
+        # [slot, player] and [slot, team 1 player, team 2 player]
+        solo = log_happiness[skills]
+        pair = diff_penalty[skills[:, :, None], skills[:, None, :]]
+        return solo.ravel(), pair.ravel()
+
+    def fair_logsum_table(self, tables, assignments):
+        # fair_logsum_batch from the tables of player_tables
+        solo, pair = tables
+        slots = np.arange(5)
+        team_1 = assignments[..., :5]
+        team_2 = assignments[..., 5:]
+        t1_score = solo[slots * 10 + team_1].sum(axis=-1)
+        t2_score = solo[slots * 10 + team_2].sum(axis=-1)
+        fairness_bonus = sech2_batch(t1_score - t2_score) * 5
+        diff_penalty = pair[slots * 100 + team_1 * 10 + team_2].sum(axis=-1)
+        return (t1_score + t2_score + fairness_bonus - diff_penalty)
+
 
 class RoleMatcherV2(RoleMatcher):
 
@@ -159,97 +587,54 @@ class RoleMatcherV2(RoleMatcher):
         return tuple(ret)
 
     @staticmethod
-    def read_response(response):
+    def read_response(response, n_players=10):
         values = super(RoleMatcherV2, RoleMatcherV2).read_response(response)
-        # append on judgement of other players named p0->p8
+        # append on judgement of the other players, named p0->p8 in a room
+        # of 10
         rating_keys = {
             'worse': 0,
             'unsure': 1,
             'better': 2,
             None: 1
         }
-        for i in range(9):
+        for i in range(n_players - 1):
             values.append(rating_keys[response.get(f'rate{i}')])
         return values
 
-    def __init__(self, *args):
-        super().__init__(*args)
+    MAX_SEARCH = 10
+    TABLE_LIMITS = [SKILL_LEVELS] * 5 + [RATING_LEVELS]
+    RATINGS_WEIGHTS = (1.0, 0.8, 1.0, 0.8, 0.5)
 
-    def generate_teams(self, prefs):
-        strategy_fn = {
-            'fair': self.fair_logsum_strategy
-        }[self.strategy]
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def prepare_prefs(self, prefs):
         prefs_ = [x[:5] for x in prefs]
         ratings = [x[5:] for x in prefs]
         for i, rating in enumerate(ratings):
             rating.insert(i, 0)
-        for player_num in range(10):
+        for player_num in range(len(prefs)):
             # get rating of each player based on the responses from peers
             peer_rating = sum(r[player_num] for r in ratings)
             prefs_[player_num].append(peer_rating)
-        prefs = prefs_
-        # we start with a random assortment of the two teams
-        team1 = random.sample([i for i in range(10)], k=5)
-        team2 = list({i for i in range(10)} - set(team1))
-        random.shuffle(team2)
-        # then we make changes to the teams and see
-        # if some changes result in improvements to the teams
-        happiness_1 = [prefs[p][i] for i, p in enumerate(team1)]
-        happiness_2 = [prefs[p][i] for i, p in enumerate(team2)]
-        ratings_1 = [prefs[p][5] for p in team1]
-        ratings_2 = [prefs[p][5] for p in team2]
-        best_score = strategy_fn(happiness_1, happiness_2,
-                                 ratings_1, ratings_2)
-        best_teams = (team1, team2)
-        suggestions = self.dfs_greedy_search(team1, team2,
-            best_score, strategy_fn, prefs, max_search=10
-        )
-        for suggest_t1, suggest_t2, score in suggestions:
-            if score <= best_score:
-                continue
-            best_score = score
-            best_teams = (suggest_t1, suggest_t2)
-        bonus_info = []
-        strategy_fn(
-            [prefs[p][i] for i, p in enumerate(best_teams[0])],
-            [prefs[p][i] for i, p in enumerate(best_teams[1])],
-            [prefs[p][5] for p in best_teams[0]],
-            [prefs[p][5] for p in best_teams[1]],
-            print_fn=bonus_info.append,
-            verbose=True
-        )
-        return best_teams, '\n'.join(bonus_info)
+        return prefs_
 
-    def dfs_greedy_search(self, t1, t2, current_score, strategy_fn, prefs,
-                          searched=None, max_search=5000, moves=None):
-        searched = searched or [0]
-        searched[0] += 1
-        if searched[0] > max_search:
-            return
-        moves = moves or list(combinations([i for i in range(10)], 2))
-        move_scores = []
-        for move in moves:
-            t1_, t2_ = self.team_transpose(t1, t2, move)
-            h1 = [prefs[p][i] for i, p in enumerate(t1_)]
-            h2 = [prefs[p][i] for i, p in enumerate(t2_)]
-            p1 = [prefs[p][5] for p in t1_]
-            p2 = [prefs[p][5] for p in t2_]
-            move_scores.append((move, strategy_fn(h1, h2, p1, p2)))
-        move_scores.sort(key=lambda x: x[1], reverse=True)
-        for move, new_score in move_scores:
-            if new_score < current_score:
-                break
-            t1_new, t2_new = self.team_transpose(t1, t2, move)
-            yield from self.dfs_greedy_search(t1_new, t2_new, new_score,
-                                              strategy_fn, prefs,
-                                              searched=searched,
-                                              max_search=max_search,
-                                              moves=moves)
-        yield t1, t2, current_score
+    def score_teams(self, t1, t2, prefs, strategy_fn, **kwargs):
+        return strategy_fn([prefs[p][i] for i, p in enumerate(t1)],
+                           [prefs[p][i] for i, p in enumerate(t2)],
+                           [prefs[p][5] for p in t1],
+                           [prefs[p][5] for p in t2],
+                           **kwargs)
+
+    def score_assignments(self, prefs, assignments, strategy_fn):
+        happiness = prefs[assignments, SLOT_ROLES]
+        ratings = prefs[assignments, 5]
+        return strategy_fn(happiness[..., :5], happiness[..., 5:],
+                           ratings[..., :5], ratings[..., 5:])
 
     def fair_logsum_strategy(self, happiness_1, happiness_2,
                              ratings_1, ratings_2, print_fn=None,
-                             verbose=False):
+                             verbose=False, components=None):
         print_fn = print_fn or (print if verbose else None)
         # adjust for team fairness based on lanes
         t1_score = sum(log((h + self.epsilon) ** 2) + h ** 0.75
@@ -259,7 +644,7 @@ class RoleMatcherV2(RoleMatcher):
         fairness_bonus = sech2(t1_score - t2_score) * 3
         # adjust for team fairness based on peer rated strength
         # ratings need to be weighted
-        ratings_weights = [1.0, 0.8, 1.0, 0.8, 0.5]
+        ratings_weights = list(self.RATINGS_WEIGHTS)
         ratings_1 = [a * b for a, b in zip(ratings_1, ratings_weights)]
         ratings_2 = [a * b for a, b in zip(ratings_2, ratings_weights)]
         t1_rating = sum(ratings_1)
@@ -278,7 +663,9 @@ class RoleMatcherV2(RoleMatcher):
         carry_potential_1[3] += carry_potential_1[4]
         carry_potential_2[3] += carry_potential_2[4]
         # normalise
-        factor = 10 / sum(carry_potential_1 + carry_potential_2)
+        # (nobody can carry when every mirrored pair is equally skilled)
+        carry_total = sum(carry_potential_1 + carry_potential_2)
+        factor = 10 / carry_total if carry_total else 0
         diff_softness = 2
         diffs = [((log(a + diff_softness) -
                    log(b + diff_softness)) ** 2 * 5,
@@ -294,6 +681,16 @@ class RoleMatcherV2(RoleMatcher):
                        else carry_potential_2[i]) * factor
                   for i, b in enumerate(biases)]
         diff_penalty += abs(sum(biases) * 0.5)
+        if components is not None:
+            components.update({
+                'team_scores': [t1_score, t2_score],
+                'team_ratings': [t1_rating, t2_rating],
+                'fairness_bonus': fairness_bonus,
+                'rating_fairness': rating_fairness,
+                'diff_penalty': diff_penalty,
+                'score': (t1_score + t2_score + fairness_bonus +
+                          rating_fairness - diff_penalty)
+            })
         if print_fn is not None:
             positives = t1_score + t2_score + fairness_bonus + rating_fairness
             r_rate1 = [round(x, 2) for x in ratings_1]
@@ -326,3 +723,105 @@ class RoleMatcherV2(RoleMatcher):
         # + random.random() / 100
         return (t1_score + t2_score + fairness_bonus + rating_fairness -
                 diff_penalty)
+
+    def fair_logsum_batch(self, happiness_1, happiness_2,
+                          ratings_1, ratings_2):
+        # fair_logsum_strategy over the last axis of numpy arrays
+        t1_score = (np.log((happiness_1 + self.epsilon) ** 2) +
+                    happiness_1 ** 0.75).sum(axis=-1) / 3
+        t2_score = (np.log((happiness_2 + self.epsilon) ** 2) +
+                    happiness_2 ** 0.75).sum(axis=-1) / 3
+        fairness_bonus = sech2_batch(t1_score - t2_score) * 3
+        ratings_weights = np.array(self.RATINGS_WEIGHTS)
+        ratings_1 = ratings_1 * ratings_weights
+        ratings_2 = ratings_2 * ratings_weights
+        t1_rating = ratings_1.sum(axis=-1)
+        t2_rating = ratings_2.sum(axis=-1)
+        rating_fairness = sech2_batch((t1_rating - t2_rating) / 2) ** 0.5 * 3
+        carry_1 = np.exp(happiness_1 / 4)
+        carry_2 = np.exp(happiness_2 / 4)
+        carry_potential_1 = np.maximum(0, carry_1 - carry_2)
+        carry_potential_2 = np.maximum(0, carry_2 - carry_1)
+        # supports carry less and can boost adc a bit
+        support = np.array([1, 1, 1, 1, 0.5])
+        boost = np.array([0, 0, 0, 1, 0])
+        carry_potential_1 = carry_potential_1 * support
+        carry_potential_2 = carry_potential_2 * support
+        carry_potential_1 += carry_potential_1[..., 4:] * boost
+        carry_potential_2 += carry_potential_2[..., 4:] * boost
+        carry_total = (carry_potential_1 + carry_potential_2).sum(axis=-1)
+        factor = np.divide(10, carry_total, out=np.zeros_like(carry_total),
+                           where=carry_total != 0)
+        diff_softness = 2
+        diffs_1 = (np.log(happiness_1 + diff_softness) -
+                   np.log(happiness_2 + diff_softness)) ** 2 * 5
+        diffs_2 = 0.04 * np.abs(ratings_1 - ratings_2) ** 1.5
+        diff_penalty = (diffs_1 + diffs_2).sum(axis=-1) * 0.5
+        biases = (diffs_1 * sign_batch(happiness_1 - happiness_2) +
+                  diffs_2 * sign_batch(ratings_1 - ratings_2))
+        biases = biases * np.where(biases >= 0, carry_potential_1,
+                                   carry_potential_2) * factor[..., None]
+        diff_penalty = diff_penalty + np.abs(biases.sum(axis=-1) * 0.5)
+        return (t1_score + t2_score + fairness_bonus + rating_fairness -
+                diff_penalty)
+
+    def player_tables(self, prefs):
+        (skill_score, weighted, carry_potential,
+         diffs, biases) = logsum_tables_v2(self.epsilon, self.RATINGS_WEIGHTS)
+        slots = np.arange(5)[:, None, None]
+        skills = prefs[:, :5].T
+        ratings = np.broadcast_to(prefs[:, 5], skills.shape)
+        # [slot, player, (skill score, weighted rating)]
+        solo = np.stack([skill_score[skills] / 3,
+                         weighted[slots[..., 0], ratings]], axis=-1)
+        # [slot, team 1 player, team 2 player, term], supports carry less
+        a, b = skills[:, :, None], skills[:, None, :]
+        c, d = ratings[:, :, None], ratings[:, None, :]
+        support = np.array([1, 1, 1, 1, 0.5])[:, None, None]
+        pair = np.stack([diffs[slots, a, b, c, d],
+                         biases[slots, a, b, c, d],
+                         carry_potential[a, b] * support,
+                         carry_potential[b, a] * support], axis=-1)
+        return solo.reshape(-1, 2), pair.reshape(-1, 4)
+
+    def fair_logsum_table(self, tables, assignments):
+        # fair_logsum_batch from the tables of player_tables
+        solo, pair = tables
+        slots = np.arange(5)
+        team_1 = assignments[..., :5]
+        team_2 = assignments[..., 5:]
+        solo_1 = solo[slots * 10 + team_1].sum(axis=-2)
+        solo_2 = solo[slots * 10 + team_2].sum(axis=-2)
+        t1_score, t2_score = solo_1[..., 0], solo_2[..., 0]
+        fairness_bonus = sech2_batch(t1_score - t2_score) * 3
+        t1_rating, t2_rating = solo_1[..., 1], solo_2[..., 1]
+        rating_fairness = sech2_batch((t1_rating - t2_rating) / 2) ** 0.5 * 3
+        pair = pair[slots * 100 + team_1 * 10 + team_2]
+        # support can boost adc a bit
+        boost = np.array([0, 0, 0, 1, 0])
+        carry_potential_1 = pair[..., 2] + pair[..., 4:, 2] * boost
+        carry_potential_2 = pair[..., 3] + pair[..., 4:, 3] * boost
+        carry_total = (carry_potential_1 + carry_potential_2).sum(axis=-1)
+        factor = np.divide(10, carry_total, out=np.zeros_like(carry_total),
+                           where=carry_total != 0)
+        diff_penalty = pair[..., 0].sum(axis=-1) * 0.5
+        biases = pair[..., 1]
+        biases = biases * np.where(biases >= 0, carry_potential_1,
+                                   carry_potential_2) * factor[..., None]
+        diff_penalty = diff_penalty + np.abs(biases.sum(axis=-1) * 0.5)
+        return (t1_score + t2_score + fairness_bonus + rating_fairness -
+                diff_penalty)
+
+
+class RoleMatcherAnneal(RoleMatcher):
+
+    NAME = 'role-anneal'
+    SEARCH = 'anneal'
+    STREAMS = False
+
+
+class RoleMatcherV2Anneal(RoleMatcherV2):
+
+    NAME = 'rolev2-anneal'
+    SEARCH = 'anneal'
+    STREAMS = False
@@ -0,0 +1,156 @@
+# writes the json dumps in the background, once for all the changes made
+# within a window, so that a burst of changes is written once
+# only the ids of the rooms changed are kept meanwhile, the dump is made
+# from the rooms the database holds when it is written
+import atexit
+import fcntl
+import json
+import os
+
+from . import socketio
+
+try:
+    # the file is written on a real thread, so that only the greenlet
+    # waiting for it is held up
+    from eventlet import tpool
+except ImportError:
+    tpool = None
+
+# 'batch' writes the changes of a window together, 'sync' writes every
+# change before the call that made it returns
+DURABILITY_MODES = ('batch', 'sync')
+
+
+class GroupWriter:
+
+    def __init__(self, fname, dump, index, window=0.2, durability='batch',
+                 on_write=None, room=None):
+        # dump() gives every room as a dict as in the dump, and index(rooms)
+        # is what goes next to them in the dump
+        # on_write(stat) is called with the stat of each dump written that
+        # holds nothing but the rooms of this process
+        # with room(room_id) given the dump is shared with other processes,
+        # it is read back under a lock before writing, and the rooms changed
+        # here, room(room_id) or None if removed, replace theirs
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f'durability must be one of {DURABILITY_MODES}')
+        self.fname = fname
+        self.dump = dump
+        self.index = index
+        self.window = window
+        self.durability = durability
+        self.on_write = on_write
+        self.room = room
+        # ids of the rooms changed since the last write, and of those of
+        # the write under way
+        self.dirty = set()
+        self.writing = None
+        # number of changes put and number of them written
+        self.queued = 0
+        self.written = 0
+        self.scheduled = False
+        # (inode, size, mtime) of the dump last written
+        self.stamp = None
+        atexit.register(self.flush, offload=False)
+
+    def put(self, room_ids):
+        self.dirty.update(room_ids)
+        self.queued += 1
+        if self.durability == 'sync' or socketio.server is None:
+            # without a server, as in the tools, there is no loop to write
+            # in the background from
+            self.flush()
+        else:
+            self.schedule()
+
+    def schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            socketio.start_background_task(self.run)
+
+    def changed(self):
+        # ids of the rooms changed here that are not written yet
+        return self.dirty | (self.writing or set())
+
+    def run(self):
+        # let the rest of a burst come in
+        socketio.sleep(self.window)
+        self.scheduled = False
+        try:
+            self.flush()
+        except OSError:
+            # tried again after the next window
+            self.schedule()
+
+    def flush(self, offload=True):
+        # returns once every change put so far is written
+        target = self.queued
+        while self.written < target:
+            if self.writing is not None and offload:
+                # another greenlet is writing, maybe from before the changes
+                socketio.sleep(0.01)
+                continue
+            self.write_changes(offload)
+
+    def write_changes(self, offload):
+        target = self.queued
+        # at exit that of a greenlet that will not finish is taken over
+        self.writing, self.dirty = self.changed(), set()
+        try:
+            if self.room is None:
+                rooms, changes = self.dump(), None
+            else:
+                # only the rooms changed, the rest is read back
+                rooms, changes = None, {room_id: self.room(room_id)
+                                        for room_id in self.writing}
+            if offload and tpool is not None and (
+                    getattr(socketio, 'async_mode', None) == 'eventlet'):
+                stat, merged = tpool.execute(self.write, rooms, changes)
+            else:
+                stat, merged = self.write(rooms, changes)
+        except BaseException:
+            self.dirty |= self.writing
+            raise
+        finally:
+            self.writing = None
+        self.written = max(self.written, target)
+        if not merged and self.on_write is not None:
+            self.on_write(stat)
+
+    def write(self, rooms, changes):
+        # returns the stat of the dump written, and whether it has rooms
+        # another process wrote since the last write here
+        if changes is None:
+            return self.replace(rooms), False
+        with open(self.fname + '.lock', 'w') as lock:
+            # nobody replaces the dump between reading it and replacing it
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            rooms, merged = self.read()
+            for room_id, room in changes.items():
+                if room is None:
+                    rooms.pop(room_id, None)
+                else:
+                    rooms[room_id] = room
+            return self.replace(rooms), merged
+
+    def read(self):
+        try:
+            stat = os.stat(self.fname)
+            rooms, _ = json.load(open(self.fname))
+        except FileNotFoundError:
+            return {}, self.stamp is not None
+        merged = self.stamp != (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        return rooms, merged
+
+    def replace(self, rooms):
+        # written to the side and moved over so that a crash leaves either
+        # the old dump or the new one
+        tmp_fname = f'{self.fname}.{os.getpid()}.tmp'
+        with open(tmp_fname, 'w') as f:
+            json.dump([rooms, self.index(rooms)], f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+            stat = os.fstat(f.fileno())
+        os.replace(tmp_fname, self.fname)
+        self.stamp = stat.st_ino, stat.st_size, stat.st_mtime_ns
+        return stat
@@ -0,0 +1,79 @@
+# the same calls made on two backends, to compare what they give back
+import json
+import random
+
+
+def comparable(room):
+    # secrets are random and the times differ between backends
+    room = json.loads(json.dumps(room))
+    room.pop('updated', None)
+    for guest in room.get('guests', {}).values():
+        guest.pop('secret')
+    return room
+
+
+def seeded(seed, fn, *args):
+    # every backend sees the same random numbers
+    random.seed(seed)
+    return fn(*args)
+
+
+def run_mm(db, seed):
+    # an mmv1 room filled in and another evicted, returns the room and
+    # what each call returned
+    rng = random.Random(seed)
+    players = [f'p{i}' for i in range(10)]
+    room_id = seeded(seed, db.create_room, players, 'rolev2')
+    other_id = seeded(seed + 1000, db.create_room, players[:2])
+    calls = []
+    info = db.get_room_info(room_id)
+    for response_id in rng.sample(sorted(info['response_ids']), 7):
+        db.set_response(response_id, [rng.randint(0, 9) for _ in range(14)])
+        calls.append(db.response_id_to_player(response_id))
+        calls.append(db.response_id_to_room(response_id))
+    db.set_response('NORESPONSE', [1])
+    calls.append(comparable(db.get_room_info(room_id)))
+    calls.append(list(db.evict_rooms([other_id])))
+    calls.append(db.room_exists(other_id))
+    return room_id, calls
+
+
+def run_draft(db, trial):
+    # a whole draft with a kick and a deleted room, returns the room and
+    # what each call returned
+    rng = random.Random(trial)
+    calls = []
+    room_id = seeded(trial, db.create_room)
+    other_id = seeded(trial + 1000, db.create_room)
+    secrets = {}
+    for i in range(11):
+        ok, secrets[f'guest{i}'] = db.add_guest(room_id, f'guest{i}')
+        calls.append(ok)
+    calls.append(db.add_guest(other_id, 'alone')[0])
+    calls.append(db.kick_user(secrets.pop('guest10')))
+    for name in rng.sample(sorted(secrets), 2):
+        calls.append(db.set_captain(secrets[name]))
+    seeded(rng.random(), db.advance_stage, room_id)
+    full = False
+    while not full:
+        args = (rng.randint(0, 30), rng.choice([0, 1, True, False]),
+                rng.randint(0, 1))
+        full = seeded(rng.random(), db.set_payment, room_id, *args)
+        calls.append(full)
+        calls.append(comparable(db.get_room_info(room_id)))
+    calls.append(sorted(db.secret_to_name(s) for s in secrets.values()))
+    db.delete_room(other_id)
+    calls.append(db.room_exists(other_id))
+    return room_id, calls
+
+
+def check_evict(open_db):
+    # evicted rooms are given back and gone, also when opened again
+    db = open_db()
+    room_id = db.create_room()
+    _, secret = db.add_guest(room_id, 'owner')
+    rooms = db.evict_rooms([room_id, 'NOROOM'])
+    assert list(rooms) == [room_id]
+    assert list(rooms[room_id]['guests']) == ['owner']
+    assert db.secret_to_room_id(secret) is None
+    assert not open_db().room_exists(room_id)
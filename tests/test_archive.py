@@ -0,0 +1,103 @@
+# idle and finished rooms are moved from the database to the archive
+import gzip
+import json
+import time
+
+import pytest
+
+from mmserver.apps.archive import Archive, Sweeper, main
+from mmserver.apps.draftv1 import db as draft_db
+from mmserver.apps.mmv1 import db as mm_db
+
+HOUR = 3600
+
+
+def mm_backends(tmp_path):
+    return {
+        'simple': lambda: mm_db.SimpleFsDB(str(tmp_path / 'mm.json'),
+                                           durability='sync'),
+        'sqlite': lambda: mm_db.SqliteDB(str(tmp_path / 'mm.sqlite3'))
+    }
+
+
+def draft_backends(tmp_path):
+    return {
+        'simple': lambda: draft_db.SimpleFsDB(str(tmp_path / 'draft.json'),
+                                              durability='sync'),
+        'sqlite': lambda: draft_db.SqliteDB(str(tmp_path /
+                                                'draft.sqlite3'))
+    }
+
+
+@pytest.mark.parametrize('backend', ['simple', 'sqlite'])
+def test_mm_expired_rooms(tmp_path, backend):
+    db = mm_backends(tmp_path)[backend]()
+    waiting = db.create_room(['a', 'b'])
+    finished = db.create_room(['a', 'b'])
+    for response_id in db.get_room_info(finished)['response_ids']:
+        db.set_response(response_id, [1, 1])
+    now = time.time()
+    assert db.expired_rooms(0, 0, now + 100 * HOUR) == []
+    assert db.expired_rooms(0, HOUR, now + 2 * HOUR) == [finished]
+    assert sorted(db.expired_rooms(4 * HOUR, HOUR, now + 5 * HOUR)) == sorted(
+        [waiting, finished])
+    assert db.expired_rooms(4 * HOUR, HOUR, now) == []
+
+
+@pytest.mark.parametrize('backend', ['simple', 'sqlite'])
+def test_draft_expired_rooms(tmp_path, backend):
+    db = draft_backends(tmp_path)[backend]()
+    waiting = db.create_room()
+    db.add_guest(waiting, 'owner')
+    now = time.time()
+    assert db.expired_rooms(0, HOUR, now + 2 * HOUR) == []
+    assert db.expired_rooms(4 * HOUR, HOUR, now + 5 * HOUR) == [waiting]
+
+
+@pytest.mark.parametrize('backend', ['simple', 'sqlite'])
+def test_sweep(tmp_path, backend):
+    open_db = mm_backends(tmp_path)[backend]
+    db = open_db()
+    room_ids = [db.create_room(['a', 'b']), db.create_room(['c', 'd'])]
+    infos = [db.get_room_info(room_id) for room_id in room_ids]
+    archive = Archive(str(tmp_path / 'archive.jsonl.gz'))
+    sweeper = Sweeper(db, archive, idle_ttl=HOUR, finished_ttl=0)
+    now = time.time()
+    assert sweeper.sweep(now + HOUR / 2) == 0
+    assert sweeper.sweep(now + 2 * HOUR) == 2
+    assert sweeper.sweep(now + 3 * HOUR) == 0
+    for room_id, info in zip(room_ids, infos):
+        assert not db.room_exists(room_id)
+        assert not open_db().room_exists(room_id)
+        for response_id in info['response_ids']:
+            assert db.response_id_to_room(response_id) is None
+        [record] = archive.query(room_id)
+        assert record['archived'] == now + 2 * HOUR
+        assert record['room']['players'] == info['players']
+
+
+def test_query(tmp_path, capsys):
+    fname = str(tmp_path / 'archive.jsonl.gz')
+    archive = Archive(fname)
+    assert list(archive.query()) == []
+    archive.append({'a': {'n': 1}, 'b': {'n': 2}}, now=10)
+    archive.append({}, now=15)
+    archive.append({'a': {'n': 3}}, now=20)
+    assert [r['room']['n'] for r in archive.query()] == [1, 2, 3]
+    assert [r['room']['n'] for r in archive.query('a')] == [1, 3]
+    assert [r['room']['n'] for r in archive.query(since=11)] == [3]
+    assert [r['room']['n'] for r in archive.query(until=20)] == [1, 2]
+    main([fname, '--room', 'b'])
+    assert json.loads(capsys.readouterr().out) == {
+        'room_id': 'b', 'archived': 10, 'room': {'n': 2}}
+
+
+def test_query_stops_at_a_cut_off_write(tmp_path):
+    fname = str(tmp_path / 'archive.jsonl.gz')
+    archive = Archive(fname)
+    archive.append({'a': {'n': 1}}, now=10)
+    cut_off = gzip.compress(json.dumps({'room_id': 'b', 'archived': 20,
+                                        'room': {'n': 2}}).encode() + b'\n')
+    with open(fname, 'ab') as f:
+        f.write(cut_off[:len(cut_off) // 2])
+    assert [r['room_id'] for r in archive.query()] == ['a']
@@ -0,0 +1,44 @@
+# suggestions are cached on the room's players and answers
+from mmserver.apps.mmv1.cache import SuggestionCache, suggestion_key
+
+
+def room(answers, players=('a', 'b', 'c'), mode='friend'):
+    return {'mode': mode, 'players': list(players),
+            'player_info': dict(zip(players, answers))}
+
+
+def test_key_follows_the_answers():
+    key = suggestion_key(room([[1], [2], [3]]))
+    assert suggestion_key(room([[1], [2], [3]])) == key
+    assert suggestion_key(room([[1], [2], [4]])) != key
+    assert suggestion_key(room([[1], [2], [3]], mode='role')) != key
+    assert suggestion_key(room([[1], [2], [3]]), k=5) != key
+    assert suggestion_key(room([[1], [2], [3]]), explain=True) != key
+
+
+def test_key_follows_the_players():
+    # the suggestions name the players
+    key = suggestion_key(room([[1], [2], [3]]))
+    assert suggestion_key(room([[1], [2], [3]], ('a', 'b', 'd'))) != key
+    assert suggestion_key(room([[2], [1], [3]], ('b', 'a', 'c'))) != key
+
+
+def test_changed_answers_miss():
+    cache = SuggestionCache()
+    info = room([[1], [2], [3]])
+    cache.put(suggestion_key(info), {'team1': ['a']})
+    assert cache.get(suggestion_key(info)) == {'team1': ['a']}
+    info['player_info']['c'] = [4]
+    assert cache.get(suggestion_key(info)) is None
+
+
+def test_least_recently_used_go_first():
+    cache = SuggestionCache(size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    cache.put('a', 4)
+    assert len(cache.entries) == 2 and cache.get('a') == 4
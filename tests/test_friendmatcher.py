@@ -0,0 +1,96 @@
+# the FriendMatcher engines find equally good splits
+import random
+from math import comb, log
+
+import pytest
+
+from mmserver.apps.mmv1.teammaker import FriendMatcher
+from mmserver.apps.mmv1.teammaker.friendmatcher import team_splits
+
+# the strategies add up to 0.01 of noise to break ties
+NOISE = 0.01
+
+
+def random_prefs(n_players, seed):
+    rng = random.Random(seed)
+    return [[rng.randint(0, 5) for _ in range(n_players)]
+            for _ in range(n_players)]
+
+
+def objective(strategy, happiness, epsilon=1e-5):
+    h1, h2 = happiness
+    if strategy == 'fair':
+        return log(max(h1, epsilon)) + log(max(h2, epsilon))
+    return h1 + h2
+
+
+def best(engine, strategy, prefs):
+    matcher = FriendMatcher(strategy=strategy, engine=engine)
+    teams, components = matcher.generate_teams(prefs)
+    assert sorted(teams[0] + teams[1]) == list(range(len(prefs)))
+    assert abs(len(teams[0]) - len(teams[1])) <= 1
+    return objective(strategy, components['happiness'])
+
+
+@pytest.mark.parametrize('strategy', ['fair', 'utilitarian'])
+@pytest.mark.parametrize('n_players', [4, 6, 8, 10])
+@pytest.mark.parametrize('seed', range(5))
+def test_numpy_agrees_with_python(strategy, n_players, seed):
+    prefs = random_prefs(n_players, seed)
+    assert best('numpy', strategy, prefs) == pytest.approx(
+        best('python', strategy, prefs), abs=2 * NOISE)
+
+
+@pytest.mark.parametrize('n_players', [4, 7, 10])
+def test_team_splits(n_players):
+    splits = team_splits(n_players)
+    # every split once, with player 0 in the first team
+    assert len({tuple(split) for split in splits}) == len(splits)
+    assert len(splits) == comb(n_players - 1, n_players // 2 - 1)
+    assert all(split[0] and split.sum() == n_players // 2
+               for split in splits)
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_happiness_matches_teams(engine):
+    prefs = random_prefs(10, 1)
+    teams, components = FriendMatcher(engine=engine).generate_teams(prefs)
+    # the teams are shuffled, so the happiness is matched either way
+    happiness = [sum(prefs[i][j] for i in team for j in team)
+                 for team in teams]
+    assert sorted(happiness) == sorted(components['happiness'])
+
+
+@pytest.mark.parametrize('strategy', ['fair', 'utilitarian'])
+@pytest.mark.parametrize('n_players', [4, 6, 8, 10, 14])
+@pytest.mark.parametrize('seed', range(3))
+def test_bnb_agrees_with_numpy(strategy, n_players, seed):
+    prefs = random_prefs(n_players, seed)
+    # branch and bound has no noise, so it gives the exact optimum
+    assert best('bnb', strategy, prefs) == pytest.approx(
+        best('numpy', strategy, prefs), abs=NOISE)
+
+
+def test_auto_engine_picks_bnb_for_big_lobbies():
+    matcher = FriendMatcher()
+    _, small = matcher.generate_teams(random_prefs(10, 0))
+    assert 'nodes_explored' not in small
+    teams, big = matcher.generate_teams(random_prefs(18, 0))
+    assert sorted(teams[0] + teams[1]) == list(range(18))
+    assert 0 < big['nodes_explored'] < comb(18, 9)
+
+
+@pytest.mark.parametrize('n_players', [5, 7, 11])
+def test_bnb_odd_lobby(n_players):
+    # the second team gets the odd player out
+    prefs = random_prefs(n_players, 2)
+    assert best('bnb', 'fair', prefs) == pytest.approx(
+        best('python', 'fair', prefs), abs=NOISE)
+
+
+def test_bnb_happiness_matches_teams():
+    prefs = random_prefs(12, 1)
+    teams, components = FriendMatcher(engine='bnb').generate_teams(prefs)
+    happiness = [sum(prefs[i][j] for i in team for j in team)
+                 for team in teams]
+    assert sorted(happiness) == sorted(components['happiness'])
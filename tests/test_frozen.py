@@ -0,0 +1,64 @@
+# one read-only snapshot of a room is handed out until the room changes
+import json
+import pickle
+
+import pytest
+
+from mmserver.apps.draftv1.db import SimpleFsDB as DraftFsDB
+from mmserver.apps.frozen import FrozenDict, FrozenList, freeze
+from mmserver.apps.mmv1.db import SimpleFsDB as MMFsDB
+
+ROOM = {'players': ['a', 'b'], 'info': {'a': [1, 2], 'b': None}, 'n': 1}
+
+
+def test_freeze_is_read_only():
+    frozen = freeze(ROOM)
+    changes = [lambda: frozen.update(n=2),
+               lambda: frozen.__setitem__('n', 2),
+               lambda: frozen.pop('n'),
+               lambda: frozen['players'].append('c'),
+               lambda: frozen['players'].sort(),
+               lambda: frozen['info']['a'].__setitem__(0, 5),
+               lambda: frozen['info'].clear()]
+    for change in changes:
+        with pytest.raises(TypeError):
+            change()
+    with pytest.raises(TypeError):
+        frozen['players'] += ['c']
+    assert frozen == ROOM
+
+
+def test_frozen_is_still_dicts_and_lists():
+    frozen = freeze(ROOM)
+    assert isinstance(frozen, dict) and isinstance(frozen['players'], list)
+    assert json.loads(json.dumps(frozen)) == ROOM
+    again = pickle.loads(pickle.dumps(frozen))
+    assert again == ROOM and isinstance(again, FrozenDict)
+    # shallow copies can be changed
+    assert type(frozen.copy()) is dict
+    assert type(frozen['players'][:]) is list
+    assert isinstance(frozen['info']['a'], FrozenList)
+
+
+def test_mm_snapshot_is_shared_until_a_change(tmp_path):
+    db = MMFsDB(str(tmp_path / 'dump.json'), durability='sync')
+    room_id = db.create_room(['a', 'b'])
+    info = db.get_room_info(room_id)
+    assert db.get_room_info(room_id) is info
+    response_id = next(iter(info['response_ids']))
+    db.set_response(response_id, [0, 5])
+    changed = db.get_room_info(room_id)
+    assert changed is not info
+    assert not any(info['player_info'].values())
+    assert [0, 5] in changed['player_info'].values()
+
+
+def test_draft_snapshot_is_shared_until_a_change(tmp_path):
+    db = DraftFsDB(str(tmp_path / 'dump.json'), durability='sync')
+    room_id = db.create_room()
+    info = db.get_room_info(room_id)
+    assert db.get_room_info(room_id) is info
+    assert db.all_rooms()[room_id] is info
+    db.add_guest(room_id, 'owner')
+    assert list(info['guests']) == []
+    assert list(db.get_room_info(room_id)['guests']) == ['owner']
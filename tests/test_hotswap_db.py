@@ -0,0 +1,83 @@
+# HotSwapDB keeps the rooms SimpleFsDB does, also for workers sharing a dump
+import multiprocessing
+
+import pytest
+from backend_runs import check_evict, comparable, run_draft
+
+from mmserver.apps.draftv1.db import HotSwapDB, SimpleFsDB
+
+ROOMS_EACH = 30
+
+
+def make_rooms(fname, queue):
+    db = HotSwapDB(fname, durability='sync')
+    room_ids = []
+    for _ in range(ROOMS_EACH):
+        room_id = db.create_room()
+        db.add_guest(room_id, 'owner')
+        room_ids.append(room_id)
+    queue.put(room_ids)
+
+
+def test_workers_keep_each_others_rooms(tmp_path):
+    fname = str(tmp_path / 'dump.json')
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    workers = [context.Process(target=make_rooms, args=(fname, queue))
+               for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    made = [room_id for _ in workers for room_id in queue.get(timeout=60)]
+    for worker in workers:
+        worker.join()
+    db = HotSwapDB(fname)
+    assert set(db.all_rooms()) == set(made)
+    assert all(list(room['guests']) == ['owner']
+               for room in db.all_rooms().values())
+
+
+def test_unwritten_rooms_survive_a_reload(tmp_path):
+    fname = str(tmp_path / 'dump.json')
+    a = HotSwapDB(fname, durability='sync')
+    b = HotSwapDB(fname, durability='sync')
+    room_a = a.create_room()
+    room_b = b.create_room()
+    assert a.room_exists(room_b) and b.room_exists(room_a)
+    assert set(a.all_rooms()) == set(b.all_rooms()) == {room_a, room_b}
+
+
+def test_changes_are_seen_by_the_other_workers_at_once(tmp_path,
+                                                        monkeypatch):
+    monkeypatch.setenv('draftv1_durability', 'batch')
+    fname = str(tmp_path / 'dump.json')
+    a = HotSwapDB(fname)
+    b = HotSwapDB(fname)
+    room_id = a.create_room()
+    ok, secret = a.add_guest(room_id, 'owner')
+    assert ok
+    assert b.secret_to_room_id(secret) == room_id
+    b.add_guest(room_id, 'guest')
+    assert list(a.get_room_info(room_id)['guests']) == ['owner', 'guest']
+
+
+def test_batched_writes_are_refused(tmp_path):
+    with pytest.raises(ValueError):
+        HotSwapDB(str(tmp_path / 'dump.json'), durability='batch')
+
+
+@pytest.mark.parametrize('trial', range(5))
+def test_matches_simple(tmp_path, trial):
+    simple = SimpleFsDB(str(tmp_path / 'simple.json'), durability='sync')
+    fname = str(tmp_path / 'dump.json')
+    room_a, calls_a = run_draft(simple, trial)
+    room_b, calls_b = run_draft(HotSwapDB(fname), trial)
+    assert room_a == room_b
+    assert calls_a == calls_b
+    reopened = HotSwapDB(fname)
+    assert (comparable(reopened.get_room_info(room_b)) ==
+            comparable(simple.get_room_info(room_a)))
+    assert list(reopened.all_rooms()) == [room_b]
+
+
+def test_evict(tmp_path):
+    check_evict(lambda: HotSwapDB(str(tmp_path / 'dump.json')))
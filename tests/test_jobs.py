@@ -0,0 +1,65 @@
+# JobQueue runs jobs on spawned processes, sharing and limiting them
+import math
+import os
+import time
+
+import pytest
+
+from mmserver.apps.mmv1.jobs import JobQueue
+from mmserver.apps.mmv1.teammaker import suggest
+
+
+@pytest.fixture
+def jobs():
+    queue = JobQueue(workers=1, limit=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_same_key_shares_a_job(jobs):
+    job_id = jobs.submit('key', time.sleep, 0.5)
+    assert jobs.submit('key', time.sleep, 0.5) == job_id
+    assert jobs.wait(job_id, 30) == ('done', None)
+    # a finished job is still shared for its result
+    assert jobs.submit('key', time.sleep, 0.5) == job_id
+
+
+def test_failed_job_is_run_again(jobs):
+    job_id = jobs.submit('key', math.sqrt, -1)
+    assert jobs.wait(job_id, 30) == ('failed', None)
+    again = jobs.submit('key', math.sqrt, 4)
+    assert again != job_id
+    assert jobs.wait(again, 30) == ('done', 2.0)
+
+
+def test_limit_turns_jobs_away(jobs):
+    first = jobs.submit('a', time.sleep, 1)
+    assert jobs.submit('b', time.sleep, 1) is not None
+    assert jobs.submit('c', time.sleep, 1) is None
+    jobs.wait(first, 30)
+    assert jobs.submit('c', math.sqrt, 9) is not None
+
+
+def test_unknown_job(jobs):
+    assert jobs.status('nope') == ('unknown', None)
+    assert jobs.get('nope') is None
+
+
+def test_nothing_is_submitted_after_shutdown(jobs):
+    jobs.shutdown()
+    assert jobs.submit('key', math.sqrt, 4) is None
+
+
+def test_workers_do_not_start_the_server(jobs, tmp_path, monkeypatch):
+    # the server would open dump.sqlite3 in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('mmv1_db', 'sqlite')
+    monkeypatch.setenv('draftv1_db', 'sqlite')
+    info = {'mode': 'friend', 'players': ['a', 'b', 'c', 'd'],
+            'player_info': {'a': [0, 5, 0, 0], 'b': [5, 0, 0, 0],
+                            'c': [0, 0, 0, 5], 'd': [0, 0, 5, 0]}}
+    status, result = jobs.wait(jobs.submit('key', suggest, info), 60)
+    assert status == 'done'
+    assert ({frozenset(result['team1']), frozenset(result['team2'])} ==
+            {frozenset('ab'), frozenset('cd')})
+    assert os.listdir(tmp_path) == []
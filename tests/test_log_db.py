@@ -0,0 +1,88 @@
+# LogFsDB gives back the rooms it logged when opened again
+import os
+
+import pytest
+from backend_runs import comparable, run_mm
+
+from mmserver.apps.mmv1.db import LogFsDB, SimpleFsDB
+
+PLAYERS = [f'p{i}' for i in range(10)]
+
+
+def make_rooms(db):
+    room_id = db.create_room(PLAYERS, 'rolev2')
+    gone_id = db.create_room(PLAYERS[:2])
+    for i, response_id in enumerate(db.get_room_info(room_id)
+                                    ['response_ids']):
+        db.set_response(response_id, [i] * 14)
+    db.evict_rooms([gone_id])
+    return room_id, gone_id
+
+
+def test_replay(tmp_path):
+    fname = str(tmp_path / 'dump.json')
+    db = LogFsDB(fname)
+    room_id, gone_id = make_rooms(db)
+    assert not os.path.isfile(fname)
+    replayed = LogFsDB(fname)
+    assert replayed.get_room_info(room_id) == db.get_room_info(room_id)
+    assert not replayed.room_exists(gone_id)
+    assert replayed.reverse_mapping == db.reverse_mapping
+
+
+def test_snapshot_empties_the_log(tmp_path):
+    fname = str(tmp_path / 'dump.json')
+    db = LogFsDB(fname, snapshot_every=5)
+    room_id, _ = make_rooms(db)
+    assert os.path.isfile(fname)
+    assert db.logged < 5
+    with open(fname + '.log') as f:
+        assert len(f.readlines()) == db.logged
+    replayed = LogFsDB(fname, snapshot_every=5)
+    assert replayed.get_room_info(room_id) == db.get_room_info(room_id)
+
+
+def test_log_replayed_over_its_own_snapshot(tmp_path):
+    # a crash between writing a snapshot and emptying the log replays
+    # records the snapshot already holds
+    fname = str(tmp_path / 'dump.json')
+    db = LogFsDB(fname)
+    room_id, _ = make_rooms(db)
+    with open(fname + '.log') as f:
+        log = f.read()
+    db.write_snapshot()
+    with open(fname + '.log', 'w') as f:
+        f.write(log)
+    replayed = LogFsDB(fname)
+    assert replayed.get_room_info(room_id) == db.get_room_info(room_id)
+    assert replayed.reverse_mapping == db.reverse_mapping
+
+
+def test_cut_off_record_is_dropped(tmp_path):
+    fname = str(tmp_path / 'dump.json')
+    db = LogFsDB(fname)
+    room_id, _ = make_rooms(db)
+    with open(fname + '.log', 'a') as f:
+        f.write('{"op": "create_room", "room_id": "CUTOF')
+    replayed = LogFsDB(fname)
+    assert replayed.get_room_info(room_id) == db.get_room_info(room_id)
+    # records written after the replay start on a line of their own
+    new_id = replayed.create_room(PLAYERS[:2])
+    again = LogFsDB(fname)
+    assert again.room_exists(new_id)
+    assert again.get_room_info(room_id) == db.get_room_info(room_id)
+
+
+@pytest.mark.parametrize('snapshot_every', [1000, 7])
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_simple(tmp_path, snapshot_every, seed):
+    simple = SimpleFsDB(str(tmp_path / 'simple.json'), durability='sync')
+    fname = str(tmp_path / 'dump.json')
+    room_a, calls_a = run_mm(simple, seed)
+    room_b, calls_b = run_mm(LogFsDB(fname, snapshot_every=snapshot_every),
+                             seed)
+    assert room_a == room_b
+    assert calls_a == calls_b
+    replayed = LogFsDB(fname, snapshot_every=snapshot_every)
+    assert (comparable(replayed.get_room_info(room_b)) ==
+            comparable(simple.get_room_info(room_a)))
@@ -0,0 +1,75 @@
+# the room objects give back the rooms of the json dumps they were made from
+import json
+
+import pytest
+
+from mmserver.apps.draftv1.models import Guest, Intent, Room
+from mmserver.apps.mmv1.models import MMRoom
+
+MM_ROOM = {
+    'mode': 'friend',
+    'players': ['a', 'b', 'c'],
+    'player_info': {'a': [0, 1, 2], 'b': None, 'c': [2, 1, 0]},
+    'response_ids': {'R1': 'a', 'R2': 'b', 'R3': 'c'},
+    'updated': 1700000000.5
+}
+
+DRAFT_ROOM = {
+    'order': ['owner', 'x', 'y'],
+    'guests': {name: {'owner': name == 'owner', 'coins': 100 - i,
+                      'captain': i, 'secret': f'S{i}'}
+               for i, name in enumerate(['owner', 'x', 'y'])},
+    'captains': ['x', 'y'],
+    'stage': 2,
+    'teams': [['x', 'owner'], ['y']],
+    'intents': [[[5, True], [None, None]]] + [[[None, None]] * 2] * 7,
+    'updated': 1700000000.5,
+    'draft_order': ['owner', 'z']
+}
+
+
+def without(room, *keys):
+    return {k: v for k, v in room.items() if k not in keys}
+
+
+@pytest.mark.parametrize('room', [MM_ROOM, without(MM_ROOM, 'updated')])
+def test_mm_round_trip(room):
+    assert MMRoom.from_dict(room).to_dict() == room
+
+
+@pytest.mark.parametrize('room', [
+    DRAFT_ROOM, without(DRAFT_ROOM, 'updated', 'draft_order')])
+def test_draft_round_trip(room):
+    # as read back from a json dump
+    assert Room.from_dict(json.loads(json.dumps(room))).to_dict() == room
+
+
+def test_mm_responses():
+    room = MMRoom.from_dict(MM_ROOM)
+    assert room.player('R3') == 'c'
+    room.set_response('R2', [1, 1, 1])
+    assert room.responses[1] == (1, 1, 1)
+    assert room.to_dict()['player_info']['b'] == [1, 1, 1]
+    # the dict given does not change with the room
+    assert MM_ROOM['player_info']['b'] is None
+    room.to_dict()['players'].append('d')
+    assert room.players == ['a', 'b', 'c']
+
+
+def test_new_draft_room():
+    room = Room()
+    assert room.to_dict() == {'order': [], 'guests': {}, 'captains': [],
+                              'stage': 0, 'teams': [[], []],
+                              'intents': [[[None, None]] * 2] * 8}
+    # every offer is an object of its own
+    room.intents[0][0].payment = 3
+    assert room.intents[1][0].payment is None
+
+
+@pytest.mark.parametrize('room', [MMRoom('friend', [], [], []), Room(),
+                                  Guest('S'), Intent()])
+def test_no_dict(room):
+    # the fields are slots, so a misspelt one is an error
+    assert not hasattr(room, '__dict__')
+    with pytest.raises(AttributeError):
+        room.misspelt = 1
@@ -0,0 +1,72 @@
+# the multi-game modes split a lobby into games of 10 and make teams in
+# every game
+import random
+
+import numpy as np
+import pytest
+
+from mmserver.apps.mmv1.teammaker import FriendMultiMatcher, RoleMultiMatcher
+
+
+def friend_prefs(n_players, seed):
+    rng = random.Random(seed)
+    return [[rng.randint(0, 5) for _ in range(n_players)]
+            for _ in range(n_players)]
+
+
+def role_prefs(n_players, seed):
+    rng = random.Random(seed)
+    return [[rng.randint(0, 9) for _ in range(5)] +
+            [rng.choice([0, 1, 2]) for _ in range(n_players - 1)]
+            for _ in range(n_players)]
+
+
+MATCHERS = [(FriendMultiMatcher, friend_prefs),
+            (RoleMultiMatcher, role_prefs)]
+
+
+def test_valid_players():
+    assert [n for n in range(41) if FriendMultiMatcher.valid_players(n)] == [
+        10, 20, 30, 40]
+
+
+@pytest.mark.parametrize('matcher_cls, make_prefs', MATCHERS)
+def test_lobby_must_split_into_games(matcher_cls, make_prefs):
+    with pytest.raises(ValueError):
+        matcher_cls(workers=1).generate_teams(make_prefs(15, 0))
+
+
+@pytest.mark.parametrize('matcher_cls, make_prefs', MATCHERS)
+@pytest.mark.parametrize('n_players', [10, 20, 30])
+def test_every_player_plays_once(matcher_cls, make_prefs, n_players):
+    games, facts = matcher_cls(workers=1).generate_teams(
+        make_prefs(n_players, n_players))
+    assert len(games) == len(facts) == n_players // 10
+    assert all(len(t1) == len(t2) == 5 for t1, t2 in games)
+    assert sorted(p for t1, t2 in games for p in t1 + t2) == list(
+        range(n_players))
+
+
+@pytest.mark.parametrize('matcher_cls, make_prefs', MATCHERS)
+def test_refined_split_scores_no_worse(matcher_cls, make_prefs):
+    matcher = matcher_cls(workers=1)
+    features = matcher.player_features(make_prefs(40, 1))
+    first = matcher.initial_split(features, 4)
+    refined = matcher.refine(features, [list(game) for game in first])
+    assert sorted(sum(refined, [])) == list(range(40))
+    assert (matcher.score_games(features, np.array(refined)).sum() >=
+            matcher.score_games(features, np.array(first)).sum() - 1e-9)
+
+
+@pytest.mark.parametrize('matcher_cls, make_prefs', MATCHERS)
+def test_explain(matcher_cls, make_prefs):
+    _, facts = matcher_cls(workers=1).generate_teams(make_prefs(20, 2),
+                                                     explain=True)
+    assert facts.startswith('Game 1\n')
+    assert '\nGame 2\n' in facts
+
+
+def test_games_on_the_pool():
+    prefs = friend_prefs(20, 3)
+    games, _ = FriendMultiMatcher(workers=2).generate_teams(prefs)
+    assert sorted(p for t1, t2 in games for p in t1 + t2) == list(range(20))
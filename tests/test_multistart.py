@@ -0,0 +1,46 @@
+# the multistart search runs its restarts on a spawned pool, or on its own
+# inside a pool worker
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from mmserver.apps.mmv1.teammaker import RoleMatcher, RoleMatcherV2
+from mmserver.apps.mmv1.teammaker.rolematcher import (get_pool,
+                                                        pool_workers)
+
+PREFS = [[(p * 3 + role * 7) % 10 for role in range(5)] for p in range(10)]
+
+
+def scored_teams(matcher_cls, workers):
+    matcher = matcher_cls(search='multistart', restarts=8, deadline=None,
+                          workers=workers, top_k=3)
+    prefs = PREFS if matcher_cls is RoleMatcher else [
+        row + [1] * 9 for row in PREFS]
+    teams, components = matcher.generate_teams([list(p) for p in prefs])
+    return matcher, teams, components
+
+
+@pytest.mark.parametrize('matcher_cls', [RoleMatcher, RoleMatcherV2])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_multistart(matcher_cls, workers):
+    matcher, teams, components = scored_teams(matcher_cls, workers)
+    assert sorted(teams[0] + teams[1]) == list(range(10))
+    results = matcher.suggestions.results()
+    assert len(results) == 3
+    # the teams given are the best suggestion, and score as reported
+    assert results[0][0] == (list(teams[0]), list(teams[1]))
+    assert components['score'] == pytest.approx(results[0][1])
+
+
+def test_pool_is_spawned():
+    pool = get_pool(2)
+    assert get_pool(2) is pool
+    assert pool._mp_context.get_start_method() == 'spawn'
+
+
+def test_no_pool_inside_a_pool_worker():
+    assert pool_workers(4) == 4
+    spawn = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+        assert pool.submit(pool_workers, 4).result() == 1
@@ -0,0 +1,91 @@
+# RedisDB against SimpleFsDB on an in-process redis stand-in
+import json
+import random
+
+import pytest
+
+from mmserver.apps.draftv1.db import RedisDB as DraftRedisDB
+from mmserver.apps.draftv1.db import SimpleFsDB as DraftFsDB
+from mmserver.apps.mmv1.db import RedisDB as MMRedisDB
+from mmserver.apps.mmv1.db import SimpleFsDB as MMFsDB
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+def redis_client():
+    # set_payment runs as a lua script, which needs lupa
+    pytest.importorskip('lupa')
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def comparable(room):
+    # secrets are random and the times differ between the two
+    room = json.loads(json.dumps(room))
+    room.pop('updated', None)
+    for guest in room.get('guests', {}).values():
+        guest.pop('secret')
+    return room
+
+
+def seeded(seed, fn, *args):
+    # both databases see the same random numbers
+    random.seed(seed)
+    return fn(*args)
+
+
+@pytest.mark.parametrize('trial', range(20))
+def test_draft_matches_simple(tmp_path, trial):
+    simple = DraftFsDB(str(tmp_path / 'dump.json'), durability='sync')
+    redis_db = DraftRedisDB(client=redis_client())
+    rng = random.Random(trial)
+    room_a = seeded(trial, simple.create_room)
+    room_b = seeded(trial, redis_db.create_room)
+    assert room_a == room_b
+    secrets = {}
+    for i in range(10):
+        ok_a, secret_a = simple.add_guest(room_a, f'guest{i}')
+        ok_b, secret_b = redis_db.add_guest(room_b, f'guest{i}')
+        assert ok_a and ok_b
+        secrets[f'guest{i}'] = secret_a, secret_b
+    for name in rng.sample(sorted(secrets), 2):
+        simple.set_captain(secrets[name][0])
+        redis_db.set_captain(secrets[name][1])
+    seed = rng.random()
+    seeded(seed, simple.advance_stage, room_a)
+    seeded(seed, redis_db.advance_stage, room_b)
+    full = False
+    while not full:
+        stage = simple.get_room_info(room_a)['stage']
+        assert 1 <= stage <= 8
+        args = (rng.randint(0, 30), rng.choice([0, 1, True, False]),
+                rng.randint(0, 1))
+        seed = rng.random()
+        full = seeded(seed, simple.set_payment, room_a, *args)
+        assert seeded(seed, redis_db.set_payment, room_b, *args) == full
+        assert (comparable(simple.get_room_info(room_a)) ==
+                comparable(redis_db.get_room_info(room_b)))
+    for name, (_, secret) in secrets.items():
+        assert redis_db.secret_to_name(secret) == name
+        assert redis_db.secret_to_room_id(secret) == room_b
+
+
+def test_set_payment_missing_room():
+    assert DraftRedisDB(client=redis_client()).set_payment(
+        'NOROOM', 5, True, 0) is None
+
+
+def test_mm_matches_simple(tmp_path):
+    simple = MMFsDB(str(tmp_path / 'dump.json'), durability='sync')
+    redis_db = MMRedisDB(client=fakeredis.FakeRedis(decode_responses=True))
+    players = [f'p{i}' for i in range(10)]
+    room_a = seeded(1, simple.create_room, players, 'rolev2')
+    room_b = seeded(1, redis_db.create_room, players, 'rolev2')
+    assert room_a == room_b
+    for response_id in simple.get_room_info(room_a)['response_ids']:
+        simple.set_response(response_id, [1, 2, 3])
+        redis_db.set_response(response_id, [1, 2, 3])
+        assert (redis_db.response_id_to_player(response_id) ==
+                simple.response_id_to_player(response_id))
+    assert (comparable(simple.get_room_info(room_a)) ==
+            comparable(redis_db.get_room_info(room_b)))
+    assert redis_db.get_room_info('NOROOM') is None
@@ -0,0 +1,197 @@
+# the role matchers score teams as the scalar strategies do, and their
+# searches find the best scored teams
+import random
+import time
+
+import numpy as np
+import pytest
+
+from mmserver.apps.mmv1.teammaker import (RoleMatcher, RoleMatcherAnneal,
+                                          RoleMatcherV2, RoleMatcherV2Anneal)
+from mmserver.apps.mmv1.teammaker.rolematcher import TranspositionTable
+
+MATCHERS = [RoleMatcher, RoleMatcherV2]
+
+
+def random_response(matcher, rng):
+    response = {role: str(rng.randint(0, 9))
+                for role in ('top', 'jg', 'mid', 'adc', 'sup')}
+    response.update({f'rate{i}': rng.choice(['worse', 'unsure', 'better'])
+                     for i in range(9)})
+    return matcher.read_response(response)
+
+
+def random_responses(matcher, seed):
+    rng = random.Random(seed)
+    return [random_response(matcher, rng) for _ in range(10)]
+
+
+def random_prefs(matcher, seed):
+    return matcher.prepare_prefs(random_responses(matcher, seed))
+
+
+def random_assignments(count, seed):
+    rng = np.random.default_rng(seed)
+    return np.array([rng.permutation(10) for _ in range(count)])
+
+
+def scalar_scores(matcher, prefs, assignments):
+    return [matcher.score_teams(list(a[:5]), list(a[5:]), prefs,
+                                matcher.fair_logsum_strategy)
+            for a in assignments.tolist()]
+
+
+def scalar_score(matcher, prefs, teams):
+    return matcher.score_teams(list(teams[0]), list(teams[1]), prefs,
+                               matcher.fair_logsum_strategy)
+
+
+@pytest.mark.parametrize('matcher_cls', MATCHERS)
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_matches_scalar(matcher_cls, seed):
+    matcher = matcher_cls()
+    prefs = random_prefs(matcher, seed)
+    assignments = random_assignments(50, seed)
+    batch = matcher.score_assignments(np.asarray(prefs, dtype=float),
+                                      assignments,
+                                      strategy_fn=matcher.fair_logsum_batch)
+    assert batch == pytest.approx(scalar_scores(matcher, prefs, assignments))
+
+
+@pytest.mark.parametrize('matcher_cls', MATCHERS)
+@pytest.mark.parametrize('seed', range(5))
+def test_table_matches_scalar(matcher_cls, seed):
+    matcher = matcher_cls()
+    prefs = random_prefs(matcher, seed)
+    assignments = random_assignments(50, seed)
+    tables = matcher.player_tables(np.asarray(prefs, dtype=np.intp))
+    table = matcher.fair_logsum_table(tables, assignments)
+    assert table == pytest.approx(scalar_scores(matcher, prefs, assignments))
+
+
+@pytest.mark.parametrize('matcher_cls', MATCHERS)
+def test_scorer_uses_the_tables_for_answers(matcher_cls):
+    matcher = matcher_cls()
+    prefs = random_prefs(matcher, 0)
+    assignments = random_assignments(20, 0)
+    # read_response only gives small integers, so the tables are used
+    scorer = matcher.assignment_scorer(prefs)
+    assert scorer.func == matcher.fair_logsum_table
+    assert scorer(assignments) == pytest.approx(
+        scalar_scores(matcher, prefs, assignments))
+    # anything else is worked out for each assignment
+    halved = (np.asarray(prefs, dtype=float) / 2).tolist()
+    scorer = matcher.assignment_scorer(halved)
+    assert scorer.func == matcher.score_assignments
+    assert scorer(assignments) == pytest.approx(
+        scalar_scores(matcher, halved, assignments))
+
+
+def test_batch_handles_equal_mirrored_skills():
+    # nobody can carry, which must not divide by zero
+    matcher = RoleMatcherV2()
+    happiness = np.full((1, 5), 4.0)
+    ratings = np.full((1, 5), 9.0)
+    batch = matcher.fair_logsum_batch(happiness, happiness, ratings, ratings)
+    scalar = matcher.fair_logsum_strategy([4.0] * 5, [4.0] * 5,
+                                          [9.0] * 5, [9.0] * 5)
+    assert batch == pytest.approx([scalar])
+
+
+@pytest.mark.parametrize('matcher_cls', MATCHERS)
+@pytest.mark.parametrize('seed', range(2))
+def test_exact_search_finds_the_best_teams(matcher_cls, seed):
+    matcher = matcher_cls(search='exact')
+    teams, components = matcher.generate_teams(
+        random_responses(matcher, seed))
+    assert sorted(teams[0] + teams[1]) == list(range(10))
+    prefs = random_prefs(matcher, seed)
+    assert components['score'] == pytest.approx(
+        scalar_score(matcher, prefs, teams))
+    # nothing else scores better, from random teams or a greedy search
+    others = scalar_scores(matcher, prefs, random_assignments(500, seed))
+    for _ in range(5):
+        greedy = matcher_cls(search='greedy')
+        others.append(greedy.generate_teams(
+            random_responses(matcher, seed))[1]['score'])
+    assert components['score'] >= max(others) - 1e-9
+
+
+def test_transpositions_share_mirrored_states():
+    table = TranspositionTable()
+    assert table.get([0, 1, 2, 3, 4], [5, 6, 7, 8, 9]) is None
+    table.put([0, 1, 2, 3, 4], [5, 6, 7, 8, 9], 1.5)
+    assert table.get([5, 6, 7, 8, 9], [0, 1, 2, 3, 4]) == 1.5
+    # the same players in other roles are another state
+    assert table.get([1, 0, 2, 3, 4], [5, 6, 7, 8, 9]) is None
+    assert (table.hits, table.misses) == (1, 2)
+
+
+def test_transpositions_forget_the_least_recent():
+    table = TranspositionTable(size=2)
+    states = [([i, 1, 2, 3, 4], [5, 6, 7, 8, 9 + i]) for i in range(3)]
+    table.put(*states[0], 0)
+    table.put(*states[1], 1)
+    table.get(*states[0])
+    table.put(*states[2], 2)
+    assert table.get(*states[1]) is None
+    assert table.get(*states[0]) == 0
+    assert table.get(*states[2]) == 2
+
+
+class RecordingTable(TranspositionTable):
+
+    def __init__(self):
+        super().__init__(size=10 ** 6)
+        self.expanded = []
+
+    def put(self, t1, t2, score):
+        self.expanded.append(self.key(t1, t2))
+        super().put(t1, t2, score)
+
+
+@pytest.mark.parametrize('matcher_cls', MATCHERS)
+def test_greedy_search_expands_each_state_once(matcher_cls):
+    matcher = matcher_cls()
+    prefs = random_prefs(matcher, 3)
+    score_fn = matcher.assignment_scorer(prefs)
+    t1, t2 = [0, 2, 4, 6, 8], [1, 3, 5, 7, 9]
+    table = RecordingTable()
+    searched = [0]
+    found = list(matcher.dfs_greedy_search(
+        t1, t2, float(score_fn(np.array(t1 + t2))), score_fn,
+        searched=searched, max_search=300, table=table))
+    assert len(table.expanded) == len(set(table.expanded))
+    # every state reached counts once towards the budget
+    assert len(table.expanded) == searched[0]
+    for found_t1, found_t2, score in found:
+        assert score == pytest.approx(
+            scalar_score(matcher, prefs, (found_t1, found_t2)))
+
+
+@pytest.mark.parametrize('matcher_cls', [RoleMatcherAnneal,
+                                         RoleMatcherV2Anneal])
+def test_anneal_search(matcher_cls):
+    matcher = matcher_cls(deadline=None, top_k=3)
+    teams, components = matcher.generate_teams(random_responses(matcher, 4))
+    assert sorted(teams[0] + teams[1]) == list(range(10))
+    prefs = random_prefs(matcher, 4)
+    assert components['score'] == pytest.approx(
+        scalar_score(matcher, prefs, teams))
+    assert components['score'] >= max(
+        scalar_scores(matcher, prefs, random_assignments(500, 4)))
+    results = matcher.suggestions.results()
+    assert len(results) == 3
+    assert [score for _, score in results] == sorted(
+        (score for _, score in results), reverse=True)
+    for suggestion, score in results:
+        assert score == pytest.approx(scalar_score(matcher, prefs,
+                                                   suggestion))
+
+
+def test_anneal_stops_at_the_deadline():
+    matcher = RoleMatcherAnneal(deadline=0.05, iterations=10 ** 7)
+    start = time.time()
+    teams, _ = matcher.generate_teams(random_responses(matcher, 5))
+    assert time.time() - start < 2
+    assert sorted(teams[0] + teams[1]) == list(range(10))
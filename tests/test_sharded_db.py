@@ -0,0 +1,60 @@
+# ShardedFsDB keeps the rooms SimpleFsDB does, one file for every room
+import os
+
+import pytest
+from backend_runs import check_evict, comparable, run_draft
+
+from mmserver.apps.draftv1.db import ShardedFsDB, SimpleFsDB
+
+
+@pytest.mark.parametrize('trial', range(5))
+def test_matches_simple(tmp_path, trial):
+    simple = SimpleFsDB(str(tmp_path / 'simple.json'), durability='sync')
+    dirname = str(tmp_path / 'rooms')
+    room_a, calls_a = run_draft(simple, trial)
+    room_b, calls_b = run_draft(ShardedFsDB(dirname), trial)
+    assert room_a == room_b
+    assert calls_a == calls_b
+    reopened = ShardedFsDB(dirname)
+    assert (comparable(reopened.get_room_info(room_b)) ==
+            comparable(simple.get_room_info(room_a)))
+    assert list(reopened.all_rooms()) == [room_b]
+    # the deleted room's file is gone too
+    assert os.listdir(dirname) == [room_b + '.json']
+
+
+def test_evict(tmp_path):
+    check_evict(lambda: ShardedFsDB(str(tmp_path / 'rooms')))
+
+
+def test_secrets_are_found_after_reopening(tmp_path):
+    dirname = str(tmp_path / 'rooms')
+    db = ShardedFsDB(dirname)
+    room_id = db.create_room()
+    _, secret = db.add_guest(room_id, 'owner')
+    reopened = ShardedFsDB(dirname)
+    assert reopened.secret_to_room_id(secret) == room_id
+    assert reopened.secret_to_name(secret) == 'owner'
+
+
+def test_corrupt_rooms_are_skipped(tmp_path):
+    dirname = str(tmp_path / 'rooms')
+    db = ShardedFsDB(dirname)
+    room_id = db.create_room()
+    with open(os.path.join(dirname, 'BROKEN.json'), 'w') as f:
+        f.write('{"stage": ')
+    with open(os.path.join(dirname, 'notes.txt'), 'w') as f:
+        f.write('not a room')
+    assert list(ShardedFsDB(dirname).all_rooms()) == [room_id]
+
+
+def test_import_dump(tmp_path):
+    fname = str(tmp_path / 'dump.json')
+    simple = SimpleFsDB(fname, durability='sync')
+    room_id, _ = run_draft(simple, 0)
+    db = ShardedFsDB(str(tmp_path / 'rooms'))
+    assert db.import_dump(fname) == 1
+    reopened = ShardedFsDB(str(tmp_path / 'rooms'))
+    assert reopened.get_room_info(room_id) == simple.get_room_info(room_id)
+    for guest in simple.get_room_info(room_id)['guests'].values():
+        assert reopened.secret_to_room_id(guest['secret']) == room_id
@@ -0,0 +1,73 @@
+# the SQLite backends keep the same rooms as SimpleFsDB, give them back when
+# opened again and import its dumps
+import pytest
+from backend_runs import check_evict, comparable, run_draft, run_mm
+
+from mmserver.apps.draftv1 import db as draft_db
+from mmserver.apps.migrate import main as migrate
+from mmserver.apps.mmv1 import db as mm_db
+
+
+@pytest.mark.parametrize('trial', range(10))
+def test_draft_matches_simple(tmp_path, trial):
+    simple = draft_db.SimpleFsDB(str(tmp_path / 'simple.json'),
+                                 durability='sync')
+    fname = str(tmp_path / 'draft.sqlite3')
+    room_a, calls_a = run_draft(simple, trial)
+    room_b, calls_b = run_draft(draft_db.SqliteDB(fname), trial)
+    assert room_a == room_b
+    assert calls_a == calls_b
+    reopened = draft_db.SqliteDB(fname)
+    assert (comparable(reopened.get_room_info(room_b)) ==
+            comparable(simple.get_room_info(room_a)))
+    assert list(reopened.all_rooms()) == [room_b]
+
+
+def test_draft_evict(tmp_path):
+    check_evict(lambda: draft_db.SqliteDB(str(tmp_path / 'draft.sqlite3')))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_mm_matches_simple(tmp_path, seed):
+    simple = mm_db.SimpleFsDB(str(tmp_path / 'simple.json'),
+                              durability='sync')
+    fname = str(tmp_path / 'mm.sqlite3')
+    room_a, calls_a = run_mm(simple, seed)
+    room_b, calls_b = run_mm(mm_db.SqliteDB(fname), seed)
+    assert room_a == room_b
+    assert calls_a == calls_b
+    assert (comparable(mm_db.SqliteDB(fname).get_room_info(room_b)) ==
+            comparable(simple.get_room_info(room_a)))
+
+
+def test_migrate(tmp_path):
+    draft = draft_db.SimpleFsDB(str(tmp_path / 'dump_draftv1.json'),
+                                durability='sync')
+    mm = mm_db.SimpleFsDB(str(tmp_path / 'dump.json'), durability='sync')
+    draft_id, _ = run_draft(draft, 0)
+    mm_id, _ = run_mm(mm, 0)
+    migrate(['--mmv1', str(tmp_path / 'dump.json'),
+             '--mmv1-db', str(tmp_path / 'dump.sqlite3'),
+             '--draftv1', str(tmp_path / 'dump_draftv1.json'),
+             '--draftv1-db', str(tmp_path / 'dump_draftv1.sqlite3')])
+    for imported, room_id, db in (
+            (draft_db.SqliteDB(str(tmp_path / 'dump_draftv1.sqlite3')),
+             draft_id, draft),
+            (mm_db.SqliteDB(str(tmp_path / 'dump.sqlite3')), mm_id, mm)):
+        assert (comparable(imported.get_room_info(room_id)) ==
+                comparable(db.get_room_info(room_id)))
+        # the time of the last change is kept for the sweeper
+        assert (imported.evict_rooms([room_id])[room_id]['updated'] ==
+                db.get_room_info(room_id)['updated'])
+
+
+def test_migrate_keeps_secrets(tmp_path):
+    # guests can come back to their room after the move
+    fname = str(tmp_path / 'dump_draftv1.json')
+    draft = draft_db.SimpleFsDB(fname, durability='sync')
+    room_id, _ = run_draft(draft, 1)
+    imported = draft_db.SqliteDB(str(tmp_path / 'draft.sqlite3'))
+    assert imported.import_dump(fname) == 1
+    for name, guest in draft.get_room_info(room_id)['guests'].items():
+        assert imported.secret_to_room_id(guest['secret']) == room_id
+        assert imported.secret_to_name(guest['secret']) == name
@@ -0,0 +1,86 @@
+# suggestions sent over socket.io, streamed from the greedy role modes and
+# worked out on the job processes for the rest
+import random
+
+import pytest
+
+PLAYERS = [f'p{i}' for i in range(10)]
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    # the databases are opened in the working directory on import
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp('server'))
+        patch.setenv('mmv1_durability', 'sync')
+        from mmserver import app
+        from mmserver.apps import socketio
+        from mmserver.apps.mmv1 import endpoints
+        yield app, socketio, endpoints
+        endpoints.JOBS.shutdown()
+
+
+def make_room(endpoints, mode):
+    rng = random.Random(mode)
+    room_id = endpoints.DB.create_room(PLAYERS, mode)
+    matcher_cls = endpoints.str2matcher(mode)
+    for response_id in endpoints.DB.get_room_info(room_id)['response_ids']:
+        response = {role: rng.randint(0, 9)
+                    for role in ('top', 'jg', 'mid', 'adc', 'sup')}
+        response.update({str(i): rng.randint(0, 5) for i in range(10)})
+        endpoints.DB.set_response(response_id,
+                                  matcher_cls.read_response(response))
+    return room_id
+
+
+def suggestions(server, room_id, timeout=60):
+    # every message sent for the room until the one with done set
+    app, socketio, _ = server
+    client = socketio.test_client(app)
+    client.emit('mmv1_suggest', {'room_id': room_id})
+    messages = []
+    waited = 0
+    while not (messages and messages[-1]['done']):
+        assert waited < timeout
+        socketio.sleep(0.05)
+        waited += 0.05
+        messages += [message['args'][0] for message in client.get_received()
+                     if message['name'] == 'mmv1_suggestion']
+    client.disconnect()
+    return messages
+
+
+def test_greedy_mode_streams(server):
+    room_id = make_room(server[2], 'rolev2')
+    messages = suggestions(server, room_id)
+    assert all(message['success'] for message in messages)
+    assert len(messages) >= 2
+    scores = [message['score'] for message in messages[:-1]]
+    assert scores == sorted(scores)
+    assert messages[-1]['score'] == scores[-1]
+    assert room_id not in server[2].STREAMING
+
+
+@pytest.mark.parametrize('mode', ['friend', 'role-anneal'])
+def test_other_modes_run_as_a_job(server, mode):
+    endpoints = server[2]
+    room_id = make_room(endpoints, mode)
+    messages = suggestions(server, room_id)
+    assert len(messages) == 1
+    assert messages[0]['success']
+    assert sorted(messages[0]['team1'] + messages[0]['team2']) == PLAYERS
+    # the job is the one the room page asks for, so its result is cached
+    info = endpoints.DB.get_room_info(room_id)
+    result = endpoints.SUGGESTIONS.get(endpoints.suggestion_key(
+        info, endpoints.ROOM_ALTERNATIVES, True))
+    assert result['alternatives'][0]['score'] == messages[0]['score']
+
+
+def test_failure_ends_the_stream(server, monkeypatch):
+    endpoints = server[2]
+    room_id = make_room(endpoints, 'friend')
+    monkeypatch.setattr(endpoints, 'room_suggestion', lambda *args: None)
+    messages = suggestions(server, room_id)
+    assert messages == [{'success': False, 'done': True,
+                         'reason': 'Could not make teams'}]
+    assert room_id not in endpoints.STREAMING
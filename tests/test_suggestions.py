@@ -0,0 +1,75 @@
+# the matchers collect their best suggestions, keeping them apart
+import random
+
+import pytest
+
+from mmserver.apps.mmv1.teammaker import (FriendMatcher, RoleMatcherV2,
+                                          RoleMatcherV2Anneal)
+from mmserver.apps.mmv1.teammaker.base import Matcher, TopSuggestions
+
+
+def top(k=3, min_diff=2):
+    return TopSuggestions(k, min_diff, Matcher().distance)
+
+
+def split(*team1):
+    return (list(team1), [i for i in range(10) if i not in team1])
+
+
+def test_keeps_the_k_best():
+    suggestions = top(k=2)
+    assert suggestions.offer(split(0, 1, 2, 3, 4), 1.0)
+    assert suggestions.offer(split(0, 1, 2, 5, 6), 3.0)
+    assert suggestions.threshold() == 1.0
+    assert not suggestions.offer(split(0, 1, 7, 8, 9), 0.5)
+    assert suggestions.offer(split(0, 1, 7, 8, 9), 2.0)
+    assert [score for _, score in suggestions.results()] == [3.0, 2.0]
+
+
+def test_close_suggestions_keep_the_best():
+    suggestions = top()
+    assert suggestions.offer(split(0, 1, 2, 3, 4), 1.0)
+    # one player swapped, or the same teams the other way round
+    assert not suggestions.offer(split(0, 1, 2, 3, 5), 0.5)
+    assert not suggestions.offer(split(5, 6, 7, 8, 9), 0.5)
+    assert suggestions.offer(split(0, 1, 2, 3, 5), 2.0)
+    assert suggestions.results() == [(split(0, 1, 2, 3, 5), 2.0)]
+
+
+def test_merge():
+    suggestions, other = top(), top()
+    suggestions.offer(split(0, 1, 2, 3, 4), 1.0)
+    other.offer(split(0, 1, 2, 3, 5), 2.0)
+    other.offer(split(0, 1, 7, 8, 9), 0.5)
+    suggestions.merge(other)
+    assert suggestions.results() == [(split(0, 1, 2, 3, 5), 2.0),
+                                     (split(0, 1, 7, 8, 9), 0.5)]
+
+
+def random_responses(matcher_cls, seed):
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(10):
+        response = {role: str(rng.randint(0, 9))
+                    for role in ('top', 'jg', 'mid', 'adc', 'sup')}
+        response.update({str(i): rng.randint(0, 5) for i in range(10)})
+        response.update({f'rate{i}': rng.choice(['worse', 'better'])
+                         for i in range(9)})
+        responses.append(matcher_cls.read_response(response))
+    return responses
+
+
+@pytest.mark.parametrize('matcher_cls', [FriendMatcher, RoleMatcherV2,
+                                         RoleMatcherV2Anneal])
+def test_matchers_suggest_different_teams(matcher_cls):
+    matcher = matcher_cls(top_k=4)
+    teams, _ = matcher.generate_teams(random_responses(matcher_cls, 0))
+    results = matcher.suggestions.results()
+    assert len(results) == 4
+    # the teams given are the best suggestion
+    assert matcher.distance(results[0][0], teams) == 0
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    for i, (a, _) in enumerate(results):
+        for b, _ in results[i + 1:]:
+            assert matcher.distance(a, b) >= matcher.min_diff
@@ -0,0 +1,67 @@
+# the teammaker command writes one result for every lobby, in order
+import io
+import json
+import random
+import subprocess
+import sys
+
+from mmserver.apps.mmv1.teammaker.__main__ import run
+
+
+def friend_lobby(n_players, seed):
+    rng = random.Random(seed)
+    return {'mode': 'friend' if n_players == 10 else 'friend-multi',
+            'prefs': [[rng.randint(0, 5) for _ in range(n_players)]
+                      for _ in range(n_players)]}
+
+
+def results(lines, **kwargs):
+    outfile = io.StringIO()
+    run(io.StringIO(''.join(lines)), outfile, **kwargs)
+    return [json.loads(line) for line in outfile.getvalue().splitlines()]
+
+
+def test_one_result_per_line_in_order():
+    lobbies = [friend_lobby(10, seed) for seed in range(9)]
+    lines = [json.dumps(lobby) + '\n' for lobby in lobbies]
+    # a blank line, a line that is not json and an unknown mode in between
+    lines[2:2] = ['\n', 'not json\n', json.dumps({'mode': 'nope',
+                                                  'prefs': []}) + '\n']
+    out = results(lines, workers=2, chunk_size=2, window=1)
+    assert len(out) == len(lines)
+    assert out[2] == {'error': 'Empty line'}
+    assert out[3]['error'].startswith('JSONDecodeError')
+    assert out[4]['error'].startswith('KeyError')
+    for line, result in zip(lines, out):
+        if 'error' in result:
+            continue
+        prefs = json.loads(line)['prefs']
+        # the teams are those of that line's lobby
+        happiness = sorted(sum(prefs[i][j] for i in team for j in team)
+                           for team in (result['team1'], result['team2']))
+        assert happiness == sorted(result['components']['happiness'])
+
+
+def test_multi_game_lobby_and_explain():
+    out = results([json.dumps(friend_lobby(20, 0)) + '\n'], workers=1,
+                  explain=True)
+    games = out[0]['games']
+    assert len(games) == 2
+    assert sorted(p for game in games
+                  for p in game['team1'] + game['team2']) == list(range(20))
+    assert out[0]['facts'].startswith('Game 1')
+
+
+def test_command(tmp_path):
+    infile = tmp_path / 'lobbies.jsonl'
+    outfile = tmp_path / 'teams.jsonl'
+    infile.write_text(json.dumps(friend_lobby(10, 0)) + '\n\n')
+    subprocess.run([sys.executable, '-m', 'mmserver.apps.mmv1.teammaker',
+                    str(infile), '-o', str(outfile), '-w', '1'],
+                   check=True, cwd=tmp_path,
+                   env={'PYTHONPATH': ':'.join(sys.path)})
+    out = [json.loads(line) for line in outfile.read_text().splitlines()]
+    assert len(out) == 2 and 'team1' in out[0]
+    # nothing but the output is written
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['lobbies.jsonl',
+                                                          'teams.jsonl']
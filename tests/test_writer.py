@@ -0,0 +1,133 @@
+# GroupWriter writes a burst of changes once, and keeps the rooms other
+# processes wrote to a shared dump
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from mmserver.apps import writer
+from mmserver.apps.writer import GroupWriter
+
+
+@pytest.fixture
+def tasks(monkeypatch):
+    # background tasks are kept to be run by the test, as if by the server
+    started = []
+    monkeypatch.setattr(writer, 'socketio', SimpleNamespace(
+        server=object(), async_mode=None, sleep=lambda seconds: None,
+        start_background_task=started.append))
+    return started
+
+
+class Rooms:
+    # the rooms of one process, counting the dumps made of them
+
+    def __init__(self, fname, shared=False, **kwargs):
+        self.rooms = {}
+        self.dumps = 0
+        self.writes = []
+        self.writer = GroupWriter(
+            fname, self.dump, sorted, on_write=self.writes.append,
+            room=self.rooms.get if shared else None, **kwargs)
+
+    def dump(self):
+        self.dumps += 1
+        return dict(self.rooms)
+
+    def change(self, room_id, room):
+        if room is None:
+            self.rooms.pop(room_id, None)
+        else:
+            self.rooms[room_id] = room
+        self.writer.put([room_id])
+
+
+def read(fname):
+    with open(fname) as f:
+        return json.load(f)
+
+
+def test_burst_is_written_once(tmp_path, tasks):
+    fname = str(tmp_path / 'dump.json')
+    rooms = Rooms(fname)
+    for i in range(5):
+        rooms.change(f'r{i}', {'n': i})
+    assert len(tasks) == 1
+    assert not (tmp_path / 'dump.json').exists()
+    tasks.pop()()
+    assert rooms.dumps == 1 and len(rooms.writes) == 1
+    assert read(fname) == [rooms.rooms, sorted(rooms.rooms)]
+    # the next change starts another window
+    rooms.change('r0', None)
+    assert len(tasks) == 1
+
+
+def test_sync_writes_every_change(tmp_path, tasks):
+    fname = str(tmp_path / 'dump.json')
+    rooms = Rooms(fname, durability='sync')
+    rooms.change('a', {'n': 1})
+    assert read(fname)[0] == {'a': {'n': 1}}
+    rooms.change('a', None)
+    assert read(fname)[0] == {}
+    assert tasks == [] and rooms.dumps == 2
+
+
+def test_flush_writes_what_is_waiting(tmp_path, tasks):
+    fname = str(tmp_path / 'dump.json')
+    rooms = Rooms(fname)
+    rooms.change('a', {'n': 1})
+    rooms.change('b', {'n': 2})
+    rooms.writer.flush()
+    assert read(fname)[0] == {'a': {'n': 1}, 'b': {'n': 2}}
+    # nothing is left for the window to write
+    tasks.pop()()
+    assert rooms.dumps == 1
+
+
+def test_shared_dump_keeps_the_other_rooms(tmp_path, tasks):
+    fname = str(tmp_path / 'dump.json')
+    a = Rooms(fname, shared=True, durability='sync')
+    b = Rooms(fname, shared=True, durability='sync')
+    a.change('a1', {'n': 1})
+    b.change('b1', {'n': 2})
+    a.change('a2', {'n': 3})
+    b.change('a1', None)
+    assert read(fname)[0] == {'b1': {'n': 2}, 'a2': {'n': 3}}
+    # only the rooms changed were asked for, the others were read back
+    assert a.dumps == b.dumps == 0
+    # a's first write was its own, every other one took in the other's
+    assert len(a.writes) == 1 and len(b.writes) == 0
+
+
+def test_failed_write_is_tried_again(tmp_path, tasks, monkeypatch):
+    fname = str(tmp_path / 'dump.json')
+    rooms = Rooms(fname)
+    rooms.change('a', {'n': 1})
+    replace = writer.GroupWriter.replace
+
+    def fail(self, rooms):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(writer.GroupWriter, 'replace', fail)
+    tasks.pop()()
+    assert rooms.writer.changed() == {'a'}
+    assert len(tasks) == 1
+    monkeypatch.setattr(writer.GroupWriter, 'replace', replace)
+    tasks.pop()()
+    assert read(fname)[0] == {'a': {'n': 1}}
+    assert rooms.writer.changed() == set()
+
+
+def test_without_a_server_changes_are_written_at_once(tmp_path,
+                                                      monkeypatch):
+    monkeypatch.setattr(writer.socketio, 'server', None)
+    fname = str(tmp_path / 'dump.json')
+    rooms = Rooms(fname)
+    rooms.change('a', {'n': 1})
+    assert read(fname)[0] == {'a': {'n': 1}}
+
+
+def test_unknown_durability(tmp_path):
+    with pytest.raises(ValueError):
+        GroupWriter(str(tmp_path / 'dump.json'), dict, sorted,
+                    durability='never')